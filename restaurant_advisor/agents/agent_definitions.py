@@ -1,12 +1,19 @@
-from typing import Dict, List, Any, Optional, Tuple, Literal
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple, Literal
+import asyncio
+import copy
+from concurrent.futures import Executor
 import os
+import re
+import threading
+import numpy as np
 from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 import google.generativeai as genai
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 from utils.config import GEMINI_API_KEY, MONGODB_URI, MONGODB_DB_NAME
+from utils.llm_cache import LLMResponseCache, SemanticResponseCache
 
 # Import new external agents
 from agents.market_research_agent import MarketResearchAgent
@@ -45,6 +52,11 @@ class BaseAgent:
     def run(self, query: str, **kwargs):
         """Run the agent with the given query."""
         raise NotImplementedError("Subclasses must implement run()")
+    
+    async def astream_prompt(self, prompt_value) -> AsyncIterator[str]:
+        """Stream the parsed response to a rendered prompt as it is generated."""
+        async for chunk in (self.model | self.parser).astream(prompt_value):
+            yield chunk
 
 class LocationRecommenderAgent(BaseAgent):
     """Agent for recommending restaurant locations based on user preferences."""
@@ -57,20 +69,7 @@ class LocationRecommenderAgent(BaseAgent):
             and their commercial real estate. Your task is to recommend the best areas within a city for 
             a new restaurant based on the provided information.
 
-            User information:
-            - Restaurant concept: {concept}
-            - Target cuisine: {cuisine}
-            - Target demographic: {demographic}
-            - Budget constraints: {budget}
-            - City: {city}
-
-            Context from knowledge base:
-            {kb_context}
-
-            Knowledge graph insights:
-            {kg_insights}
-
-            Analyze the information and recommend the top 3 locations within {city} for this restaurant. 
+            Analyze the information below and recommend the top 3 locations within the city for this restaurant. 
             For each location, provide:
             1. Area name
             2. Why it's suitable (foot traffic, demographics match, etc.)
@@ -79,13 +78,26 @@ class LocationRecommenderAgent(BaseAgent):
             5. Regulatory considerations
 
             Provide a structured response with clear recommendations and reasoning.
+
+            Context from knowledge base:
+            {kb_context}
+
+            Knowledge graph insights:
+            {kg_insights}
+
+            User information:
+            - Restaurant concept: {concept}
+            - Target cuisine: {cuisine}
+            - Target demographic: {demographic}
+            - Budget constraints: {budget}
+            - City: {city}
             """,
             input_variables=["concept", "cuisine", "demographic", "budget", "city", "kb_context", "kg_insights"]
         )
     
-    def run(self, query: Dict[str, Any], kb_context: str, kg_insights: str):
-        """Run the location recommender agent."""
-        prompt_value = self.prompt.format(
+    def _format_prompt(self, query: Dict[str, Any], kb_context: str, kg_insights: str) -> str:
+        """Render the location recommender prompt."""
+        return self.prompt.format(
             concept=query.get("concept", ""),
             cuisine=query.get("cuisine", ""),
             demographic=query.get("demographic", ""),
@@ -94,9 +106,18 @@ class LocationRecommenderAgent(BaseAgent):
             kb_context=kb_context,
             kg_insights=kg_insights
         )
+    
+    def run(self, query: Dict[str, Any], kb_context: str, kg_insights: str):
+        """Run the location recommender agent."""
+        prompt_value = self._format_prompt(query, kb_context, kg_insights)
         
         response = self.model.invoke(prompt_value)
         return self.parser.invoke(response)
+    
+    async def astream(self, query: Dict[str, Any], kb_context: str, kg_insights: str) -> AsyncIterator[str]:
+        """Run the location recommender agent, yielding the response as it is generated."""
+        async for chunk in self.astream_prompt(self._format_prompt(query, kb_context, kg_insights)):
+            yield chunk
 
 class RegulatoryAdvisorAgent(BaseAgent):
     """Agent for providing regulatory advice for restaurant setup."""
@@ -108,17 +129,6 @@ class RegulatoryAdvisorAgent(BaseAgent):
             template="""You are a regulatory expert specializing in Indian restaurant licensing and permits.
             Based on the provided information, provide detailed guidance on regulatory requirements.
 
-            City: {city}
-            Restaurant type: {restaurant_type}
-            Alcohol service: {serves_alcohol}
-            Seating capacity: {seating_capacity}
-
-            Regulatory information from knowledge base:
-            {kb_context}
-
-            Knowledge graph insights:
-            {kg_insights}
-
             Please provide:
             1. Required licenses and permits
             2. Application processes and typical timelines
@@ -127,13 +137,24 @@ class RegulatoryAdvisorAgent(BaseAgent):
             5. Ongoing regulatory requirements
 
             Your response should be comprehensive and practical, focusing on actionable steps.
+
+            Regulatory information from knowledge base:
+            {kb_context}
+
+            Knowledge graph insights:
+            {kg_insights}
+
+            City: {city}
+            Restaurant type: {restaurant_type}
+            Alcohol service: {serves_alcohol}
+            Seating capacity: {seating_capacity}
             """,
             input_variables=["city", "restaurant_type", "serves_alcohol", "seating_capacity", "kb_context", "kg_insights"]
         )
     
-    def run(self, query: Dict[str, Any], kb_context: str, kg_insights: str):
-        """Run the regulatory advisor agent."""
-        prompt_value = self.prompt.format(
+    def _format_prompt(self, query: Dict[str, Any], kb_context: str, kg_insights: str) -> str:
+        """Render the regulatory advisor prompt."""
+        return self.prompt.format(
             city=query.get("city", ""),
             restaurant_type=query.get("restaurant_type", ""),
             serves_alcohol=query.get("serves_alcohol", "No"),
@@ -141,9 +162,18 @@ class RegulatoryAdvisorAgent(BaseAgent):
             kb_context=kb_context,
             kg_insights=kg_insights
         )
+    
+    def run(self, query: Dict[str, Any], kb_context: str, kg_insights: str):
+        """Run the regulatory advisor agent."""
+        prompt_value = self._format_prompt(query, kb_context, kg_insights)
         
         response = self.model.invoke(prompt_value)
         return self.parser.invoke(response)
+    
+    async def astream(self, query: Dict[str, Any], kb_context: str, kg_insights: str) -> AsyncIterator[str]:
+        """Run the regulatory advisor agent, yielding the response as it is generated."""
+        async for chunk in self.astream_prompt(self._format_prompt(query, kb_context, kg_insights)):
+            yield chunk
 
 class MarketAnalysisAgent(BaseAgent):
     """Agent for analyzing market potential and competition for restaurant concepts."""
@@ -156,18 +186,6 @@ class MarketAnalysisAgent(BaseAgent):
             template="""You are a restaurant market analyst with expertise in Indian food markets and consumer preferences.
             Analyze the market potential for the given restaurant concept based on the provided information.
 
-            Restaurant concept: {concept}
-            Cuisine type: {cuisine}
-            Target city: {city}
-            Target area: {area}
-            Target demographic: {demographic}
-
-            Market information from knowledge base:
-            {kb_context}
-
-            Knowledge graph insights:
-            {kg_insights}
-
             Please provide a JSON response with the following structure:
             ```json
             {
@@ -196,6 +214,18 @@ class MarketAnalysisAgent(BaseAgent):
             ```
             
             Ensure your analysis is data-driven and specific to the Indian market context.
+
+            Market information from knowledge base:
+            {kb_context}
+
+            Knowledge graph insights:
+            {kg_insights}
+
+            Restaurant concept: {concept}
+            Cuisine type: {cuisine}
+            Target city: {city}
+            Target area: {area}
+            Target demographic: {demographic}
             """,
             input_variables=["concept", "cuisine", "city", "area", "demographic", "kb_context", "kg_insights"]
         )
@@ -259,14 +289,13 @@ class BasicQueryAgent(BaseAgent):
             template="""You are an assistant for restaurant entrepreneurs looking to expand in India.
             Answer the user's question based on the provided information, but keep in mind
             you have limited access to detailed data.
-
-            User question: {query}
+            Provide a helpful response based only on the information below. If you cannot answer
+            fully due to access limitations, explain what additional access would be needed.
 
             Basic information available:
             {kb_context}
 
-            Provide a helpful response based only on this information. If you cannot answer
-            fully due to access limitations, explain what additional access would be needed.
+            User question: {query}
             """,
             input_variables=["query", "kb_context"]
         )
@@ -280,6 +309,51 @@ class BasicQueryAgent(BaseAgent):
         
         response = self.model.invoke(prompt_value)
         return self.parser.invoke(response)
+    
+    async def astream(self, query: str, kb_context: str) -> AsyncIterator[str]:
+        """Run the basic query agent, yielding the response as it is generated."""
+        async for chunk in self.astream_prompt(self.prompt.format(query=query, kb_context=kb_context)):
+            yield chunk
+
+class ConversationSummarizerAgent(BaseAgent):
+    """Agent for compressing older conversation turns into a short running summary."""
+    
+    def __init__(self, model_name: str = "gemini-flash-latest"):
+        super().__init__(model_name)
+        
+        self.prompt = PromptTemplate(
+            template="""You maintain a running summary of a conversation between a restaurant entrepreneur
+            and an advisor on expanding in India. Update the summary with the new turns below.
+            Keep the cities, cuisines, budgets, locations and decisions discussed, and any open questions.
+            Drop pleasantries and repetition. Reply with the updated summary only, in at most 150 words.
+
+            Summary so far:
+            {summary}
+
+            New turns:
+            {transcript}
+            """,
+            input_variables=["summary", "transcript"]
+        )
+    
+    def run(self, summary: str, messages: List[BaseMessage]) -> str:
+        """Fold a run of older messages into the running summary.
+        
+        Args:
+            summary: Summary of the turns before these messages (empty if none)
+            messages: Messages to fold into the summary, oldest first
+            
+        Returns:
+            The updated summary
+        """
+        transcript = "\n".join(
+            f"{'User' if isinstance(message, HumanMessage) else 'Advisor'}: {message.content}"
+            for message in messages
+        )
+        prompt_value = self.prompt.format(summary=summary or "(none)", transcript=transcript)
+        
+        response = self.model.invoke(prompt_value)
+        return self.parser.invoke(response).strip()
 
 class PDFResearchAgent(BaseAgent):
     """Agent for answering queries based on PDF research documents."""
@@ -315,8 +389,8 @@ class PDFResearchAgent(BaseAgent):
             input_variables=["query", "pdf_insights", "kg_context"]
         )
     
-    def run(self, query: str, kg_context: str):
-        """Run the PDF research agent."""
+    def _format_prompt(self, query: str, kg_context: str) -> str:
+        """Gather PDF insights for the query and render the research prompt."""
         # Initialize PDF agent lazily on first use to avoid circular imports
         if not self._pdf_agent_initialized:
             try:
@@ -342,23 +416,297 @@ class PDFResearchAgent(BaseAgent):
             pdf_insights = f"Could not retrieve PDF insights: {str(e)}"
             
         # Then format the final prompt
-        prompt_value = self.prompt.format(
+        return self.prompt.format(
             query=query,
             pdf_insights=pdf_insights,
             kg_context=kg_context
         )
+    
+    def run(self, query: str, kg_context: str):
+        """Run the PDF research agent."""
+        prompt_value = self._format_prompt(query, kg_context)
         
         # Generate the response
         response = self.model.invoke(prompt_value)
         return self.parser.invoke(response)
+    
+    async def astream(self, query: str, kg_context: str) -> AsyncIterator[str]:
+        """Run the PDF research agent, yielding the response as it is generated."""
+        # Gathering PDF insights is a blocking LLM call of its own, so keep it off the event loop
+        prompt_value = await asyncio.to_thread(self._format_prompt, query, kg_context)
+        async for chunk in self.astream_prompt(prompt_value):
+            yield chunk
+
+# Cities the router recognises in a query
+ROUTING_CITIES = ("mumbai", "delhi", "bangalore", "hyderabad", "kolkata", "chennai", "pune", "ahmedabad", "jaipur", "lucknow")
+
+# Cuisines the fast router extracts as the cuisine parameter
+ROUTING_CUISINES = (
+    "south indian", "north indian", "middle eastern", "italian", "chinese", "mexican", "thai",
+    "japanese", "french", "mediterranean", "american", "punjabi", "bengali", "gujarati", "indian"
+)
+
+# Localities the fast router extracts as the area (or real estate locality) parameter, and the
+# city each one is in, used when the query names the locality but not the city
+ROUTING_AREAS = {
+    "Bandra": "Mumbai", "Andheri": "Mumbai", "South Mumbai": "Mumbai", "Navi Mumbai": "Mumbai", "Worli": "Mumbai",
+    "Koramangala": "Bangalore", "Indiranagar": "Bangalore", "Whitefield": "Bangalore",
+    "Electronic City": "Bangalore", "MG Road": "Bangalore",
+    "Connaught Place": "Delhi", "Khan Market": "Delhi", "Hauz Khas": "Delhi", "South Extension": "Delhi", "Saket": "Delhi"
+}
+
+# Restaurant formats the fast router extracts, and the restaurant_type value each one maps to
+ROUTING_RESTAURANT_TYPES = {
+    "fine dining": "fine_dining", "casual dining": "casual_dining", "quick service": "qsr", "qsr": "qsr",
+    "cloud kitchen": "cloud_kitchen", "food truck": "food_truck", "cafe": "cafe", "bakery": "bakery",
+    "bar": "bar", "pub": "bar"
+}
+
+# Parameter each agent takes a restaurant format as: a concept description or a restaurant_type value
+ROUTING_FORMAT_PARAMETERS = {
+    "location_recommender": "concept",
+    "market_analysis": "concept",
+    "regulatory_advisor": "restaurant_type",
+    "real_estate": "restaurant_type",
+    "demographics": "restaurant_type",
+}
+
+# Parameter each agent takes a locality as
+ROUTING_AREA_PARAMETERS = {
+    "market_analysis": "area",
+    "real_estate": "locality",
+}
+
+# Whole-word intent keywords that unambiguously select an agent. The external agents come
+# first: at any position the alternation takes the earliest group that matches, so a phrase
+# like "consumer surveys" or "market size" is read as theirs rather than as the generic
+# "surveys" or "market" of a later group
+FAST_ROUTE_KEYWORDS = {
+    "consumer_survey": r"consumer (?:surveys?|preferences?|behaviou?r|sentiment)|dining frequency|dietary (?:preferences?|trends?)",
+    "real_estate": r"real estate|rents?|rental\w*|leas(?:e|es|ing)|foot traffic|commercial (?:space|property|properties)",
+    "demographics": r"demographics?|population|income levels?|purchasing power|per capita",
+    "market_research": r"market research|market size|industry news|latest news|growth (?:rates?|statistics|stats)",
+    "regulatory_advisor": r"regulat\w*|licen[cs]\w*|permits?|compliance|legal\w*|fssai|noc",
+    "location_recommender": r"locations?|locate|sites?|best areas?|neighbou?rhoods?|where (?:should|to|can)",
+    "market_analysis": r"markets?|competition|competitors?|saturat\w*|demand|trends?",
+    "pdf_research": r"research|reports?|stud(?:y|ies)|surveys?|papers?|findings",
+}
+
+class FastRouter:
+    """Keyword classifier that routes clear-cut queries without an LLM call.
+    
+    All agents' keywords are compiled into one alternation with a named group per
+    agent, so a query is classified in a single regex pass. A query is routed only
+    when exactly one agent's keywords match; anything else is left to the LLM router.
+    """
+    
+    _intent_pattern = re.compile("|".join(
+        rf"(?P<{agent}>\b(?:{keywords})\b)" for agent, keywords in FAST_ROUTE_KEYWORDS.items()
+    ))
+    _city_pattern = re.compile(rf"\b({'|'.join(ROUTING_CITIES)})\b")
+    _cuisine_pattern = re.compile(rf"\b({'|'.join(ROUTING_CUISINES)})\b")
+    _area_names = {area.lower(): area for area in ROUTING_AREAS}
+    _area_pattern = re.compile(rf"\b({'|'.join(_area_names)})\b")
+    _restaurant_type_pattern = re.compile(rf"\b({'|'.join(ROUTING_RESTAURANT_TYPES)})s?\b")
+    _alcohol_pattern = re.compile(r"\b(?:alcohol\w*|liquor|bars?|pubs?|beers?|wines?|cocktails?|brewer(?:y|ies))\b")
+    
+    def classify(self, query: str) -> Optional[Dict[str, Any]]:
+        """Route a query by its keywords.
+        
+        Args:
+            query: The user query
+            
+        Returns:
+            A routing result shaped like RoutingAgent.run's, or None when the query
+            matches no agent or more than one
+        """
+        query_lower = query.lower()
+        agents = {match.lastgroup for match in self._intent_pattern.finditer(query_lower)}
+        if len(agents) != 1:
+            return None
+        agent = agents.pop()
+        
+        return {
+            "agent": agent,
+            "agents": [(agent, 1.0)],
+            "parameters": self.extract_parameters(query_lower, agent),
+            "reasoning": "Matched intent keywords"
+        }
+    
+    @classmethod
+    def extract_parameters(cls, query_lower: str, agent: Optional[str] = None) -> Dict[str, str]:
+        """Pick the first known city and cuisine, and the agent's other parameters, out of a lowercased query.
+        
+        A query naming a known area but no city gets the area's city, as the LLM router would infer.
+        
+        Args:
+            query_lower: The lowercased query
+            agent: Agent the query is routed to; the restaurant format, area, alcohol service
+                and research topic its prompt and KB query take are extracted as the LLM
+                router would. None extracts only the city and cuisine
+                
+        Returns:
+            The parameters found in the query
+        """
+        parameters = {}
+        city_match = cls._city_pattern.search(query_lower)
+        area_match = cls._area_pattern.search(query_lower)
+        area = cls._area_names[area_match.group(1)] if area_match else None
+        if city_match:
+            parameters["city"] = city_match.group(1).title()
+        elif area:
+            parameters["city"] = ROUTING_AREAS[area]
+        cuisine_match = cls._cuisine_pattern.search(query_lower)
+        if cuisine_match:
+            parameters["cuisine"] = cuisine_match.group(1).title()
+        if agent is None:
+            return parameters
+        
+        format_parameter = ROUTING_FORMAT_PARAMETERS.get(agent)
+        format_match = cls._restaurant_type_pattern.search(query_lower) if format_parameter else None
+        if format_match:
+            restaurant_format = format_match.group(1)
+            if format_parameter == "restaurant_type":
+                restaurant_format = ROUTING_RESTAURANT_TYPES[restaurant_format]
+            parameters[format_parameter] = restaurant_format
+        area_parameter = ROUTING_AREA_PARAMETERS.get(agent)
+        if area_parameter and area:
+            parameters[area_parameter] = area
+        if agent == "regulatory_advisor" and cls._alcohol_pattern.search(query_lower):
+            parameters["serves_alcohol"] = "Yes"
+        if agent == "pdf_research":
+            parameters["research_topic"] = query_lower.strip(" ?.!")
+        return parameters
+
+# Example queries per routable agent; queries close enough to one agent's examples are routed
+# without an LLM call. Every agent the router can pick needs examples here, or its queries may
+# clear the similarity threshold against another agent's centroid
+ROUTING_EXEMPLARS = {
+    "location_recommender": (
+        "Where should I open a cafe in Bangalore?",
+        "Which neighbourhood is best for a fine dining restaurant?",
+        "Suggest good areas for a quick service restaurant near offices",
+        "Is Bandra a good place for a new restaurant?",
+    ),
+    "regulatory_advisor": (
+        "What licenses do I need to open a restaurant?",
+        "How do I get an FSSAI registration?",
+        "Do I need a permit to serve alcohol?",
+        "What fire and health approvals does a restaurant need?",
+    ),
+    "market_analysis": (
+        "Is there demand for a Korean restaurant in Pune?",
+        "How competitive is the cafe market in Hyderabad?",
+        "Which dining trends are growing among young professionals?",
+        "What price point should a mid-range restaurant target?",
+    ),
+    "pdf_research": (
+        "What do industry reports say about cloud kitchens?",
+        "Summarize studies on food delivery adoption in India",
+        "What did the restaurant industry survey find?",
+    ),
+    "domain_specialist": (
+        "How should I price my menu to keep food costs under 30 percent?",
+        "How many staff does a 60-seat restaurant need?",
+        "How do I market a new restaurant on Instagram?",
+        "Which POS system works best for a small restaurant?",
+        "How should I design the interior of a casual dining restaurant?",
+    ),
+    "consumer_survey": (
+        "What do consumer surveys say about dining out in Pune?",
+        "How often do people in Mumbai order food delivery?",
+        "Are diners in Bangalore moving towards vegan options?",
+    ),
+    "real_estate": (
+        "What are commercial rents like in Bandra?",
+        "How much foot traffic does Koramangala get?",
+        "Is leasing a space in Connaught Place viable for a cafe?",
+    ),
+    "demographics": (
+        "What is the population and income level of Hyderabad?",
+        "How much purchasing power do households in Pune have?",
+        "Which age groups make up Chennai's population?",
+    ),
+    "market_research": (
+        "What is the latest restaurant industry news in India?",
+        "How big is the Indian food service market?",
+        "What is the growth rate of cloud kitchens in India?",
+    ),
+    "basic_query": (
+        "Hello, what can you help me with?",
+        "What is a cloud kitchen?",
+        "Thanks for the help",
+    ),
+}
+
+class CentroidRouter:
+    """Embedding classifier that routes queries resembling an agent's example queries.
+    
+    Each agent is represented by the normalized mean embedding of its ROUTING_EXEMPLARS.
+    A query is routed to the closest agent only when the similarity clears `threshold`
+    and beats the runner-up by `margin`; anything else is left to the LLM router.
+    """
+    
+    def __init__(self, embed: Callable[[str], np.ndarray], threshold: float = 0.55, margin: float = 0.05):
+        """Initialize the router.
+        
+        Args:
+            embed: Function embedding and L2-normalizing a text
+            threshold: Minimum cosine similarity between a query and an agent centroid
+            margin: Minimum lead of the best agent's similarity over the runner-up's
+        """
+        self._embed = embed
+        self.threshold = threshold
+        self.margin = margin
+        self._agents = tuple(ROUTING_EXEMPLARS)
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+    
+    def _agent_centroids(self) -> np.ndarray:
+        """The (agents, dimensions) centroid matrix, embedded on first use so the encoder loads lazily."""
+        with self._lock:
+            if self._centroids is None:
+                rows = []
+                for agent in self._agents:
+                    centroid = np.mean([self._embed(text.lower()) for text in ROUTING_EXEMPLARS[agent]], axis=0)
+                    rows.append(centroid / np.linalg.norm(centroid))
+                self._centroids = np.vstack(rows).astype(np.float32)
+            return self._centroids
+    
+    def classify(self, query_vector: np.ndarray, query_lower: str) -> Optional[Dict[str, Any]]:
+        """Route a query by its embedding.
+        
+        Args:
+            query_vector: The normalized embedding of the lowercased query
+            query_lower: The lowercased query, for parameter extraction
+            
+        Returns:
+            A routing result shaped like RoutingAgent.run's, or None when no agent is a clear match
+        """
+        similarities = self._agent_centroids() @ query_vector
+        runner_up, best = np.argsort(similarities)[-2:]
+        if similarities[best] < self.threshold or similarities[best] - similarities[runner_up] < self.margin:
+            return None
+        agent = self._agents[best]
+        
+        return {
+            "agent": agent,
+            "agents": [(agent, 1.0)],
+            "parameters": FastRouter.extract_parameters(query_lower, agent),
+            "reasoning": "Closest to the agent's example queries"
+        }
 
 class RoutingAgent(BaseAgent):
     """Agent for routing queries to specialized agents."""
     
-    def __init__(self, model_name: str = "gemini-pro-latest"):
+    def __init__(self, model_name: str = "gemini-pro-latest", fast_routing: bool = True,
+                 semantic_routing: bool = True, centroid_routing: bool = True):
         super().__init__(model_name)
         self.parser = JsonOutputParser()
         
+        # Clear-cut queries are routed by keyword, skipping the LLM call entirely
+        self.fast_router = FastRouter() if fast_routing else None
+        
         self.prompt = PromptTemplate(
             template="""You are a query classifier for a restaurant advisory system in India. 
             Analyze the user query and determine which specialized agent should handle it.
@@ -368,130 +716,199 @@ class RoutingAgent(BaseAgent):
             - regulatory_advisor: Licenses, permits, legal compliance, regulations
             - market_analysis: Market potential, competition, trends, demographics
             - pdf_research: Research findings, reports, studies about restaurants
+            - consumer_survey: Live consumer preferences, dining frequency, delivery and dietary trends
+            - real_estate: Live rental costs, foot traffic and viability of a specific locality
+            - demographics: Live population, income and purchasing power figures for a city
+            - market_research: Latest industry news, market size and growth statistics
             - basic_query: General questions not fitting above categories
 
             User query: {query}
 
             Return ONLY a JSON object (no markdown, no backticks) with this exact structure:
-            {{"agent": "agent_name", "parameters": {{"city": "value", "cuisine": "value"}}, "reasoning": "brief explanation"}}
+            {{"agents": [{{"agent": "agent_name", "confidence": 0.9}}], "parameters": {{"city": "value", "cuisine": "value"}}, "reasoning": "brief explanation"}}
+
+            List the most suitable agent first with a confidence between 0 and 1. If the query also asks
+            something another agent should answer, list that agent second with its own confidence.
 
             Extract parameters based on agent:
             - location_recommender: concept, cuisine, demographic, budget, city
             - regulatory_advisor: city, restaurant_type, serves_alcohol, seating_capacity
             - market_analysis: concept, cuisine, city, area, demographic
+            - consumer_survey: city, demographic
+            - real_estate: city, locality, restaurant_type
+            - demographics: city, restaurant_type
+            - market_research: city
             For pdf_research queries, try to extract: research_topic, specific_focus, city (if relevant)
 
             If certain parameters are not mentioned in the query, omit them from the JSON.
             """,
             input_variables=["query"]
         )
+        
+        # Routing decisions keyed by the normalized query and the prompt (which lists
+        # the available agents), so repeated questions skip the LLM round trip
+        self.route_cache = LLMResponseCache(maxsize=4096, ttl=3600)
+        
+        # Paraphrases of an earlier question reuse its routing; cached routes are only
+        # shared between queries naming the same city and cuisine
+        self.semantic_route_cache = SemanticResponseCache(threshold=0.95, maxsize=1024) if semantic_routing else None
+        
+        # Queries resembling an agent's examples are routed from the embedding the semantic
+        # cache lookup already computed, so this tier needs the semantic cache
+        self.centroid_router = None
+        if centroid_routing and self.semantic_route_cache is not None:
+            self.centroid_router = CentroidRouter(self.semantic_route_cache.embed)
     
     def run(self, query: str):
         """Run the routing agent to classify the query."""
-        try:
-            # Use the prompt with the real Gemini model
-            prompt_value = self.prompt.format(query=query)
-            response = self.model.invoke(prompt_value)
-            
-            # Extract content depending on response format
-            content = response.content if hasattr(response, "content") else response
-            
-            # Add extra handling for JSON parsing
-            try:
-                import json
-                import re
-                
-                # Find JSON content between triple backticks if present
-                json_match = re.search(r"```json\s*([\s\S]*?)\s*```", content)
-                if json_match:
-                    json_str = json_match.group(1)
-                    result = json.loads(json_str)
-                else:
-                    # Try direct parsing
-                    result = self.parser.invoke(content)
-                
-                # Ensure required fields are present
-                if "agent" not in result:
-                    result["agent"] = "basic_query"
-                if "parameters" not in result:
-                    result["parameters"] = {}
-                if "reasoning" not in result:
-                    result["reasoning"] = "Query processed by routing agent"
-                    
-                # Extract city from query if not provided in parameters
-                if "city" not in result["parameters"]:
-                    query_lower = query.lower()
-                    for city in ["mumbai", "delhi", "bangalore", "hyderabad", "kolkata", "chennai", "pune", "ahmedabad", "jaipur", "lucknow"]:
-                        if city in query_lower:
-                            result["parameters"]["city"] = city.title()
-                            break
-                    
-                return result
+        result, cache_slot = self._cached_route(query)
+        if result is None:
+            result = self._classify(query)
+            self._cache_route(cache_slot, result)
+        return result
+    
+    async def arun(self, query: str, executor: Optional[Executor] = None):
+        """Async run(): the classification awaits the model instead of blocking a thread.
+        
+        Args:
+            query: The user query
+            executor: Executor for the cache lookup, which may embed the query; None uses the loop's default
             
-            except Exception as json_err:
-                print(f"JSON parsing error: {str(json_err)}")
-                raise json_err
+        Returns:
+            The routing result, shaped like run()'s
+        """
+        result, cache_slot = await asyncio.get_running_loop().run_in_executor(executor, self._cached_route, query)
+        if result is None:
+            result = await self._aclassify(query)
+            self._cache_route(cache_slot, result)
+        return result
+    
+    def _cached_route(self, query: str) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[Any, Any, str]]]:
+        """Look the query up in the fast router, the exact and semantic route caches, then the centroid router.
+        
+        Returns:
+            A private copy of the route, or None on a miss, and the cache slot
+            (key, query vector, namespace) a freshly classified route is stored under
+        """
+        if self.fast_router is not None:
+            result = self.fast_router.classify(query)
+            if result is not None:
+                return result, None
+        
+        normalized_query = " ".join(query.lower().split())
+        cache_key = self.route_cache.make_key(self.prompt.format(query=normalized_query))
+        cached_result = self.route_cache.get(cache_key)
+        query_vector = None
+        namespace = ""
+        if cached_result is None and self.semantic_route_cache is not None:
+            namespace = repr(sorted(FastRouter.extract_parameters(normalized_query).items()))
+            cached_result, query_vector = self.semantic_route_cache.lookup(normalized_query, namespace)
+        if cached_result is not None:
+            # Callers fill in parameters in place, so never hand out the cached dict
+            return copy.deepcopy(cached_result), None
+        if query_vector is not None and self.centroid_router is not None:
+            result = self.centroid_router.classify(query_vector, normalized_query)
+            if result is not None:
+                return result, None
+        return None, (cache_key, query_vector, namespace)
+    
+    def _cache_route(self, cache_slot: Tuple[Any, Any, str], result: Dict[str, Any]) -> None:
+        """Remember a freshly classified route in the slot _cached_route missed on; fallbacks are not kept."""
+        if result.get("fallback"):
+            return
+        cache_key, query_vector, namespace = cache_slot
+        self.route_cache.set(cache_key, copy.deepcopy(result))
+        if query_vector is not None:
+            self.semantic_route_cache.add(query_vector, copy.deepcopy(result), namespace)
+    
+    @staticmethod
+    def _ranked_agents(result: Dict[str, Any]) -> List[Tuple[str, float]]:
+        """Normalize the classifier's agent choices into (agent, confidence) pairs, best first."""
+        ranked = []
+        for choice in result.get("agents") or []:
+            if isinstance(choice, dict) and choice.get("agent"):
+                try:
+                    confidence = float(choice.get("confidence", 1.0))
+                except (TypeError, ValueError):
+                    confidence = 1.0
+                ranked.append((choice["agent"], confidence))
         
+        # Accept the older single-agent answer shape as a confident choice
+        if not ranked:
+            ranked.append((result.get("agent") or "basic_query", 1.0))
+        ranked.sort(key=lambda choice: choice[1], reverse=True)
+        return ranked
+    
+    def _classify(self, query: str):
+        """Classify the query with the LLM, falling back to basic_query on errors."""
+        try:
+            # Use the prompt with the real Gemini model
+            response = self.model.invoke(self.prompt.format(query=query))
+            return self._parse_classification(query, response)
         except Exception as e:
-            print(f"Error in routing agent: {str(e)}")
-            # Return default response in case of any error
-            return {
-                "agent": "basic_query",
-                "parameters": {},
-                "reasoning": f"Fallback due to error: {str(e)}"
-            }
-            
-            # Fallback with smart extraction from the query
-            query_lower = query.lower()
+            return self._fallback_route(e)
+    
+    async def _aclassify(self, query: str):
+        """Async _classify()."""
+        try:
+            response = await self.model.ainvoke(self.prompt.format(query=query))
+            return self._parse_classification(query, response)
+        except Exception as e:
+            return self._fallback_route(e)
+    
+    def _parse_classification(self, query: str, response) -> Dict[str, Any]:
+        """Parse the LLM's JSON classification and fill in any missing fields."""
+        # Extract content depending on response format
+        content = response.content if hasattr(response, "content") else response
+        
+        # Add extra handling for JSON parsing
+        try:
+            import json
+            import re
             
-            # Default to basic query
-            agent = "basic_query"
-            parameters = {"query": query}
-            reasoning = "Fallback routing due to parsing error"
+            # Find JSON content between triple backticks if present
+            json_match = re.search(r"```json\s*([\s\S]*?)\s*```", content)
+            if json_match:
+                json_str = json_match.group(1)
+                result = json.loads(json_str)
+            else:
+                # Try direct parsing
+                result = self.parser.invoke(content)
             
-            # Try to extract city from query
-            city = "Chennai"  # Default
-            for potential_city in ["mumbai", "delhi", "bangalore", "hyderabad", "kolkata", "chennai", "pune", "ahmedabad"]:
-                if potential_city in query_lower:
-                    city = potential_city.title()
-                    break
-                    
-            # Try to detect query intent
-            if any(word in query_lower for word in ["where", "location", "area", "place"]):
-                agent = "location_recommender"
-                parameters = {"city": city}
-                reasoning = "Query appears to be about location recommendations"
-                
-            elif any(word in query_lower for word in ["license", "permit", "regulation", "legal", "compliance"]):
-                agent = "regulatory_advisor" 
-                parameters = {"city": city, "restaurant_type": "casual dining"}
-                reasoning = "Query appears to be about regulatory requirements"
+            # Ensure required fields are present
+            result["agents"] = self._ranked_agents(result)
+            result["agent"] = result["agents"][0][0]
+            if "parameters" not in result:
+                result["parameters"] = {}
+            if "reasoning" not in result:
+                result["reasoning"] = "Query processed by routing agent"
                 
-            elif any(word in query_lower for word in ["market", "competition", "trend", "customer", "demographics", "profitable"]):
-                agent = "market_analysis"
-                parameters = {"city": city, "cuisine": "Multi-cuisine"}
-                reasoning = "Query appears to be about market analysis"
-            
-            elif any(word in query_lower for word in ["consumer", "preference", "survey", "dining habit", "behavior"]):
-                agent = "consumer_survey"
-                parameters = {"city": city, "demographic": "all"}
-                reasoning = "Query about consumer preferences and behavior"
-            
-            elif any(word in query_lower for word in ["rent", "real estate", "property", "commercial space", "lease"]):
-                agent = "real_estate"
-                parameters = {"city": city, "locality": "downtown"}
-                reasoning = "Query about real estate and property costs"
-            
-            elif any(word in query_lower for word in ["population", "demographics", "income", "economic", "gdp"]):
-                agent = "demographics"
-                parameters = {"city": city}
-                reasoning = "Query about demographic and economic data"
+            # Extract city from query if not provided in parameters
+            if "city" not in result["parameters"]:
+                query_lower = query.lower()
+                for city in ROUTING_CITIES:
+                    if city in query_lower:
+                        result["parameters"]["city"] = city.title()
+                        break
                 
-            return {
-                "agent": agent,
-                "parameters": parameters,
-                "reasoning": reasoning
-            }
+            return result
+        
+        except Exception as json_err:
+            print(f"JSON parsing error: {str(json_err)}")
+            raise json_err
+    
+    @staticmethod
+    def _fallback_route(error: Exception) -> Dict[str, Any]:
+        """Route to basic_query after a failed classification."""
+        print(f"Error in routing agent: {str(error)}")
+        # Return default response in case of any error
+        return {
+            "agent": "basic_query",
+            "agents": [("basic_query", 1.0)],
+            "parameters": {},
+            "reasoning": f"Fallback due to error: {str(error)}",
+            "fallback": True
+        }
 
 
 # External Data Agent Wrappers
@@ -9,6 +9,7 @@ import logging
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from pathlib import Path
+from functools import cached_property
 import hashlib
 
 from langchain_community.document_loaders import (
@@ -20,7 +21,7 @@ from langchain_community.document_loaders import (
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from pymongo import MongoClient
-from utils.config import MONGODB_URI, MONGODB_DB_NAME
+from utils.config import MONGODB_URI, MONGODB_DB_NAME, MONGODB_CLIENT_OPTIONS
 
 logger = logging.getLogger(__name__)
 
@@ -33,22 +34,9 @@ class DocumentIngestionAgent:
     def __init__(self, docs_directory: str = "docs"):
         self.docs_dir = Path(docs_directory)
         
-        # MongoDB connection
-        self.mongo_client = MongoClient(MONGODB_URI)
-        self.db = self.mongo_client[MONGODB_DB_NAME]
-        self.collection = self.db["documents"]
-        
-        # Create indexes for efficient querying
-        self.collection.create_index("file_hash")
-        self.collection.create_index("file_path")
-        self.collection.create_index([("content", "text")])
-        
-        # Embeddings using SentenceTransformers (all-MiniLM-L6-v2 - fast and efficient)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # MongoDB connection, indexes and the embedding model are created lazily
+        # so metadata-only calls (e.g. get_all_categories) don't pay for them
+        self._indexes_ensured = False
         
         # Text splitter for chunking documents
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -69,6 +57,45 @@ class DocumentIngestionAgent:
             '.json': TextLoader
         }
     
+    @cached_property
+    def mongo_client(self) -> MongoClient:
+        """MongoDB client, opened on first use."""
+        return MongoClient(MONGODB_URI, **MONGODB_CLIENT_OPTIONS)
+    
+    @cached_property
+    def db(self):
+        """MongoDB database handle."""
+        return self.mongo_client[MONGODB_DB_NAME]
+    
+    @cached_property
+    def collection(self):
+        """MongoDB collection holding the ingested document chunks."""
+        return self.db["documents"]
+    
+    @cached_property
+    def fingerprints(self):
+        """MongoDB collection mapping file path to (size, mtime_ns, sha) for hash reuse."""
+        return self.db["file_fingerprints"]
+    
+    @cached_property
+    def embeddings(self) -> HuggingFaceEmbeddings:
+        """Embedding model, loaded on first use."""
+        # Embeddings using SentenceTransformers (all-MiniLM-L6-v2 - fast and efficient)
+        return HuggingFaceEmbeddings(
+            model_name="sentence-transformers/all-MiniLM-L6-v2",
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    
+    def _ensure_indexes(self) -> None:
+        """Create indexes for efficient querying (once per instance)."""
+        if self._indexes_ensured:
+            return
+        self.collection.create_index("file_hash")
+        self.collection.create_index("file_path")
+        self.collection.create_index([("content", "text")])
+        self._indexes_ensured = True
+    
     def _calculate_file_hash(self, file_path: Path) -> str:
         """Calculate SHA256 hash of file for deduplication."""
         sha256_hash = hashlib.sha256()
@@ -77,6 +104,23 @@ class DocumentIngestionAgent:
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
     
+    def _get_file_hash(self, file_path: Path, stat: os.stat_result) -> str:
+        """Get the file hash, reusing the stored one if size and mtime are unchanged."""
+        path_key = str(file_path)
+        fingerprint = self.fingerprints.find_one({"_id": path_key})
+        if (fingerprint
+                and fingerprint.get("size") == stat.st_size
+                and fingerprint.get("mtime_ns") == stat.st_mtime_ns):
+            return fingerprint["sha"]
+        
+        file_hash = self._calculate_file_hash(file_path)
+        self.fingerprints.update_one(
+            {"_id": path_key},
+            {"$set": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha": file_hash}},
+            upsert=True
+        )
+        return file_hash
+    
     def _extract_metadata(self, file_path: Path) -> Dict[str, Any]:
         """Extract metadata from file."""
         stat = file_path.stat()
@@ -87,7 +131,7 @@ class DocumentIngestionAgent:
             "file_extension": file_path.suffix,
             "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
             "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            "file_hash": self._calculate_file_hash(file_path)
+            "file_hash": self._get_file_hash(file_path, stat)
         }
     
     def _load_document(self, file_path: Path) -> List[Any]:
@@ -124,6 +168,7 @@ class DocumentIngestionAgent:
             Ingestion result with statistics
         """
         logger.info(f"Ingesting document: {file_path.name}")
+        self._ensure_indexes()
         
         # Extract metadata
         metadata = self._extract_metadata(file_path)
@@ -150,31 +195,29 @@ class DocumentIngestionAgent:
         chunks = self.text_splitter.split_documents(documents)
         logger.info(f"Split into {len(chunks)} chunks")
         
-        # Create embeddings and store
-        ingested_chunks = []
-        for i, chunk in enumerate(chunks):
-            try:
-                # Generate embedding
-                embedding = self.embeddings.embed_query(chunk.page_content)
-                
-                # Prepare document for MongoDB
-                doc = {
-                    **metadata,
-                    "chunk_id": i,
-                    "content": chunk.page_content,
-                    "embedding": embedding,
-                    "category": category,
-                    "page_number": chunk.metadata.get("page", i),
-                    "total_chunks": len(chunks),
-                    "ingested_at": datetime.now().isoformat(),
-                    "agent": "document_ingestion"
-                }
-                
-                ingested_chunks.append(doc)
-                
-            except Exception as e:
-                logger.error(f"Error processing chunk {i}: {e}")
-                continue
+        # Create embeddings for all chunks in one batch and build the payload
+        total_chunks = len(chunks)
+        try:
+            vectors = self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+        except Exception as e:
+            logger.error(f"Error embedding chunks of {file_path.name}: {e}")
+            vectors = []
+        
+        ingested_at = datetime.now().isoformat()
+        ingested_chunks = [
+            {
+                **metadata,
+                "chunk_id": i,
+                "content": chunk.page_content,
+                "embedding": embedding,
+                "category": category,
+                "page_number": chunk.metadata.get("page", i),
+                "total_chunks": total_chunks,
+                "ingested_at": ingested_at,
+                "agent": "document_ingestion"
+            }
+            for i, (chunk, embedding) in enumerate(zip(chunks, vectors))
+        ]
         
         # Insert into MongoDB
         if ingested_chunks:
@@ -185,7 +228,7 @@ class DocumentIngestionAgent:
             "status": "success",
             "file_name": file_path.name,
             "chunks_ingested": len(ingested_chunks),
-            "total_chunks": len(chunks),
+            "total_chunks": total_chunks,
             "category": category,
             "file_size_bytes": metadata["file_size_bytes"]
         }
@@ -273,6 +316,8 @@ class DocumentIngestionAgent:
             List of relevant document chunks
         """
         logger.info(f"Searching documents: {query}")
+        # $text queries need the text index to exist
+        self._ensure_indexes()
         
         try:
             # Create query embedding
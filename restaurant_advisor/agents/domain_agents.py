@@ -3,23 +3,116 @@ Domain-specialized agents for different aspects of restaurant advisory system.
 These agents provide domain expertise for specific use cases and queries.
 """
 
-from typing import Dict, List, Any, Optional, Tuple, Literal
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import json
+import string
+from functools import cached_property
+from typing import AsyncIterator, Dict, FrozenSet, Iterator, List, Any, Optional, Tuple, Type, Literal
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from agents.agent_definitions import BaseAgent
+from utils.llm_cache import LLMResponseCache, SemanticResponseCache, SingleFlight
+
+# Scaffolding shared by every specialist's system prompt. It comes first and is
+# byte-identical across specialists, so provider prefix caching covers all of them.
+COMMON_SYSTEM_PREFIX = """You are one of a team of domain specialists advising restaurant entrepreneurs in India.
+        Each request gives you the user's query, the known details of their restaurant concept,
+        knowledge base insights drawn from industry research, reports and regulatory documents,
+        and knowledge graph data about Indian cities, locations, regulations and cuisine preferences.
+        Base your advice on that information, state your assumptions where data is missing,
+        and keep every recommendation practical and specific to the Indian restaurant market.
+        
+        """
+
+# Retrieved context section shared by every specialist's request template
+CONTEXT_SECTION = """
+        Knowledge base insights:
+        {kb_context}
+        
+        Knowledge graph data:
+        {kg_insights}
+        """
+
+# Per-request template shared by every specialist; {details} holds only the
+# request fields that were actually provided, one per line. The query changes every
+# turn, so it goes last and the retrieved context extends the cacheable prompt prefix.
+REQUEST_TEMPLATE = CONTEXT_SECTION + """
+        {details}
+        User query: {query}
+        """
+
+# Punctuation becomes whitespace so routing can tokenize with a single translate + split;
+# multi-word terms are matched as phrases of up to this many words
+_PUNCT_TABLE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+_MAX_TERM_WORDS = 3
+
+
+def _query_terms(query_lower: str) -> FrozenSet[str]:
+    """Tokenize a lower-cased query into words, their singular forms and short phrases."""
+    words = query_lower.translate(_PUNCT_TABLE).split()
+    terms = set(words)
+    terms.update(word[:-1] for word in words if word.endswith("s"))
+    terms.update(word[:-2] for word in words if word.endswith("es"))
+    for size in range(2, _MAX_TERM_WORDS + 1):
+        terms.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return frozenset(terms)
 
 class DomainSpecialist:
     """Base class for domain specialists."""
     
+    # Only the compiled prompt is per instance; slots avoid a per-instance __dict__
+    __slots__ = ("prompt", "response_prefix")
+    
+    # Static specialist metadata and templates, shared by every instance
+    domain = "general"
+    description = "General domain specialist"
+    capabilities: Tuple[str, ...] = ()
+    system_prompt = ""
+    prompt_template = REQUEST_TEMPLATE
+    
+    # Terms whose presence in a query routes it to this specialist
+    related_terms: FrozenSet[str] = frozenset()
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields: Tuple[Tuple[str, str], ...] = ()
+    
     def __init__(self):
-        self.domain = "general"
-        self.description = "General domain specialist"
-        self.capabilities = []
+        self.prompt = None
+        self.response_prefix = ""
+        self.compile_prompt()
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
+    def compile_prompt(self) -> None:
+        """Precompile the chat prompt and response header from the class templates."""
+        # Static system instructions first, per-request fields last
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", self.prompt_template)
+        ])
+        self.response_prefix = f"[{self.domain.upper()} SPECIALIST RESPONSE]\n\n"
+    
+    def can_handle_query(self, query_lower: str, parameters: Dict[str, Any]) -> bool:
+        """Check if this specialist can handle the query.
+        
+        Args:
+            query_lower: The user query, already lower-cased by the caller
+            parameters: Routing parameters extracted from the query
+        """
+        return (not self.related_terms.isdisjoint(_query_terms(query_lower))
+                or self.matches_parameters(parameters))
+    
+    @classmethod
+    def matches_parameters(cls, parameters: Dict[str, Any]) -> bool:
+        """Check if the routing parameters alone select this specialist."""
         return False
     
+    def format_details(self, parameters: Dict[str, Any]) -> str:
+        """Render the provided request fields, skipping empty ones."""
+        return "\n        ".join(
+            f"{label}: {parameters[name]}"
+            for name, label in self.detail_fields
+            if parameters.get(name)
+        )
+    
     def get_context_requirements(self) -> List[str]:
         """Get the context requirements for this specialist."""
         return ["kb_context", "kg_insights"]
@@ -28,32 +121,23 @@ class DomainSpecialist:
 class CuisineSpecialist(DomainSpecialist):
     """Specialist for cuisine-related queries and recommendations."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "cuisine"
-        self.description = "Cuisine specialist with expertise in food trends, menu design, and cuisine adaptation"
-        self.capabilities = [
-            "Food trend analysis",
-            "Menu recommendations",
-            "Cuisine localization strategies",
-            "Menu pricing optimization",
-            "Dietary restriction accommodation"
-        ]
-        
-        self.prompt_template = """You are a cuisine specialist advising restaurant entrepreneurs in India.
-        
-        User query: {query}
-        City: {city}
-        Cuisine: {cuisine}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "cuisine"
+    description = "Cuisine specialist with expertise in food trends, menu design, and cuisine adaptation"
+    capabilities = (
+        "Food trend analysis",
+        "Menu recommendations",
+        "Cuisine localization strategies",
+        "Menu pricing optimization",
+        "Dietary restriction accommodation"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a cuisine specialist advising restaurant entrepreneurs in India.
         
-        Based on the above information, provide expert advice on cuisine strategy. Include:
-        1. Current trends for this cuisine in {city}
+        Using the information provided with each request, provide expert advice on cuisine strategy. Include:
+        1. Current trends for this cuisine in the target city
         2. Menu recommendations and adaptation suggestions for local tastes
         3. Pricing strategy recommendations
         4. Key ingredients and supply chain considerations
@@ -62,54 +146,45 @@ class CuisineSpecialist(DomainSpecialist):
         Your response should be detailed, practical, and specific to the Indian market context.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        cuisine_related_terms = [
-            "cuisine", "food", "menu", "dish", "taste", "flavor", "recipe", 
-            "ingredient", "culinary", "chef", "cooking", "food trend"
-        ]
-        
-        # Check if query has cuisine-related terms
-        has_cuisine_terms = any(term in query_lower for term in cuisine_related_terms)
-        
-        # Check if parameters include cuisine
-        has_cuisine_param = "cuisine" in parameters and parameters["cuisine"]
-        
-        return has_cuisine_terms or has_cuisine_param
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "cuisine", "food", "menu", "dish", "taste", "flavor", "recipe",
+        "ingredient", "culinary", "chef", "cooking", "food trend"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("city", "City"),
+        ("cuisine", "Cuisine"),
+    )
+    
+    @classmethod
+    def matches_parameters(cls, parameters: Dict[str, Any]) -> bool:
+        """Check if parameters include cuisine."""
+        return bool(parameters.get("cuisine"))
 
 
 class FinancialAdvisorSpecialist(DomainSpecialist):
     """Specialist for restaurant financial planning and analysis."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "financial"
-        self.description = "Financial advisor with expertise in restaurant economics, investment planning, and ROI analysis"
-        self.capabilities = [
-            "Initial investment planning",
-            "Operating cost estimation",
-            "Break-even analysis",
-            "Revenue projection",
-            "Financial risk assessment",
-            "Funding options"
-        ]
-        
-        self.prompt_template = """You are a financial advisor specializing in restaurant economics in India.
-        
-        User query: {query}
-        City: {city}
-        Restaurant type: {restaurant_type}
-        Scale: {scale}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "financial"
+    description = "Financial advisor with expertise in restaurant economics, investment planning, and ROI analysis"
+    capabilities = (
+        "Initial investment planning",
+        "Operating cost estimation",
+        "Break-even analysis",
+        "Revenue projection",
+        "Financial risk assessment",
+        "Funding options"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a financial advisor specializing in restaurant economics in India.
         
-        Based on the above information, provide expert financial advice for this restaurant venture. Include:
-        1. Initial investment estimate breakdown for {city}
+        Using the information provided with each request, provide expert financial advice for this restaurant venture. Include:
+        1. Initial investment estimate breakdown for the target city
         2. Monthly operating cost projections
         3. Break-even analysis and timeline
         4. Revenue projections for first 12 months
@@ -119,52 +194,44 @@ class FinancialAdvisorSpecialist(DomainSpecialist):
         Your response should be data-driven, practical, and specific to the restaurant industry in India.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        finance_related_terms = [
-            "finance", "cost", "budget", "investment", "revenue", "profit", 
-            "break-even", "funding", "loan", "capital", "roi", "return", 
-            "expense", "financial", "money", "cash flow", "pricing"
-        ]
-        
-        # Check if query has finance-related terms
-        return any(term in query_lower for term in finance_related_terms)
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "finance", "cost", "budget", "investment", "revenue", "profit",
+        "break even", "funding", "loan", "capital", "roi", "return",
+        "expense", "financial", "money", "cash flow", "pricing"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("city", "City"),
+        ("restaurant_type", "Restaurant type"),
+        ("scale", "Scale"),
+    )
 
 
 class StaffingHRSpecialist(DomainSpecialist):
     """Specialist for restaurant staffing, HR policies, and team management."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "staffing"
-        self.description = "Staffing and HR specialist with expertise in restaurant personnel management"
-        self.capabilities = [
-            "Staff structure planning",
-            "Hiring best practices",
-            "Training program development",
-            "Compensation benchmarks",
-            "Labor law compliance",
-            "Team management strategies"
-        ]
-        
-        self.prompt_template = """You are a staffing and HR specialist for restaurants in India.
-        
-        User query: {query}
-        City: {city}
-        Restaurant type: {restaurant_type}
-        Scale: {scale}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "staffing"
+    description = "Staffing and HR specialist with expertise in restaurant personnel management"
+    capabilities = (
+        "Staff structure planning",
+        "Hiring best practices",
+        "Training program development",
+        "Compensation benchmarks",
+        "Labor law compliance",
+        "Team management strategies"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a staffing and HR specialist for restaurants in India.
         
-        Based on the above information, provide expert staffing and HR advice for this restaurant. Include:
+        Using the information provided with each request, provide expert staffing and HR advice for this restaurant. Include:
         1. Recommended staff structure and roles for this restaurant type
-        2. Hiring strategy and sources for talent acquisition in {city}
-        3. Compensation benchmarks specific to {city} restaurant industry
+        2. Hiring strategy and sources for talent acquisition in the target city
+        3. Compensation benchmarks specific to the target city restaurant industry
         4. Key labor regulations to be aware of in this context
         5. Training and retention best practices for Indian restaurant staff
         6. Performance management recommendations
@@ -172,103 +239,87 @@ class StaffingHRSpecialist(DomainSpecialist):
         Your response should be practical, compliant with Indian labor laws, and specific to the restaurant industry.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        staffing_related_terms = [
-            "staff", "employee", "hiring", "training", "workforce", "team", 
-            "chef", "waiter", "manager", "hr", "human resources", "personnel",
-            "labor", "recruitment", "interview", "salary", "wage", "compensation"
-        ]
-        
-        # Check if query has staffing-related terms
-        return any(term in query_lower for term in staffing_related_terms)
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "staff", "staffing", "employee", "hiring", "training", "workforce", "team",
+        "chef", "waiter", "manager", "hr", "human resources", "personnel",
+        "labor", "recruitment", "interview", "salary", "salaries", "wage", "compensation"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("city", "City"),
+        ("restaurant_type", "Restaurant type"),
+        ("scale", "Scale"),
+    )
 
 
 class MarketingBrandingSpecialist(DomainSpecialist):
     """Specialist for restaurant marketing, branding, and customer acquisition."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "marketing"
-        self.description = "Marketing specialist with expertise in restaurant branding, promotion, and customer acquisition"
-        self.capabilities = [
-            "Brand strategy development",
-            "Digital marketing planning",
-            "Customer acquisition tactics",
-            "Social media strategy",
-            "Local marketing approaches",
-            "Customer loyalty programs"
-        ]
-        
-        self.prompt_template = """You are a marketing and branding specialist for restaurants in India.
-        
-        User query: {query}
-        City: {city}
-        Restaurant type: {restaurant_type}
-        Target demographic: {demographic}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "marketing"
+    description = "Marketing specialist with expertise in restaurant branding, promotion, and customer acquisition"
+    capabilities = (
+        "Brand strategy development",
+        "Digital marketing planning",
+        "Customer acquisition tactics",
+        "Social media strategy",
+        "Local marketing approaches",
+        "Customer loyalty programs"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a marketing and branding specialist for restaurants in India.
         
-        Based on the above information, provide expert marketing and branding advice for this restaurant. Include:
-        1. Brand positioning recommendations for this restaurant concept in {city}
+        Using the information provided with each request, provide expert marketing and branding advice for this restaurant. Include:
+        1. Brand positioning recommendations for this restaurant concept in the target city
         2. Digital marketing strategies most effective for restaurants in India
         3. Customer acquisition costs and tactics for the target demographic
         4. Social media platform recommendations and content strategy
-        5. Local marketing approaches specific to {city}
+        5. Local marketing approaches specific to the target city
         6. Customer loyalty and retention programs that work well in Indian markets
         
         Your response should be practical, data-driven, and specifically tailored to restaurant marketing in India.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        marketing_related_terms = [
-            "marketing", "promotion", "advertis", "brand", "customer", "acquisition", 
-            "social media", "publicity", "influencer", "campaign", "digital marketing",
-            "seo", "website", "online presence", "customer acquisition", "promotion"
-        ]
-        
-        # Check if query has marketing-related terms
-        return any(term in query_lower for term in marketing_related_terms)
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "marketing", "promotion", "advertise", "advertising", "advertisement", "brand",
+        "customer", "acquisition", "social media", "publicity", "influencer", "campaign", "digital marketing",
+        "seo", "website", "online presence", "customer acquisition"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("city", "City"),
+        ("restaurant_type", "Restaurant type"),
+        ("demographic", "Target demographic"),
+    )
 
 
 class TechnologySystemsSpecialist(DomainSpecialist):
     """Specialist for restaurant technology, systems integration, and digital operations."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "technology"
-        self.description = "Technology specialist with expertise in restaurant systems, POS, and digital operations"
-        self.capabilities = [
-            "POS system selection",
-            "Inventory management systems",
-            "Online ordering integration",
-            "Kitchen display systems",
-            "Table management software",
-            "Customer data platforms",
-            "Cybersecurity for restaurants"
-        ]
-        
-        self.prompt_template = """You are a technology and systems specialist for restaurants in India.
-        
-        User query: {query}
-        Restaurant type: {restaurant_type}
-        Scale: {scale}
-        Budget: {budget}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "technology"
+    description = "Technology specialist with expertise in restaurant systems, POS, and digital operations"
+    capabilities = (
+        "POS system selection",
+        "Inventory management systems",
+        "Online ordering integration",
+        "Kitchen display systems",
+        "Table management software",
+        "Customer data platforms",
+        "Cybersecurity for restaurants"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a technology and systems specialist for restaurants in India.
         
-        Based on the above information, provide expert technology and systems advice for this restaurant. Include:
+        Using the information provided with each request, provide expert technology and systems advice for this restaurant. Include:
         1. Recommended POS systems available in India with pricing estimates
         2. Digital operations stack tailored to this restaurant type
         3. Online ordering and delivery integration options
@@ -280,49 +331,41 @@ class TechnologySystemsSpecialist(DomainSpecialist):
         Your response should be practical, cost-effective, and specific to the Indian restaurant technology landscape.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        tech_related_terms = [
-            "technology", "system", "software", "hardware", "pos", "point of sale", 
-            "inventory", "digital", "online", "app", "mobile", "payment", "website",
-            "reservation", "cybersecurity", "data", "cloud", "integration"
-        ]
-        
-        # Check if query has tech-related terms
-        return any(term in query_lower for term in tech_related_terms)
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "technology", "system", "software", "hardware", "pos", "point of sale",
+        "inventory", "digital", "online", "app", "mobile", "payment", "website",
+        "reservation", "cybersecurity", "data", "cloud", "integration"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("restaurant_type", "Restaurant type"),
+        ("scale", "Scale"),
+        ("budget", "Budget"),
+    )
 
 
 class DesignInteriorSpecialist(DomainSpecialist):
     """Specialist for restaurant design, interior, and ambiance planning."""
     
-    def __init__(self):
-        super().__init__()
-        self.domain = "design"
-        self.description = "Design specialist with expertise in restaurant interiors, space planning, and ambiance"
-        self.capabilities = [
-            "Interior design concept development",
-            "Space planning and layout optimization",
-            "Ambiance and atmosphere creation",
-            "Lighting and acoustics planning",
-            "Furniture and fixture selection",
-            "Brand-aligned design elements"
-        ]
-        
-        self.prompt_template = """You are a design and interior specialist for restaurants in India.
-        
-        User query: {query}
-        Restaurant type: {restaurant_type}
-        Cuisine: {cuisine}
-        Target demographic: {demographic}
-        
-        Knowledge base insights:
-        {kb_context}
-        
-        Knowledge graph data:
-        {kg_insights}
+    __slots__ = ()
+    
+    domain = "design"
+    description = "Design specialist with expertise in restaurant interiors, space planning, and ambiance"
+    capabilities = (
+        "Interior design concept development",
+        "Space planning and layout optimization",
+        "Ambiance and atmosphere creation",
+        "Lighting and acoustics planning",
+        "Furniture and fixture selection",
+        "Brand-aligned design elements"
+    )
+    
+    # Static instructions go first so providers can cache the shared prefix
+    system_prompt = COMMON_SYSTEM_PREFIX + """You are a design and interior specialist for restaurants in India.
         
-        Based on the above information, provide expert design and interior advice for this restaurant. Include:
+        Using the information provided with each request, provide expert design and interior advice for this restaurant. Include:
         1. Design concept recommendations aligned with the restaurant's cuisine and brand
         2. Space planning and layout optimization strategies
         3. Ambiance elements that will appeal to the target demographic
@@ -334,17 +377,28 @@ class DesignInteriorSpecialist(DomainSpecialist):
         Your response should be practical, visually descriptive, and aligned with Indian design sensibilities and preferences.
         """
     
-    def can_handle_query(self, query: str, parameters: Dict[str, Any]) -> bool:
-        """Check if this specialist can handle the query."""
-        query_lower = query.lower()
-        design_related_terms = [
-            "design", "interior", "decor", "ambiance", "atmosphere", "space", "layout", 
-            "lighting", "furniture", "fixture", "seating", "aesthetic", "look",
-            "feel", "ambience", "style", "theme", "decoration"
-        ]
-        
-        # Check if query has design-related terms
-        return any(term in query_lower for term in design_related_terms)
+    # Terms whose presence in a query routes it to this specialist
+    related_terms = frozenset({
+        "design", "interior", "decor", "ambiance", "atmosphere", "space", "layout",
+        "lighting", "furniture", "fixture", "seating", "aesthetic", "look",
+        "feel", "ambience", "style", "theme", "decoration"
+    })
+    
+    # Request fields rendered into the prompt as (parameter, label) pairs
+    detail_fields = (
+        ("restaurant_type", "Restaurant type"),
+        ("cuisine", "Cuisine"),
+        ("demographic", "Target demographic"),
+    )
+
+
+def _build_term_index(specialist_classes: List[Type[DomainSpecialist]]) -> Dict[str, List[int]]:
+    """Map every routing term to the indices (priority order) of the specialists owning it."""
+    owners: Dict[str, List[int]] = {}
+    for index, specialist_class in enumerate(specialist_classes):
+        for term in specialist_class.related_terms:
+            owners.setdefault(term, []).append(index)
+    return owners
 
 
 class DomainSpecialistAgent(BaseAgent):
@@ -353,83 +407,258 @@ class DomainSpecialistAgent(BaseAgent):
     def __init__(self, model_name: str = "gemini-pro-latest"):
         super().__init__(model_name)
         
-        # Initialize all domain specialists
-        self.specialists = [
-            CuisineSpecialist(),
-            FinancialAdvisorSpecialist(),
-            StaffingHRSpecialist(),
-            MarketingBrandingSpecialist(),
-            TechnologySystemsSpecialist(),
-            DesignInteriorSpecialist()
+        # Registry of domain specialists in routing priority order. Specialists
+        # (and their prompts) are only instantiated once a query is routed to them.
+        self._specialist_classes = [
+            CuisineSpecialist,
+            FinancialAdvisorSpecialist,
+            StaffingHRSpecialist,
+            MarketingBrandingSpecialist,
+            TechnologySystemsSpecialist,
+            DesignInteriorSpecialist
         ]
+        self._specialist_instances: Dict[int, DomainSpecialist] = {}
+        
+        # Inverted index over the class-level routing terms for single-pass routing
+        self._term_owners = _build_term_index(self._specialist_classes)
+        
+        # Model and parser fused once; prompts are rendered separately for cache keys
+        self.answer_chain = self.model | self.parser
+        
+        # Exact-match cache of responses keyed by the rendered prompt
+        self.response_cache = LLMResponseCache(maxsize=1024, ttl=3600)
+        
+        # Identical prompts arriving concurrently share one model call
+        self.inflight = SingleFlight()
+        
+        # Similarity cache so paraphrased queries reuse an earlier answer
+        self.semantic_cache = SemanticResponseCache(threshold=0.93)
         
         # Fallback prompt for when no specialist matches
-        self.fallback_prompt = PromptTemplate(
-            template="""You are a restaurant advisory specialist helping entrepreneurs in India.
-            
-            User query: {query}
-            
-            Knowledge base insights:
-            {kb_context}
+        self.fallback_prompt = ChatPromptTemplate.from_messages([
+            ("system", COMMON_SYSTEM_PREFIX + """You are a general restaurant advisory specialist.
             
-            Knowledge graph data:
-            {kg_insights}
-            
-            Please provide a helpful response to this query about the restaurant business in India.
+            Please provide a helpful response to each query about the restaurant business in India.
             Focus on being practical, specific, and data-driven in your advice.
-            """,
-            input_variables=["query", "kb_context", "kg_insights"]
-        )
+            """),
+            ("human", CONTEXT_SECTION + """
+            User query: {query}
+            """)
+        ])
+    
+    def _cached_stream(self, prompt_value) -> Iterator[str]:
+        """Stream the model response, reusing the response for an identical rendered prompt."""
+        cache_key = self.response_cache.make_key(prompt_value)
+        cached_response = self.response_cache.get(cache_key)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        # Wait for an identical prompt already being answered rather than re-asking
+        future, leader = self.inflight.claim(cache_key)
+        if not leader:
+            yield future.result()
+            return
+        
+        try:
+            chunks = []
+            for chunk in self.answer_chain.stream(prompt_value):
+                chunks.append(chunk)
+                yield chunk
+            response = "".join(chunks)
+            self.response_cache.set(cache_key, response)
+        except BaseException as error:
+            self.inflight.reject(cache_key, error)
+            raise
+        self.inflight.resolve(cache_key, response)
+    
+    async def _acached_stream(self, prompt_value) -> AsyncIterator[str]:
+        """Async variant of _cached_stream()."""
+        cache_key = self.response_cache.make_key(prompt_value)
+        cached_response = self.response_cache.get(cache_key)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        future, leader = self.inflight.claim(cache_key)
+        if not leader:
+            yield await asyncio.wrap_future(future)
+            return
+        
+        try:
+            chunks = []
+            async for chunk in self.answer_chain.astream(prompt_value):
+                chunks.append(chunk)
+                yield chunk
+            response = "".join(chunks)
+            self.response_cache.set(cache_key, response)
+        except BaseException as error:
+            self.inflight.reject(cache_key, error)
+            raise
+        self.inflight.resolve(cache_key, response)
+    
+    def _get_specialist(self, index: int) -> DomainSpecialist:
+        """Get the specialist at a registry index, instantiating it on first use."""
+        specialist = self._specialist_instances.get(index)
+        if specialist is None:
+            specialist = self._specialist_classes[index]()
+            self._specialist_instances[index] = specialist
+        return specialist
+    
+    @cached_property
+    def specialists(self) -> List[DomainSpecialist]:
+        """All domain specialists, in routing priority order."""
+        return [self._get_specialist(index) for index in range(len(self._specialist_classes))]
     
     def get_specialist_for_query(self, query: str, parameters: Dict[str, Any]) -> Optional[DomainSpecialist]:
         """Get the appropriate specialist for a given query."""
-        for specialist in self.specialists:
-            if specialist.can_handle_query(query, parameters):
-                return specialist
+        # Lower-case and tokenize once for all specialists
+        query_terms = _query_terms(query.lower())
+        matched = {
+            index
+            for term in query_terms
+            for index in self._term_owners.get(term, ())
+        }
+        
+        # Pick the first specialist in priority order whose terms or parameters match
+        for index, specialist_class in enumerate(self._specialist_classes):
+            if index in matched or specialist_class.matches_parameters(parameters):
+                return self._get_specialist(index)
         return None
     
+    def _build_prompt(self, specialist: Optional[DomainSpecialist], query: str, parameters: Dict[str, Any],
+                      kb_context: str, kg_insights: str):
+        """Render the specialist's prompt (or the fallback prompt) into chat messages."""
+        if specialist is None:
+            return self.fallback_prompt.format_messages(
+                query=query,
+                kb_context=kb_context,
+                kg_insights=kg_insights
+            )
+        
+        # Fill in the specialist's prompt with the parameters actually provided
+        return specialist.prompt.format_messages(
+            query=query,
+            details=specialist.format_details(parameters),
+            kb_context=kb_context,
+            kg_insights=kg_insights
+        )
+    
+    def _lookup_cached(self, specialist: Optional[DomainSpecialist], query: str, parameters: Dict[str, Any]):
+        """Look up a near-duplicate query in the semantic cache.
+        
+        Returns:
+            Tuple of (cached response or None, query embedding, cache namespace)
+        """
+        cache_namespace = specialist.domain if specialist else "fallback"
+        cache_text = query + " " + json.dumps(parameters, sort_keys=True, default=str)
+        cached_response, query_vector = self.semantic_cache.lookup(cache_text, cache_namespace)
+        return cached_response, query_vector, cache_namespace
+    
+    @staticmethod
+    def _response_prefix(specialist: Optional[DomainSpecialist]) -> str:
+        """Header marking which specialist produced a response."""
+        return specialist.response_prefix if specialist else ""
+    
     def run(self, query: str, parameters: Dict[str, Any], kb_context: str, kg_insights: str) -> str:
         """Run the domain specialist agent with the most appropriate specialist."""
+        return "".join(self.run_stream(query, parameters, kb_context, kg_insights))
+    
+    def run_stream(self, query: str, parameters: Dict[str, Any], kb_context: str, kg_insights: str) -> Iterator[str]:
+        """Run the domain specialist agent, yielding the response as it is generated.
+        
+        Args:
+            query: User query string
+            parameters: Routing parameters extracted from the query
+            kb_context: Knowledge base context
+            kg_insights: Knowledge graph insights
+            
+        Returns:
+            Iterator over response chunks, starting with the specialist header
+        """
         specialist = self.get_specialist_for_query(query, parameters)
+        response_prefix = self._response_prefix(specialist)
+        
+        # Answer near-duplicate queries routed to the same specialist from cache
+        cached_response, query_vector, cache_namespace = self._lookup_cached(specialist, query, parameters)
+        if cached_response is not None:
+            yield response_prefix + cached_response
+            return
+        
+        prompt_value = self._build_prompt(specialist, query, parameters, kb_context, kg_insights)
+        
+        # Stream the response from the model
+        if response_prefix:
+            yield response_prefix
+        chunks = []
+        for chunk in self._cached_stream(prompt_value):
+            chunks.append(chunk)
+            yield chunk
+        self.semantic_cache.add(query_vector, "".join(chunks), cache_namespace)
+    
+    async def astream(self, query: str, parameters: Dict[str, Any], kb_context: str, kg_insights: str) -> AsyncIterator[str]:
+        """Async variant of run_stream() for use inside the LangGraph workflow."""
+        specialist = self.get_specialist_for_query(query, parameters)
+        response_prefix = self._response_prefix(specialist)
         
-        if specialist:
-            # Use the specialist's prompt template
-            prompt = PromptTemplate(
-                template=specialist.prompt_template,
-                input_variables=["query", "city", "restaurant_type", "cuisine", "scale", "demographic", "budget", "kb_context", "kg_insights"]
-            )
-            
-            # Fill in the specialist's prompt with available parameters
-            prompt_params = {
-                "query": query,
-                "city": parameters.get("city", ""),
-                "restaurant_type": parameters.get("restaurant_type", ""),
-                "cuisine": parameters.get("cuisine", ""),
-                "scale": parameters.get("scale", ""),
-                "demographic": parameters.get("demographic", ""),
-                "budget": parameters.get("budget", ""),
-                "kb_context": kb_context,
-                "kg_insights": kg_insights
-            }
+        # Embedding the query for the semantic cache is CPU-bound, so keep it off the event loop
+        cached_response, query_vector, cache_namespace = await asyncio.to_thread(
+            self._lookup_cached, specialist, query, parameters
+        )
+        if cached_response is not None:
+            yield response_prefix + cached_response
+            return
+        
+        prompt_value = self._build_prompt(specialist, query, parameters, kb_context, kg_insights)
+        
+        if response_prefix:
+            yield response_prefix
+        chunks = []
+        async for chunk in self._acached_stream(prompt_value):
+            chunks.append(chunk)
+            yield chunk
+        self.semantic_cache.add(query_vector, "".join(chunks), cache_namespace)
+    
+    def run_many(self, queries: List[Tuple[str, Dict[str, Any]]], kb_context: str, kg_insights: str) -> List[str]:
+        """Run several queries, sending every uncached prompt to the model in one batch.
+        
+        Args:
+            queries: List of (query, parameters) pairs
+            kb_context: Knowledge base context shared by all queries
+            kg_insights: Knowledge graph insights shared by all queries
             
-            prompt_value = prompt.format(**prompt_params)
+        Returns:
+            Responses in the same order as the queries
+        """
+        responses = [""] * len(queries)
+        pending = []
+        
+        for index, (query, parameters) in enumerate(queries):
+            specialist = self.get_specialist_for_query(query, parameters)
+            response_prefix = self._response_prefix(specialist)
             
-            # Add specialist information to the response
-            response_prefix = f"[{specialist.domain.upper()} SPECIALIST RESPONSE]\n\n"
+            cached_response, query_vector, cache_namespace = self._lookup_cached(specialist, query, parameters)
+            if cached_response is not None:
+                responses[index] = response_prefix + cached_response
+                continue
             
-            # Get the response from the model
-            model_response = self.model.invoke(prompt_value)
-            parsed_response = self.parser.invoke(model_response)
+            prompt_value = self._build_prompt(specialist, query, parameters, kb_context, kg_insights)
+            cache_key = self.response_cache.make_key(prompt_value)
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                responses[index] = response_prefix + cached_response
+                continue
             
-            return response_prefix + parsed_response
-        else:
-            # Use fallback prompt
-            prompt_value = self.fallback_prompt.format(
-                query=query,
-                kb_context=kb_context,
-                kg_insights=kg_insights
+            pending.append((index, response_prefix, query_vector, cache_namespace, cache_key, prompt_value))
+        
+        if pending:
+            parsed_responses = self.answer_chain.batch(
+                [prompt_value for *_, prompt_value in pending],
+                config={"max_concurrency": 8}
             )
-            
-            # Get the response from the model
-            model_response = self.model.invoke(prompt_value)
-            return self.parser.invoke(model_response)
+            for (index, response_prefix, query_vector, cache_namespace, cache_key, _), parsed_response in zip(pending, parsed_responses):
+                self.response_cache.set(cache_key, parsed_response)
+                self.semantic_cache.add(query_vector, parsed_response, cache_namespace)
+                responses[index] = response_prefix + parsed_response
+        
+        return responses
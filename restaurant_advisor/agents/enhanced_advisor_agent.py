@@ -2,14 +2,56 @@
 Enhanced restaurant advisor agent that leverages the improved knowledge base and graph integration.
 """
 
-from typing import Dict, List, Optional, Any
+import asyncio
+import logging
+import threading
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 from langchain_core.language_models import BaseLLM
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from neo4j.exceptions import DriverError, Neo4jError
+from pymongo.errors import PyMongoError
 
 from integrations.cross_db_insights import CrossDBInsights
 from kb.mongodb_kb import MongoKnowledgeBase
 from kg.neo4j_kg import Neo4jKnowledgeGraph
+from utils.config import RERANKER_MODEL
+from utils.llm_cache import LLMResponseCache, SemanticResponseCache, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Database failures an insight lookup can degrade past instead of failing the answer
+INSIGHT_LOOKUP_ERRORS = (PyMongoError, Neo4jError, DriverError)
+
+# Stand-ins used when a lookup fails, so the advisor still answers from what is available
+EMPTY_CITY_INSIGHTS = {
+    "structured_data": {"recommended_locations": [], "regulations": [], "cuisine_preferences": []},
+    "unstructured_data": {"city_insights": [], "market_trends": [], "cuisine_insights": []}
+}
+EMPTY_MARKET_GAPS = {"identified_gaps": [], "supporting_insights": {}}
+
+# Snippets sharing this many leading characters are treated as duplicates
+INSIGHT_DEDUPE_PREFIX = 120
+# Maximum number of research snippets included per prompt section
+MAX_INSIGHTS = 5
+
+
+def _unique_insights(insights: List[str], limit: Optional[int] = MAX_INSIGHTS) -> List[str]:
+    """Drop snippets that repeat an earlier snippet's opening and cap the count (None for no cap)."""
+    seen = set()
+    unique = []
+    for insight in insights:
+        lead = insight[:INSIGHT_DEDUPE_PREFIX]
+        if lead in seen:
+            continue
+        seen.add(lead)
+        unique.append(insight)
+        if limit is not None and len(unique) == limit:
+            break
+    return unique
 
 class EnhancedRestaurantAdvisorAgent:
     """Agent that provides enhanced restaurant recommendations using integrated knowledge sources."""
@@ -27,7 +69,24 @@ class EnhancedRestaurantAdvisorAgent:
         self.kg = kg
         self.insights = CrossDBInsights(kb, kg)
         
-        # Define the enhanced advisor prompt
+        # City-level KB/KG insights change slowly, so memoize them for 10 minutes
+        # keyed by (city, cuisine_type) / (city, area, cuisine_type) / (city,)
+        insights_lock = threading.Lock()
+        self._city_cache = TTLCache(maxsize=256, ttl=600)
+        self._score_cache = TTLCache(maxsize=256, ttl=600)
+        self._gaps_cache = TTLCache(maxsize=256, ttl=600)
+        self._get_city_insights = cached(self._city_cache, key=hashkey, lock=insights_lock)(
+            self.insights.get_comprehensive_city_insights
+        )
+        self._get_opportunity_score = cached(self._score_cache, key=hashkey, lock=insights_lock)(
+            self.insights.get_restaurant_opportunity_score
+        )
+        self._find_market_gaps = cached(self._gaps_cache, key=hashkey, lock=insights_lock)(
+            self.insights.find_market_gaps
+        )
+        
+        # Define the enhanced advisor prompt. The static instructions come first so
+        # the provider can reuse the cached prefix; request data goes in the human turn.
         self.advisor_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an expert restaurant business advisor specializing in the Indian market.
             You provide detailed, data-driven recommendations for restaurant entrepreneurs
@@ -37,9 +96,13 @@ class EnhancedRestaurantAdvisorAgent:
             1. Structured data about cities, locations, regulations, and cuisine preferences
             2. Unstructured insights from research papers, reports, and industry analyses
             
-            Provide comprehensive, actionable advice based on the following information:
+            Provide comprehensive, actionable advice based on the information supplied with
+            each question, and address the user's specific question.
             
-            City Information: {city_info}
+            Format your response with clear sections, specific recommendations, and actionable insights.
+            Always cite the source of your information where possible.
+            """),
+            ("human", """City Information: {city_info}
             
             Location Recommendations: {location_recommendations}
             
@@ -51,17 +114,122 @@ class EnhancedRestaurantAdvisorAgent:
             
             Market Gaps: {market_gaps}
             
-            Address the user's specific question: {user_query}
-            
-            Format your response with clear sections, specific recommendations, and actionable insights.
-            Always cite the source of your information where possible.
+            User question: {user_query}
             """),
         ])
         
-        # Define the answer parser
+        # Define the answer parser, fused with the LLM into one chain; prompts are
+        # rendered separately so the rendered text can key the response cache
         self.answer_parser = StrOutputParser()
+        self.answer_chain = self.llm | self.answer_parser
+        
+        # Exact-match cache of answers keyed by the rendered prompt
+        self.response_cache = LLMResponseCache(maxsize=1024, ttl=3600)
+        
+        # Identical prompts arriving concurrently share one LLM call
+        self.inflight = SingleFlight()
+        
+        # Similarity cache so paraphrased questions about the same target reuse an answer
+        self.semantic_cache = SemanticResponseCache(embed_query=kb.embeddings.embed_query, threshold=0.93)
+    
+    def _cached_invoke(self, prompt_value) -> str:
+        """Invoke the LLM, reusing the answer for an identical rendered prompt."""
+        cache_key = self.response_cache.make_key(prompt_value)
+        cached_answer = self.response_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer
+        
+        def compute() -> str:
+            answer = self.answer_chain.invoke(prompt_value)
+            self.response_cache.set(cache_key, answer)
+            return answer
+        
+        # Identical prompts already in flight share that call's answer
+        return self.inflight.do(cache_key, compute)
+    
+    async def _acached_invoke(self, prompt_value) -> str:
+        """Async variant of _cached_invoke."""
+        cache_key = self.response_cache.make_key(prompt_value)
+        cached_answer = self.response_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer
+        
+        async def compute() -> str:
+            answer = await self.answer_chain.ainvoke(prompt_value)
+            self.response_cache.set(cache_key, answer)
+            return answer
+        
+        # Identical prompts already in flight share that call's answer
+        return await self.inflight.ado(cache_key, compute)
+    
+    def _cached_stream(self, prompt_value) -> Iterator[str]:
+        """Streaming variant of _cached_invoke."""
+        cache_key = self.response_cache.make_key(prompt_value)
+        cached_answer = self.response_cache.get(cache_key)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+        
+        # Wait for an identical prompt already being answered rather than re-asking
+        future, leader = self.inflight.claim(cache_key)
+        if not leader:
+            yield future.result()
+            return
+        
+        try:
+            chunks = []
+            for chunk in self.answer_chain.stream(prompt_value):
+                chunks.append(chunk)
+                yield chunk
+            answer = "".join(chunks)
+            self.response_cache.set(cache_key, answer)
+        except BaseException as error:
+            self.inflight.reject(cache_key, error)
+            raise
+        self.inflight.resolve(cache_key, answer)
+    
+    @cached_property
+    def reranker(self):
+        """Cross-encoder scoring (query, insight) relevance, loaded on first use."""
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(RERANKER_MODEL)
+    
+    def _rerank_insights(self, query: str, insights: List[str], top_k: int = MAX_INSIGHTS) -> List[str]:
+        """Keep the insights most relevant to the query, scored in a single cross-encoder batch."""
+        if len(insights) <= top_k:
+            return insights
+        scores = self.reranker.predict([(query, insight) for insight in insights])
+        ranked = sorted(zip(scores, insights), key=lambda pair: pair[0], reverse=True)
+        return [insight for _, insight in ranked[:top_k]]
+    
+    @staticmethod
+    async def _alookup(lookup, fallback: Any, *args) -> Tuple[Any, bool]:
+        """Run an insight lookup in a worker thread, degrading to a fallback on database errors.
+        
+        Returns:
+            Tuple of (lookup result or fallback, whether the lookup succeeded)
+        """
+        try:
+            return await asyncio.to_thread(lookup, *args), True
+        except INSIGHT_LOOKUP_ERRORS as e:
+            logger.error(f"Error in {lookup.__name__}{args}: {e}")
+            return fallback, False
         
     def run(self, query: str, city: str, cuisine_type: Optional[str] = None, area: Optional[str] = None) -> str:
+        """Run the enhanced advisor agent to answer a query (blocking wrapper around arun).
+        
+        Args:
+            query: User query string
+            city: Target city for recommendation
+            cuisine_type: Optional cuisine type
+            area: Optional specific area within the city
+            
+        Returns:
+            Detailed restaurant recommendation
+        """
+        return asyncio.run(self.arun(query, city, cuisine_type, area))
+    
+    async def arun(self, query: str, city: str, cuisine_type: Optional[str] = None, area: Optional[str] = None) -> str:
         """Run the enhanced advisor agent to answer a query.
         
         Args:
@@ -73,80 +241,143 @@ class EnhancedRestaurantAdvisorAgent:
         Returns:
             Detailed restaurant recommendation
         """
-        try:
-            # Gather integrated insights
-            comprehensive_insights = self.insights.get_comprehensive_city_insights(city, cuisine_type)
+        # Answer near-duplicate questions about the same target from cache
+        cache_namespace = f"{city}|{cuisine_type or ''}|{area or ''}".lower()
+        cached_answer, query_vector = await asyncio.to_thread(self.semantic_cache.lookup, query, cache_namespace)
+        if cached_answer is not None:
+            return cached_answer
+        
+        prompt_value, complete = await self._aprepare_prompt(query, city, cuisine_type, area)
+        
+        # Run the LLM, reusing the answer for an identical prompt
+        answer = await self._acached_invoke(prompt_value)
+        
+        # Answers built on partial data are not reused for paraphrased questions
+        if complete:
+            self.semantic_cache.add(query_vector, answer, cache_namespace)
+        
+        return answer
+    
+    def run_stream(self, query: str, city: str, cuisine_type: Optional[str] = None,
+                   area: Optional[str] = None) -> Iterator[str]:
+        """Run the enhanced advisor agent, yielding the answer as it is generated.
+        
+        Args:
+            query: User query string
+            city: Target city for recommendation
+            cuisine_type: Optional cuisine type
+            area: Optional specific area within the city
             
-            # Calculate opportunity score if area is provided
-            opportunity_score = "No specific area provided for opportunity scoring."
-            if area and cuisine_type:
-                score_result = self.insights.get_restaurant_opportunity_score(city, area, cuisine_type)
-                opportunity_score = f"""
-                Overall Score: {score_result['opportunity_score']}/10
-                Interpretation: {score_result['interpretation']}
-                
-                Score Components:
-                - Location Score: {score_result['components']['location_score']:.1f}/10
-                - Uniqueness Score: {score_result['components']['uniqueness_score']:.1f}/10
-                - Market Sentiment: {score_result['components']['market_sentiment']:.1f}/10
-                - Regulatory Ease: {score_result['components']['regulatory_ease']:.1f}/10
-                
-                Supporting Insights:
-                {' '.join([insight[:200] + '...' for insight in score_result['supporting_insights'][:2]])}
-                """
+        Returns:
+            Iterator over chunks of the recommendation
+        """
+        cache_namespace = f"{city}|{cuisine_type or ''}|{area or ''}".lower()
+        cached_answer, query_vector = self.semantic_cache.lookup(query, cache_namespace)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+        
+        prompt_value, complete = asyncio.run(self._aprepare_prompt(query, city, cuisine_type, area))
+        chunks = []
+        for chunk in self._cached_stream(prompt_value):
+            chunks.append(chunk)
+            yield chunk
+        
+        if complete:
+            self.semantic_cache.add(query_vector, "".join(chunks), cache_namespace)
+    
+    async def _aprepare_prompt(self, query: str, city: str, cuisine_type: Optional[str],
+                               area: Optional[str]):
+        """Gather the integrated insights and render them into the advisor prompt.
+        
+        Returns:
+            Tuple of (rendered prompt, whether every insight lookup succeeded)
+        """
+        # Gather integrated insights; the KB/KG lookups are independent so run them concurrently.
+        # A failing database degrades its section instead of failing the whole answer.
+        lookups = [
+            self._alookup(self._get_city_insights, EMPTY_CITY_INSIGHTS, city, cuisine_type),
+            self._alookup(self._find_market_gaps, EMPTY_MARKET_GAPS, city)
+        ]
+        if area and cuisine_type:
+            lookups.append(self._alookup(self._get_opportunity_score, None, city, area, cuisine_type))
+        results = await asyncio.gather(*lookups)
+        (comprehensive_insights, _), (market_gaps, _) = results[0], results[1]
+        complete = all(succeeded for _, succeeded in results)
+        
+        # Format the opportunity score if area is provided
+        opportunity_score = "No specific area provided for opportunity scoring."
+        score_result, score_found = results[2] if len(results) > 2 else (None, False)
+        if score_found:
+            opportunity_score = f"""
+            Overall Score: {score_result['opportunity_score']}/10
+            Interpretation: {score_result['interpretation']}
             
-            # Find market gaps
-            market_gaps = self.insights.find_market_gaps(city)
-            gaps_text = "Top market gaps identified:\n"
-            for gap in market_gaps["identified_gaps"][:3]:
-                gaps_text += f"- {gap['cuisine'].title()} cuisine (mentioned {gap['mentions']} times)\n"
-                if gap["cuisine"] in market_gaps["supporting_insights"]:
-                    insights = market_gaps["supporting_insights"][gap["cuisine"]]
-                    if insights:
-                        gaps_text += f"  Insight: {insights[0][:150]}...\n"
+            Score Components:
+            - Location Score: {score_result['components']['location_score']:.1f}/10
+            - Uniqueness Score: {score_result['components']['uniqueness_score']:.1f}/10
+            - Market Sentiment: {score_result['components']['market_sentiment']:.1f}/10
+            - Regulatory Ease: {score_result['components']['regulatory_ease']:.1f}/10
             
-            # Format the input for the LLM
-            city_info = f"""
-            City: {city}
-            Popular cuisines: {', '.join([c['cuisine_type'] for c in comprehensive_insights['structured_data']['cuisine_preferences'][:3]])}
+            Supporting Insights:
+            {' '.join(insight[:200] + '...' for insight in _unique_insights(score_result['supporting_insights'], 2))}
             """
-            
-            location_recs = "\n".join([
-                f"- {loc.get('area', 'Unknown Area')}: {loc.get('type', 'Commercial')} area, " +
-                f"Foot traffic: {loc.get('foot_traffic', 'Unknown')}, " + 
-                f"Rent range: {loc.get('rent_range', 'Unknown')}"
-                for loc in comprehensive_insights['structured_data']['recommended_locations'][:3]
-            ])
-            
-            market_analysis = "\n".join([
-                f"- {insight[:200]}..." 
-                for insight in comprehensive_insights['unstructured_data']['market_trends']
-            ])
-            
-            regulatory_info = "\n".join([
-                f"- {reg.get('type', 'Regulation')}: {reg.get('description', 'No description')}[:100]..." 
-                for reg in comprehensive_insights['structured_data']['regulations'][:3]
-            ])
-            
-            # Create the chain
-            chain = (
-                self.advisor_prompt 
-                | self.llm 
-                | self.answer_parser
-            )
-            
-            # Run the chain with all the gathered insights
-            answer = chain.invoke({
-                "city_info": city_info,
-                "location_recommendations": location_recs,
-                "market_analysis": market_analysis,
-                "regulatory_info": regulatory_info,
-                "opportunity_score": opportunity_score,
-                "market_gaps": gaps_text,
-                "user_query": query
-            })
-            
-            return answer
-        except Exception as e:
-            return f"I encountered an issue retrieving enhanced restaurant recommendations: {str(e)}. " \
-                   f"Could you try again with more specific information about your restaurant concept and target location?"
+        elif len(results) > 2:
+            opportunity_score = "Opportunity score is currently unavailable."
+        
+        # Summarize market gaps
+        supporting_insights = market_gaps["supporting_insights"]
+        gaps_parts = ["Top market gaps identified:\n"]
+        for gap in market_gaps["identified_gaps"][:3]:
+            cuisine = gap["cuisine"]
+            gaps_parts.append(f"- {cuisine.title()} cuisine (mentioned {gap['mentions']} times)\n")
+            insights = supporting_insights.get(cuisine)
+            if insights:
+                gaps_parts.append(f"  Insight: {insights[0][:150]}...\n")
+        gaps_text = "".join(gaps_parts)
+        
+        # Format the input for the LLM
+        structured_data = comprehensive_insights['structured_data']
+        cuisine_preferences = structured_data['cuisine_preferences'][:3]
+        recommended_locations = structured_data['recommended_locations'][:3]
+        regulations = structured_data['regulations'][:3]
+        unstructured_data = comprehensive_insights['unstructured_data']
+        
+        # Pool every research snippet and keep only the ones most relevant to the question
+        candidate_insights = _unique_insights(
+            unstructured_data['market_trends'] + unstructured_data['city_insights']
+            + unstructured_data['cuisine_insights'],
+            limit=None
+        )
+        market_insights = await asyncio.to_thread(self._rerank_insights, query, candidate_insights)
+        
+        city_info = f"""
+        City: {city}
+        Popular cuisines: {', '.join(c['cuisine_type'] for c in cuisine_preferences)}
+        """
+        
+        location_recs = "\n".join(
+            f"- {loc.get('area', 'Unknown Area')}: {loc.get('type', 'Commercial')} area, "
+            f"Foot traffic: {loc.get('foot_traffic', 'Unknown')}, "
+            f"Rent range: {loc.get('rent_range', 'Unknown')}"
+            for loc in recommended_locations
+        )
+        
+        market_analysis = "\n".join(f"- {insight[:200]}..." for insight in market_insights)
+        
+        regulatory_info = "\n".join(
+            f"- {reg.get('type', 'Regulation')}: {reg.get('description', 'No description')[:100]}..."
+            for reg in regulations
+        )
+        
+        # Render the prompt with all the gathered insights
+        prompt_value = self.advisor_prompt.format_messages(
+            city_info=city_info,
+            location_recommendations=location_recs,
+            market_analysis=market_analysis,
+            regulatory_info=regulatory_info,
+            opportunity_score=opportunity_score,
+            market_gaps=gaps_text,
+            user_query=query
+        )
+        return prompt_value, complete
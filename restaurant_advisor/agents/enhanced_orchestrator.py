@@ -2,11 +2,30 @@
 Enhanced multi-agent orchestrator with advanced routing and agent-leading-agents capabilities.
 """
 
-from typing import Dict, List, Any, Optional, Tuple, Literal, TypedDict, Union
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from types import MappingProxyType
+from typing import AsyncIterator, Callable, ClassVar, Dict, Iterator, List, Any, Mapping, Optional, Tuple, Literal, TypedDict, Union
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda, RunnableParallel
 import operator
+import queue
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.runtime import Runtime
 
 from agents.agent_definitions import (
     RoutingAgent, 
@@ -14,6 +33,7 @@ from agents.agent_definitions import (
     RegulatoryAdvisorAgent, 
     MarketAnalysisAgent,
     BasicQueryAgent,
+    ConversationSummarizerAgent,
     PDFResearchAgent,
     ExternalMarketResearchAgent,
     ExternalConsumerSurveyAgent,
@@ -22,907 +42,1375 @@ from agents.agent_definitions import (
     DocumentIngestionManager
 )
 from agents.domain_agents import DomainSpecialistAgent
-from agents.memory_management import MemoryManager
+from agents.memory_management import MemoryManager, MemoryStore
 from kb.mongodb_kb import MongoKnowledgeBase
 from kg.neo4j_kg import Neo4jKnowledgeGraph
-from utils.auth import has_agent_access, check_permission
+from utils.config import KB_PARTITIONS
+from utils.context_budget import KB_CONTEXT_CHARS, KG_INSIGHTS_CHARS, join_within_budget
+from utils.llm_cache import PersistentResultCache
+from utils.report_templates import format_market_analysis
+from utils.auth import (
+    AGENT_PERMISSION_BITS, RESOURCE_PERMISSION_BITS, has_agent_access, check_permission, permission_mask
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Cities recognised in basic queries, matched in a single pass over the query
+BASIC_QUERY_CITIES = ("mumbai", "delhi", "bangalore", "chennai", "hyderabad", "kolkata", "pune", "ahmedabad")
+_CITY_PATTERN = re.compile("|".join(map(re.escape, BASIC_QUERY_CITIES)))
+
+# Characters ignored when comparing queries for retrieval caching
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Most idle graph states kept for reuse by later turns
+STATE_POOL_SIZE = 64
+# Immutable fields of a blank graph state, set in one update when a state is created or reset
+BLANK_STATE_FIELDS = MappingProxyType({"query": None, "routing": None, "next_agent": None})
+# Worker threads shared by all turns of every orchestrator for blocking KB, KG and LLM calls
+BLOCKING_WORKERS = 16
+
+async def _run_in_executor(executor: Executor, func: Callable, *args: Any) -> Any:
+    """Run a blocking call on an executor in a copy of the current context, like asyncio.to_thread."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, func, *args))
+
+async def _run_fetch(fetch: Optional[Callable[[], List]], executor: Executor) -> List:
+    """Run a blocking KB/KG fetch on a worker thread; a missing fetch yields no results."""
+    if fetch is None:
+        return []
+    return await _run_in_executor(executor, fetch)
+
+def _fetched_or_empty(source: str, result: Union[List, BaseException]) -> List:
+    """Results of a KB/KG fetch, or no results if it failed (cancellation is re-raised)."""
+    if isinstance(result, Exception):
+        logger.warning("%s retrieval failed; continuing without it", source, exc_info=result)
+        return []
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+async def _stream_response(chunks: AsyncIterator[str]) -> str:
+    """Forward response chunks to the graph's custom stream and return the full response."""
+    writer = get_stream_writer()
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        writer({"token": chunk})
+    return "".join(parts)
+
+# Retrieved documents cited under an answer
+MAX_CITED_SOURCES = 5
+
+def _format_sources(sources: List[Dict[str, Any]]) -> str:
+    """Footer citing the first MAX_CITED_SOURCES retrieved documents."""
+    lines = "".join(
+        f"{i}. {source['file_name']} (Category: {source['category']}, Page: {source['page']})\n"
+        for i, source in enumerate(sources[:MAX_CITED_SOURCES], 1)
+    )
+    return f"\n\n--- Sources ---\n{lines}"
+
+# When the router's top choice is less confident than this, the runner-up agent also answers
+MULTI_INTENT_CONFIDENCE = 0.7
+MAX_FAN_OUT_AGENTS = 2
+# Agents answering from live external data sources rather than the KB and KG
+EXTERNAL_AGENTS = frozenset({"consumer_survey", "real_estate", "demographics", "market_research"})
+# External agents whose results depend on the query text, not only on their structured arguments
+QUERY_DEPENDENT_EXTERNAL_AGENTS = frozenset({"market_research"})
+# How long (seconds) a persisted external agent result stays fresh, by how fast its data changes
+EXTERNAL_RESULT_TTLS = {
+    "demographics": 30 * 24 * 3600,
+    "real_estate": 30 * 24 * 3600,
+    "market_research": 7 * 24 * 3600,
+    "consumer_survey": 24 * 3600,
+}
+# Agents that answer a query in plain text from the shared parameters, so their answers can be merged
+FAN_OUT_AGENTS = frozenset({"location_recommender", "regulatory_advisor", "pdf_research", "domain_specialist"}) | EXTERNAL_AGENTS
+
+@dataclass(slots=True)
+class RoutingResult:
+    """The router's decision for the current query."""
+    agent: str
+    parameters: Dict[str, Any] = field(default_factory=dict)
+    # Further agents that answer in parallel with the primary one for multi-intent queries
+    fan_out: List[str] = field(default_factory=list)
+
+@dataclass(slots=True)
+class AccessControl:
+    """Agent permission checks made while handling the current query."""
+    checked_permissions: Dict[str, bool] = field(default_factory=dict)
+    access_denied: bool = False
+
+@dataclass(slots=True)
+class UserMemorySlot:
+    """What the nodes handling the current query remember about its user."""
+    user_context: Dict[str, Any] = field(default_factory=dict)
+    last_route: Optional[str] = None
+    last_parameters: Dict[str, Any] = field(default_factory=dict)
+    last_context_signature: Optional[str] = None
+    last_response: Optional[str] = None
+    last_sources: List[Dict[str, Any]] = field(default_factory=list)
+    # Structured result of the last agent that returns one (e.g. consumer survey data)
+    last_result: Optional[Dict[str, Any]] = None
+    
+    def reset(self, user_context: Dict[str, Any]) -> None:
+        """Reuse the slot for another turn, forgetting everything from the previous one.
+        
+        Fields are rebound rather than cleared, as they may share objects with caches.
+        """
+        self.user_context = user_context
+        self.last_route = None
+        self.last_parameters = {}
+        self.last_context_signature = None
+        self.last_response = None
+        self.last_sources = []
+        self.last_result = None
 
 class EnhancedAgentState(TypedDict):
     """Type definition for the state in the enhanced agent graph."""
     messages: List[BaseMessage]
+    # Text of the user's latest message, or None if the latest message is not from the user
+    query: Optional[str]
     user: Dict
     context: Dict
+    routing: Optional[RoutingResult]
     next_agent: Optional[str]
     subagents: List[str]
-    memory: Dict
-    access_control: Dict
+    memory: Dict[str, UserMemorySlot]
+    access_control: AccessControl
 
-class EnhancedAgentOrchestrator:
-    """Enhanced orchestrator for the multi-agent system with advanced routing and memory."""
+# Reply for queries routed to an agent outside the user's permissions
+ACCESS_DENIED_RESPONSE = """I'm sorry, but you don't have access to the {agent} agent with your current permissions.
+
+Please contact your administrator to upgrade your access level, or rephrase your question as a general query."""
+
+def _may_use_agent(user: Dict, agent_name: Optional[str]) -> bool:
+    """Whether a user may be answered by an agent; basic_query is open to everyone as the fallback."""
+    return agent_name == "basic_query" or has_agent_access(user, agent_name)
+
+def _checked_agent_access(state: EnhancedAgentState, agent_name: Optional[str]) -> bool:
+    """_may_use_agent for the state's user, memoized for the turn in the state's checked_permissions."""
+    checked_permissions = state["access_control"].checked_permissions
+    has_access = checked_permissions.get(agent_name)
+    if has_access is None:
+        has_access = checked_permissions[agent_name] = _may_use_agent(state["user"], agent_name)
+    return has_access
+
+def _user_memory(state: EnhancedAgentState) -> UserMemorySlot:
+    """The querying user's memory slot, created on first use."""
+    user_id = state["user"]["username"]
+    slot = state["memory"].get(user_id)
+    if slot is None:
+        slot = state["memory"][user_id] = UserMemorySlot()
+    return slot
+
+def _routing_parameters(state: EnhancedAgentState) -> Dict[str, Any]:
+    """Parameters extracted by the router, or an empty dict if the query was not routed."""
+    routing = state.get("routing")
+    return routing.parameters if routing is not None else {}
+
+# KG insight templates, one line per field
+LOCATION_INSIGHT_TEMPLATE = "Location: {area} - Overall Score: {score:.2f}\n"
+LOCATION_METRICS_TEMPLATE = (
+    "  - Foot Traffic: {foot_traffic:.2f}\n"
+    "  - Competition Level: {competition:.2f}\n"
+    "  - Growth Potential: {growth:.2f}\n"
+)
+LOCATION_RENT_TEMPLATE = "  - Rent Value (lower is better): {rent:.2f}\n"
+LOCATION_DETAILS_TEMPLATE = LOCATION_INSIGHT_TEMPLATE + LOCATION_METRICS_TEMPLATE + LOCATION_RENT_TEMPLATE
+REGULATION_INSIGHT_TEMPLATE = "Regulation: {type}\nDescription: {description}\nAuthority: {authority}\n"
+MARKET_AREA_TEMPLATE = "Area: {area}\n" + LOCATION_METRICS_TEMPLATE
+
+# Answers of the external data agents
+CONSUMER_SURVEY_TEMPLATE = (
+    "**Consumer Survey Insights for {city}**\n\n"
+    "{preferences}\n\n"
+    "**Dining Frequency**: {dineout_frequency}\n\n"
+    "**Delivery Trends**: Delivery adoption at {delivery_adoption}%\n\n"
+    "**Dietary Trends**: {dietary_trends:.300}..."
+)
+REAL_ESTATE_TEMPLATE = (
+    "**Real Estate Analysis for {locality}, {city}**\n\n"
+    "**Rental Costs**: ₹{rent[average]}/sqft/month\n"
+    "Range: ₹{rent[min]} - ₹{rent[max]}\n\n"
+    "**Foot Traffic**: {foot_traffic}\n\n"
+    "**Viability Analysis**:\n{viability}"
+)
+DEMOGRAPHICS_TEMPLATE = (
+    "**Demographic & Economic Analysis for {city}**\n\n"
+    "**Population**: {demographics[population]:,}\n"
+    "**Median Age**: {demographics[median_age]} years\n"
+    "**GDP Per Capita**: ${economy[gdp_per_capita_usd]:,}\n"
+    "**Avg Monthly Income**: ₹{economy[avg_monthly_income_inr]:,}\n\n"
+    "**Purchasing Power**: Monthly dining budget ~ ₹{dining_budget}\n\n"
+    "**Target Demographics Analysis**:\n{target_analysis}"
+)
+MARKET_RESEARCH_TEMPLATE = (
+    "**Market Research Insights for {city}**\n\n"
+    "**Industry Statistics**:\n"
+    "- Market Size: ${stats[market_size_usd_billion]}B\n"
+    "- Growth Rate: {stats[projected_growth_rate_percent]}%\n\n"
+    "**Market Analysis**:\n{analysis}"
+)
+
+def _format_consumer_survey(result: Dict[str, Any], city: str) -> str:
+    """Summarize the external consumer survey agent's result."""
+    return CONSUMER_SURVEY_TEMPLATE.format(
+        city=city,
+        preferences=result['preferences']['analysis'],
+        dineout_frequency=result['dining_frequency']['weekly_dineout_frequency'],
+        delivery_adoption=result['delivery_trends']['delivery_adoption_rate'],
+        dietary_trends=result['dietary_trends']['analysis']
+    )
+
+def _format_real_estate(result: Dict[str, Any], city: str, locality: str) -> str:
+    """Summarize the external real estate agent's result."""
+    return REAL_ESTATE_TEMPLATE.format(
+        city=city,
+        locality=locality,
+        rent=result['rental_data']['rental_cost_per_sqft_monthly'],
+        foot_traffic=result['foot_traffic']['foot_traffic_level'],
+        viability=result['viability_analysis']['analysis']
+    )
+
+def _format_demographics(result: Dict[str, Any], city: str) -> str:
+    """Summarize the external demographics agent's result."""
+    return DEMOGRAPHICS_TEMPLATE.format(
+        city=city,
+        demographics=result['demographics'],
+        economy=result['economic_indicators'],
+        dining_budget=result['purchasing_power']['estimated_monthly_dining_budget'],
+        target_analysis=result['target_analysis']['analysis']
+    )
+
+def _format_market_research(result: Dict[str, Any], city: str) -> str:
+    """Summarize the external market research agent's result."""
+    return MARKET_RESEARCH_TEMPLATE.format(
+        city=city, stats=result['industry_stats'], analysis=result['analysis']['analysis']
+    )
+
+# Location properties read by the insight formatters, with their defaults, in unpacking order
+LOCATION_FIELDS = ("foot_traffic", "competition_score", "growth_potential", "rent_score", "popular_cuisines", "demographics")
+LOCATION_DEFAULTS = (0, 0, 0, 0, (), ())
+
+def _location_fields(properties: Dict[str, Any]) -> Tuple:
+    """Read all LOCATION_FIELDS from a location's properties in one pass."""
+    get = properties.get
+    return tuple(get(name, default) for name, default in zip(LOCATION_FIELDS, LOCATION_DEFAULTS))
+
+# KB search query templates; optional fields are filled from QUERY_PART_TEMPLATES or left blank
+QUERY_TEMPLATES = {
+    "location": "restaurant locations in {city} {cuisine} {concept} {demographic} "
+                "commercial real estate market insights foot traffic",
+    "regulatory": "restaurant regulations in {city} {restaurant_type} {alcohol} licensing permits requirements",
+    "market": "restaurant market analysis in {city} {cuisine} {concept} {area} "
+              "consumer trends competition demographics food preferences",
+    "pdf": "restaurant business research {research_topic} {specific_focus} {city} "
+           "studies reports findings data statistics",
+    "domain": "{query} {domain_keywords} {city}"
+}
+QUERY_PART_TEMPLATES = {
+    "location": {"cuisine": "{} cuisine", "concept": "{} restaurant concept", "demographic": "for {} demographic"},
+    "regulatory": {"alcohol": "liquor license alcohol serving requirements"},
+    "market": {"cuisine": "{} cuisine", "concept": "{} concept", "area": "{} area"},
+    "pdf": {"city": "in {}"},
+    "domain": {"city": "in {}"}
+}
+
+def build_search_query(template_id: str, **values: Any) -> str:
+    """Build a canonical KB search query from a QUERY_TEMPLATES entry.
     
-    def __init__(self, kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
-        self.kb = kb
-        self.kg = kg
-        self.graph = self.create_agent_graph()
+    Args:
+        template_id: Key into QUERY_TEMPLATES
+        **values: Template fields; falsy values leave their part out
         
-        # Initialize memory manager
-        self.memory_manager = MemoryManager()
-        
-        # Initialize agents
-        self.router = RoutingAgent()
-        self.location_recommender = LocationRecommenderAgent()
-        self.regulatory_advisor = RegulatoryAdvisorAgent()
-        self.market_analysis = MarketAnalysisAgent()
-        self.pdf_research = PDFResearchAgent()
-        self.basic_query = BasicQueryAgent()
-        self.domain_specialist = DomainSpecialistAgent()
-        
-        # Initialize external data agents
-        self.external_market_research = ExternalMarketResearchAgent()
-        self.external_consumer_survey = ExternalConsumerSurveyAgent()
-        self.external_real_estate = ExternalRealEstateAgent()
-        self.external_demographics = ExternalDemographicsAgent()
-        self.document_manager = DocumentIngestionManager()
-    
-    def create_agent_graph(self) -> StateGraph:
-        """Create the enhanced agent graph with advanced routing."""
-        # Define the workflow nodes
-        def initialize_state(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Initialize the state with necessary components."""
-            # Initialize subagents list if not present
-            if "subagents" not in state:
-                state["subagents"] = []
-            
-            # Initialize memory if not present
-            if "memory" not in state:
-                state["memory"] = {}
-            
-            # Initialize access control if not present
-            if "access_control" not in state:
-                state["access_control"] = {
-                    "checked_permissions": {},
-                    "access_denied": False
-                }
-            
-            return state
-        
-        def route_query(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Route the user's query to the appropriate agent."""
-            # Get the latest message
-            latest_message = state["messages"][-1]
-            if not isinstance(latest_message, HumanMessage):
-                return state
-            
-            # Route the query
-            query = latest_message.content
-            result = self.router.run(query)
-            
-            # Store routing result
-            state["context"]["routing"] = result
-            state["next_agent"] = result["agent"]
-            
-            # Update memory with routing information
-            user_id = state["user"]["username"]
-            state["memory"][user_id] = state["memory"].get(user_id, {})
-            state["memory"][user_id]["last_route"] = result["agent"]
-            state["memory"][user_id]["last_parameters"] = result["parameters"]
-            
-            return state
+    Returns:
+        The query with whitespace collapsed, so equivalent requests produce identical strings
+    """
+    part_templates = QUERY_PART_TEMPLATES.get(template_id, {})
+    parts = {
+        name: part_templates.get(name, "{}").format(value) if value else ""
+        for name, value in values.items()
+    }
+    return " ".join(QUERY_TEMPLATES[template_id].format(**parts).split())
+
+def _document_type_filter(*document_types: str) -> Dict[str, Any]:
+    """KB metadata filter matching documents of any of the given types."""
+    return {"metadata.type": {"$in": list(document_types)}}
+
+# KB metadata filters of the agents' searches, built once and shared by every search (never mutate)
+# Each agent searches one KB partition, so its filter matches that partition's document types
+KB_FILTERS: Mapping[str, Dict[str, Any]] = MappingProxyType({
+    partition: _document_type_filter(*document_types) for partition, document_types in KB_PARTITIONS.items()
+})
+
+# Retrievers fetch the context one agent type needs. KB retrievers receive a
+# hybrid_search-compatible callable; KG retrievers receive the knowledge graph.
+# Both also get the routing parameters and the latest user query.
+KBRetriever = Callable[[Callable[..., List[Document]], Dict[str, Any], str], List[Document]]
+KGRetriever = Callable[[Neo4jKnowledgeGraph, Dict[str, Any], str], List[str]]
+
+def _retrieve_location_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for real estate and demographic context on the target city."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    # Create a more specific query using all available parameters
+    search_query = build_search_query(
+        "location",
+        city=city,
+        cuisine=parameters.get("cuisine", ""),
+        concept=parameters.get("concept", ""),
+        demographic=parameters.get("demographic", "")
+    )
+    
+    # Perform a hybrid search for more relevant results
+    return search(search_query, user_filter=KB_FILTERS["location"], partition="location")
+
+def _retrieve_location_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Describe the recommended locations in the target city."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    kg_insights = []
+    # Get detailed location recommendations
+    locations = kg.recommend_locations(city, cuisine_type=parameters.get("cuisine", ""))
+    
+    # Format location insights with more details
+    for loc in locations:
+        area = loc.get('area', '')
+        score = loc.get('score', 0)
+        properties = loc.get('properties', {})
         
-        def check_permissions_and_route(state: EnhancedAgentState) -> str:
-            """Check if the user has access to the required agent and route accordingly."""
-            next_agent = state["next_agent"]
-            user = state["user"]
-            
-            # Check if the agent access is allowed
-            has_access = has_agent_access(user, next_agent)
-            
-            # Store permission check result
-            state["access_control"]["checked_permissions"][next_agent] = has_access
-            
-            if has_access:
-                # Access granted
-                return next_agent
-            else:
-                # Access denied - fall back to basic query
-                state["access_control"]["access_denied"] = True
-                state["next_agent"] = "basic_query"
-                return "basic_query"
-        
-        def retrieve_context(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Retrieve relevant context from knowledge base and knowledge graph."""
-            routing_result = state["context"].get("routing", {})
-            agent_name = state["next_agent"]
-            parameters = routing_result.get("parameters", {})
-            
-            # Initialize context containers
-            kb_context = []
-            kg_insights = []
-            
-            # Check user's KB and KG access permissions
-            user = state["user"]
-            has_kb_access = check_permission(user, "kb", "read")
-            has_kg_access = check_permission(user, "kg", "read")
-            
-            # Get context based on the agent type with permission checks
-            if agent_name == "location_recommender":
-                city = parameters.get("city", "")
-                cuisine = parameters.get("cuisine", "")
-                concept = parameters.get("concept", "")
-                demographic = parameters.get("demographic", "")
+        # Add more details from properties if available
+        if properties:
+            foot_traffic, competition, growth, rent, popular_cuisines, demographics = _location_fields(properties)
+            parts = [LOCATION_DETAILS_TEMPLATE.format(
+                area=area, score=score, foot_traffic=foot_traffic,
+                competition=competition, growth=growth, rent=rent
+            )]
+            
+            # Add popular cuisines if available
+            if popular_cuisines:
+                parts.append(f"  - Popular Cuisines: {', '.join(popular_cuisines)}\n")
                 
-                # Get relevant documents from knowledge base if permission granted
-                if has_kb_access and city:
-                    # Create a more specific query using all available parameters
-                    query_parts = [f"restaurant locations in {city}"]
-                    if cuisine:
-                        query_parts.append(f"{cuisine} cuisine")
-                    if concept:
-                        query_parts.append(f"{concept} restaurant concept")
-                    if demographic:
-                        query_parts.append(f"for {demographic} demographic")
-                    
-                    query = " ".join(query_parts) + " commercial real estate market insights foot traffic"
-                    
-                    # Perform a hybrid search for more relevant results
-                    kb_docs = self.kb.hybrid_search(
-                        query, 
-                        user_filter={"metadata.type": {"$in": ["real_estate", "demographics", "food_consumption"]}}
-                    )
-                    kb_context = [doc.page_content for doc in kb_docs]
-                
-                # Get insights from knowledge graph if permission granted
-                if has_kg_access and city and self.kg:
-                    # Get detailed location recommendations
-                    locations = self.kg.recommend_locations(city, cuisine_type=cuisine)
-                    
-                    # Format location insights with more details
-                    for loc in locations:
-                        area = loc.get('area', '')
-                        score = loc.get('score', 0)
-                        properties = loc.get('properties', {})
-                        
-                        insight = f"Location: {area} - Overall Score: {score:.2f}\n"
-                        
-                        # Add more details from properties if available
-                        if properties:
-                            foot_traffic = properties.get('foot_traffic', 0)
-                            competition = properties.get('competition_score', 0)
-                            growth = properties.get('growth_potential', 0)
-                            rent = properties.get('rent_score', 0)
-                            
-                            insight += f"  - Foot Traffic: {foot_traffic:.2f}\n"
-                            insight += f"  - Competition Level: {competition:.2f}\n"
-                            insight += f"  - Growth Potential: {growth:.2f}\n"
-                            insight += f"  - Rent Value (lower is better): {rent:.2f}\n"
-                            
-                            # Add popular cuisines if available
-                            popular_cuisines = properties.get('popular_cuisines', [])
-                            if popular_cuisines:
-                                insight += f"  - Popular Cuisines: {', '.join(popular_cuisines)}\n"
-                                
-                            # Add demographics if available
-                            demographics = properties.get('demographics', [])
-                            if demographics:
-                                insight += f"  - Key Demographics: {', '.join(demographics)}\n"
-                        
-                        kg_insights.append(insight)
-                        
-            elif agent_name == "regulatory_advisor":
-                city = parameters.get("city", "")
-                restaurant_type = parameters.get("restaurant_type", "")
-                serves_alcohol = parameters.get("serves_alcohol", "No")
-                
-                # Get relevant documents from knowledge base if permission granted
-                if has_kb_access and city:
-                    # Create a more specific query
-                    query_parts = [f"restaurant regulations in {city}"]
-                    if restaurant_type:
-                        query_parts.append(f"{restaurant_type}")
-                    if serves_alcohol.lower() == "yes":
-                        query_parts.append("liquor license alcohol serving requirements")
-                    
-                    query = " ".join(query_parts) + " licensing permits requirements"
-                    
-                    kb_docs = self.kb.hybrid_search(
-                        query, 
-                        user_filter={"metadata.type": {"$in": ["regulation", "food_consumption"]}}
-                    )
-                    kb_context = [doc.page_content for doc in kb_docs]
-                
-                # Get insights from knowledge graph if permission granted
-                if has_kg_access and city and self.kg:
-                    regulations = self.kg.get_regulatory_info(city)
-                    
-                    for reg in regulations:
-                        reg_type = reg.get('type', '')
-                        description = reg.get('description', '')
-                        authority = reg.get('authority', '')
-                        requirements = reg.get('requirements', [])
-                        timeline = reg.get('timeline', '')
-                        cost = reg.get('cost', '')
-                        renewal = reg.get('renewal', '')
-                        
-                        insight = f"Regulation: {reg_type}\n"
-                        insight += f"Description: {description}\n"
-                        insight += f"Authority: {authority}\n"
-                        
-                        if requirements:
-                            insight += "Requirements:\n"
-                            for req in requirements:
-                                insight += f"  - {req}\n"
-                        
-                        if timeline:
-                            insight += f"Timeline: {timeline}\n"
-                        if cost:
-                            insight += f"Cost: {cost}\n"
-                        if renewal:
-                            insight += f"Renewal: {renewal}\n"
-                        
-                        kg_insights.append(insight)
-            
-            elif agent_name == "market_analysis":
-                city = parameters.get("city", "")
-                cuisine = parameters.get("cuisine", "")
-                concept = parameters.get("concept", "")
-                area = parameters.get("area", "")
-                
-                # Get relevant documents from knowledge base if permission granted
-                if has_kb_access and city:
-                    # Create a more specific query
-                    query_parts = [f"restaurant market analysis in {city}"]
-                    if cuisine:
-                        query_parts.append(f"{cuisine} cuisine")
-                    if concept:
-                        query_parts.append(f"{concept} concept")
-                    if area:
-                        query_parts.append(f"{area} area")
-                    
-                    query = " ".join(query_parts) + " consumer trends competition demographics food preferences"
-                    
-                    kb_docs = self.kb.hybrid_search(
-                        query, 
-                        user_filter={"metadata.type": {"$in": ["food_consumption", "demographics", "real_estate"]}}
-                    )
-                    kb_context = [doc.page_content for doc in kb_docs]
-                    
-                # Get insights from knowledge graph if permission granted
-                if has_kg_access and city and self.kg:
-                    # Get cuisine preferences for the city
-                    cuisine_preferences = self.kg.get_cuisine_preferences(city)
-                    
-                    # Get location demographics
-                    locations = []
-                    if area:
-                        # Use get_detailed_location_info which accepts city and area parameters
-                        locations = self.kg.get_detailed_location_info(city, area)
-                    else:
-                        locations = self.kg.recommend_locations(city)[:3]
-                    
-                    # Format cuisine preferences
-                    cuisine_insights = []
-                    for cuisine_pref in cuisine_preferences:
-                        cuisine_type = cuisine_pref.get('cuisine_type', '')
-                        score = cuisine_pref.get('score', 0)
-                        cuisine_insights.append(f"Cuisine: {cuisine_type} - Popularity Score: {score:.2f}")
-                    
-                    # Format location insights
-                    location_insights = []
-                    for loc in locations:
-                        area_name = loc.get('area', '')
-                        properties = loc.get('properties', {})
-                        
-                        if properties:
-                            foot_traffic = properties.get('foot_traffic', 0)
-                            competition = properties.get('competition_score', 0)
-                            growth = properties.get('growth_potential', 0)
-                            demographics = properties.get('demographics', [])
-                            
-                            insight = f"Area: {area_name}\n"
-                            insight += f"  - Foot Traffic: {foot_traffic:.2f}\n"
-                            insight += f"  - Competition Level: {competition:.2f}\n"
-                            insight += f"  - Growth Potential: {growth:.2f}\n"
-                            
-                            if demographics:
-                                insight += f"  - Key Demographics: {', '.join(demographics)}\n"
-                            
-                            location_insights.append(insight)
-                    
-                    # Combine all insights
-                    kg_insights = []
-                    if cuisine_insights:
-                        kg_insights.append("== Cuisine Preferences ==")
-                        kg_insights.extend(cuisine_insights)
-                    
-                    if location_insights:
-                        kg_insights.append("\n== Location Analysis ==")
-                        kg_insights.extend(location_insights)
-            
-            elif agent_name == "pdf_research":
-                # For PDF research queries, focus on extracting insights from research documents
-                research_topic = parameters.get("research_topic", "")
-                specific_focus = parameters.get("specific_focus", "")
-                city = parameters.get("city", "")
-                
-                if has_kb_access:
-                    # Build a query that will retrieve relevant document content
-                    query_parts = ["restaurant business research"]
-                    if research_topic:
-                        query_parts.append(research_topic)
-                    if specific_focus:
-                        query_parts.append(specific_focus)
-                    if city:
-                        query_parts.append(f"in {city}")
-                    
-                    query = " ".join(query_parts) + " studies reports findings data statistics"
-                    
-                    # Perform knowledge base search with emphasis on research documents
-                    kb_docs = self.kb.hybrid_search(
-                        query,
-                        user_filter={"metadata.type": {"$in": ["research", "food_consumption", "demographics", "real_estate"]}},
-                        k=8  # Get more documents for research queries
-                    )
-                    kb_context = [doc.page_content for doc in kb_docs]
-                
-                if has_kg_access and city and self.kg:
-                    # Get city-specific insights from the knowledge graph
-                    regulations = self.kg.get_regulatory_info(city)
-                    cuisine_preferences = self.kg.get_cuisine_preferences(city)
-                    
-                    # Format insights in a research-oriented way
-                    kg_insights = [
-                        f"=== Research Data for {city} ===",
-                        f"City has {len(regulations)} documented regulatory frameworks",
-                    ]
-                    
-                    # Add cuisine preference data
-                    if cuisine_preferences:
-                        kg_insights.append("\nCuisine Preference Data:")
-                        for pref in cuisine_preferences[:5]:
-                            cuisine_type = pref.get('cuisine_type', '')
-                            score = pref.get('score', 0)
-                            kg_insights.append(f"- {cuisine_type}: {score:.2f} popularity score")
-                    
-                    # Add regulatory data
-                    if regulations:
-                        kg_insights.append("\nRegulatory Framework Overview:")
-                        for reg in regulations[:3]:
-                            reg_type = reg.get('type', '')
-                            authority = reg.get('authority', '')
-                            kg_insights.append(f"- {reg_type} (Governing Body: {authority})")
-                
-            elif agent_name == "domain_specialist":
-                # For domain specialist, get a wide range of context
-                query = state["messages"][-1].content
-                
-                if has_kb_access:
-                    # Extract key terms for better search
-                    domain_keywords = parameters.get("domain_keywords", [])
-                    city = parameters.get("city", "")
-                    
-                    # Create a search query with domain focus
-                    search_query = query
-                    if domain_keywords:
-                        search_query += " " + " ".join(domain_keywords)
-                    if city:
-                        search_query += f" in {city}"
-                    
-                    # Perform knowledge base search
-                    kb_docs = self.kb.hybrid_search(search_query, k=5)
-                    kb_context = [doc.page_content for doc in kb_docs]
-                
-                if has_kg_access and self.kg:
-                    # Get city information if specified
-                    city = parameters.get("city", "")
-                    if city:
-                        # Get city demographics
-                        city_data = self.kg.get_detailed_city_demographics(city)
-                        
-                        if city_data:
-                            kg_insights.append(f"== City Demographics for {city} ==")
-                            kg_insights.append(f"Population: {city_data.get('population', 'Unknown')}")
-                            
-                            if city_data.get('demographics'):
-                                kg_insights.append("Key Demographics:")
-                                for demo in city_data.get('demographics', [])[:3]:
-                                    kg_insights.append(f"- {demo}")
-                            
-                            if city_data.get('key_markets'):
-                                kg_insights.append("Key Markets:")
-                                for market in city_data.get('key_markets', [])[:3]:
-                                    kg_insights.append(f"- {market}")
-                        
-                        # Get cuisine preferences
-                        cuisine_prefs = self.kg.get_cuisine_preferences(city)
-                        if cuisine_prefs:
-                            kg_insights.append(f"\n== Popular Cuisines in {city} ==")
-                            for pref in cuisine_prefs[:3]:
-                                cuisine_type = pref.get('cuisine_type', '')
-                                popularity = pref.get('popularity', 0)
-                                kg_insights.append(f"- {cuisine_type}: {popularity} popularity score")
-            
-            else:  # basic_query or fallback
-                # For basic queries, get more comprehensive information
-                query = state["messages"][-1].content
-                
-                # Extract city names from query
-                city = None
-                city_names = ["mumbai", "delhi", "bangalore", "chennai", "hyderabad", "kolkata", "pune", "ahmedabad"]
-                query_lower = query.lower()
-                for city_name in city_names:
-                    if city_name in query_lower:
-                        city = city_name.title()
-                        break
-                
-                # Basic access with limited knowledge
-                if has_kb_access:
-                    # Perform knowledge base search
-                    kb_docs = self.kb.hybrid_search(query, k=3)  # Reduced for basic access
-                    kb_context = [doc.page_content for doc in kb_docs]
-                
-                # Limited knowledge graph access
-                if has_kg_access and city and self.kg:
-                    # Get some basic city information
-                    regulations = self.kg.get_regulatory_info(city)
-                    locations = self.kg.recommend_locations(city)[:3]  # Limited locations
-                    cuisine_preferences = self.kg.get_cuisine_preferences(city)[:3]  # Limited cuisine preferences
-                    
-                    # Format basic insights
-                    kg_insights = [
-                        f"City: {city}",
-                        f"Number of regulations: {len(regulations)}",
-                        f"Top locations: {', '.join([loc.get('area', '') for loc in locations])}",
-                        f"Popular cuisines: {', '.join([pref.get('cuisine_type', '') for pref in cuisine_preferences])}"
-                    ]
-            
-            # Store retrieved context, ensuring not to exceed token limits
-            state["context"]["kb_context"] = "\n\n".join(kb_context[:5])  # Limit context
-            state["context"]["kg_insights"] = "\n\n".join(kg_insights[:8])  # Limit insights
-            
-            # Store sources from documents
-            sources = []
-            if kb_docs:
-                for doc in kb_docs:
-                    source_info = {
-                        "file_name": doc.metadata.get("file_name", "Unknown"),
-                        "category": doc.metadata.get("category", "general"),
-                        "page": doc.metadata.get("page_number", 0),
-                        "chunk_id": doc.metadata.get("chunk_id", 0)
-                    }
-                    if source_info not in sources:
-                        sources.append(source_info)
-            
-            state["context"]["sources"] = sources
-            
-            # Store context in memory for future reference
-            user_id = state["user"]["username"]
-            state["memory"][user_id] = state["memory"].get(user_id, {})
-            state["memory"][user_id]["last_kb_context"] = kb_context[:2]  # Store limited context
-            state["memory"][user_id]["last_kg_insights"] = kg_insights[:3]  # Store limited insights
-            
-            return state
+            # Add demographics if available
+            if demographics:
+                parts.append(f"  - Key Demographics: {', '.join(demographics)}\n")
+        else:
+            parts = [LOCATION_INSIGHT_TEMPLATE.format(area=area, score=score)]
         
-        def run_location_recommender(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the location recommender agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            kb_context = state["context"].get("kb_context", "")
-            kg_insights = state["context"].get("kg_insights", "")
-            sources = state["context"].get("sources", [])
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            preferences = user_memory.get("preferences", {})
-            
-            # Enhance parameters with user preferences if not explicitly provided
-            if "city" not in parameters and "city" in preferences:
-                parameters["city"] = preferences["city"]
-            if "cuisine" not in parameters and "cuisine" in preferences:
-                parameters["cuisine"] = preferences["cuisine"]
-            
-            response = self.location_recommender.run(parameters, kb_context, kg_insights)
-            
-            # Append sources to response if available
-            if sources:
-                response += "\n\n--- Sources ---\n"
-                for i, source in enumerate(sources[:5], 1):
-                    response += f"{i}. {source['file_name']} (Category: {source['category']}, Page: {source['page']})\n"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["last_sources"] = sources
-            
-            return state
+        kg_insights.append("".join(parts))
+    
+    return kg_insights
+
+def _retrieve_regulatory_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for licensing and regulation context on the target city."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    # Create a more specific query
+    search_query = build_search_query(
+        "regulatory",
+        city=city,
+        restaurant_type=parameters.get("restaurant_type", ""),
+        alcohol=parameters.get("serves_alcohol", "No").lower() == "yes"
+    )
+    
+    return search(search_query, user_filter=KB_FILTERS["regulatory"], partition="regulatory")
+
+def _retrieve_regulatory_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Describe the regulations that apply in the target city."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    kg_insights = []
+    regulations = kg.get_regulatory_info(city)
+    
+    for reg in regulations:
+        requirements = reg.get('requirements', [])
+        timeline = reg.get('timeline', '')
+        cost = reg.get('cost', '')
+        renewal = reg.get('renewal', '')
         
-        def run_regulatory_advisor(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the regulatory advisor agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            kb_context = state["context"].get("kb_context", "")
-            kg_insights = state["context"].get("kg_insights", "")
-            sources = state["context"].get("sources", [])
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            response = self.regulatory_advisor.run(parameters, kb_context, kg_insights)
-            
-            # Append sources to response if available
-            if sources:
-                response += "\n\n--- Sources ---\n"
-                for i, source in enumerate(sources[:5], 1):
-                    response += f"{i}. {source['file_name']} (Category: {source['category']}, Page: {source['page']})\n"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["last_sources"] = sources
-            
-            return state
+        parts = [REGULATION_INSIGHT_TEMPLATE.format(
+            type=reg.get('type', ''),
+            description=reg.get('description', ''),
+            authority=reg.get('authority', '')
+        )]
         
-        def run_market_analysis(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the market analysis agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            kb_context = state["context"].get("kb_context", "")
-            kg_insights = state["context"].get("kg_insights", "")
-            sources = state["context"].get("sources", [])
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            response = self.market_analysis.run(parameters, kb_context, kg_insights)
-            
-            # Append sources to response if available
-            if sources:
-                response += "\n\n--- Sources ---\n"
-                for i, source in enumerate(sources[:5], 1):
-                    response += f"{i}. {source['file_name']} (Category: {source['category']}, Page: {source['page']})\n"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["last_sources"] = sources
-            
-            return state
+        if requirements:
+            parts.append("Requirements:\n")
+            parts.extend(f"  - {req}\n" for req in requirements)
         
-        def run_consumer_survey(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the external consumer survey agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            query = state["messages"][-1].content if state["messages"] else ""
-            
-            city = parameters.get("city", "Chennai")
-            demographic = parameters.get("demographic", "all")
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Run external consumer survey agent
-            result = self.external_consumer_survey.run(query, location=city, demographic=demographic)
-            
-            # Format response
-            response = f"**Consumer Survey Insights for {city}**\n\n"
-            response += f"{result['preferences']['analysis']}\n\n"
-            response += f"**Dining Frequency**: {result['dining_frequency']['weekly_dineout_frequency']}\n\n"
-            response += f"**Delivery Trends**: Delivery adoption at {result['delivery_trends']['delivery_adoption_rate']}%\n\n"
-            response += f"**Dietary Trends**: {result['dietary_trends']['analysis'][:300]}..."
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["consumer_data"] = result
-            
-            return state
+        if timeline:
+            parts.append(f"Timeline: {timeline}\n")
+        if cost:
+            parts.append(f"Cost: {cost}\n")
+        if renewal:
+            parts.append(f"Renewal: {renewal}\n")
         
-        def run_real_estate(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the external real estate agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            query = state["messages"][-1].content if state["messages"] else ""
-            
-            city = parameters.get("city", "Chennai")
-            locality = parameters.get("locality", "downtown")
-            restaurant_type = parameters.get("restaurant_type", "casual_dining")
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Run external real estate agent
-            result = self.external_real_estate.run(query, city=city, locality=locality, restaurant_type=restaurant_type)
-            
-            # Format response
-            response = f"**Real Estate Analysis for {locality}, {city}**\n\n"
-            response += f"**Rental Costs**: ₹{result['rental_data']['rental_cost_per_sqft_monthly']['average']}/sqft/month\n"
-            response += f"Range: ₹{result['rental_data']['rental_cost_per_sqft_monthly']['min']} - ₹{result['rental_data']['rental_cost_per_sqft_monthly']['max']}\n\n"
-            response += f"**Foot Traffic**: {result['foot_traffic']['foot_traffic_level']}\n\n"
-            response += f"**Viability Analysis**:\n{result['viability_analysis']['analysis']}"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["real_estate_data"] = result
-            
-            return state
+        kg_insights.append("".join(parts))
+    
+    return kg_insights
+
+def _retrieve_market_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for consumer and competition context on the target market."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    # Create a more specific query
+    search_query = build_search_query(
+        "market",
+        city=city,
+        cuisine=parameters.get("cuisine", ""),
+        concept=parameters.get("concept", ""),
+        area=parameters.get("area", "")
+    )
+    
+    return search(search_query, user_filter=KB_FILTERS["market"], partition="market")
+
+def _retrieve_market_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Describe cuisine preferences and location demographics for the target market."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    area = parameters.get("area", "")
+    
+    # Get location demographics
+    if area:
+        # Use get_detailed_location_info which accepts city and area parameters
+        cuisine_preferences = kg.get_cuisine_preferences(city)
+        locations = kg.get_detailed_location_info(city, area)
+    else:
+        # Cuisine preferences and top locations in one round trip
+        bundle = kg.get_city_bundle(city, ("cuisine", "locations"), location_limit=3)
+        cuisine_preferences = bundle["cuisine"]
+        locations = bundle["locations"]
+    
+    # Format cuisine preferences
+    cuisine_insights = []
+    for cuisine_pref in cuisine_preferences:
+        cuisine_type = cuisine_pref.get('cuisine_type', '')
+        score = cuisine_pref.get('score', 0)
+        cuisine_insights.append(f"Cuisine: {cuisine_type} - Popularity Score: {score:.2f}")
+    
+    # Format location insights
+    location_insights = []
+    for loc in locations:
+        area_name = loc.get('area', '')
+        properties = loc.get('properties', {})
         
-        def run_demographics(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the external demographics agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            query = state["messages"][-1].content if state["messages"] else ""
-            
-            city = parameters.get("city", "Chennai")
-            restaurant_type = parameters.get("restaurant_type", "casual_dining")
+        if properties:
+            foot_traffic, competition, growth, _, _, demographics = _location_fields(properties)
             
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
+            parts = [MARKET_AREA_TEMPLATE.format(
+                area=area_name, foot_traffic=foot_traffic, competition=competition, growth=growth
+            )]
             
-            # Run external demographics agent
-            result = self.external_demographics.run(query, city=city, restaurant_type=restaurant_type)
+            if demographics:
+                parts.append(f"  - Key Demographics: {', '.join(demographics)}\n")
             
-            # Format response
-            response = f"**Demographic & Economic Analysis for {city}**\n\n"
-            response += f"**Population**: {result['demographics']['population']:,}\n"
-            response += f"**Median Age**: {result['demographics']['median_age']} years\n"
-            response += f"**GDP Per Capita**: ${result['economic_indicators']['gdp_per_capita_usd']:,}\n"
-            response += f"**Avg Monthly Income**: ₹{result['economic_indicators']['avg_monthly_income_inr']:,}\n\n"
-            response += f"**Purchasing Power**: Monthly dining budget ~ ₹{result['purchasing_power']['estimated_monthly_dining_budget']}\n\n"
-            response += f"**Target Demographics Analysis**:\n{result['target_analysis']['analysis']}"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["demographics_data"] = result
-            
-            return state
+            location_insights.append("".join(parts))
+    
+    # Combine all insights
+    kg_insights = []
+    if cuisine_insights:
+        kg_insights.append("== Cuisine Preferences ==")
+        kg_insights.extend(cuisine_insights)
+    
+    if location_insights:
+        kg_insights.append("\n== Location Analysis ==")
+        kg_insights.extend(location_insights)
+    
+    return kg_insights
+
+def _retrieve_pdf_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for research documents on the requested topic."""
+    # Build a query that will retrieve relevant document content
+    search_query = build_search_query(
+        "pdf",
+        research_topic=parameters.get("research_topic", ""),
+        specific_focus=parameters.get("specific_focus", ""),
+        city=parameters.get("city", "")
+    )
+    
+    # Perform knowledge base search with emphasis on research documents
+    return search(
+        search_query,
+        user_filter=KB_FILTERS["pdf"],
+        k=8,  # Get more documents for research queries
+        partition="pdf"
+    )
+
+def _retrieve_pdf_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Summarize the city's cuisine and regulatory data in a research-oriented way."""
+    city = parameters.get("city", "")
+    if not city:
+        return []
+    
+    # Get city-specific insights from the knowledge graph in one round trip
+    bundle = kg.get_city_bundle(city, ("regulations", "cuisine"), regulation_limit=3)
+    regulations = bundle["regulations"]
+    cuisine_preferences = bundle["cuisine"]
+    
+    # Format insights in a research-oriented way
+    kg_insights = [
+        f"=== Research Data for {city} ===",
+        f"City has {bundle['regulation_count']} documented regulatory frameworks",
+    ]
+    
+    # Add cuisine preference data
+    if cuisine_preferences:
+        kg_insights.append("\nCuisine Preference Data:")
+        for pref in cuisine_preferences[:5]:
+            cuisine_type = pref.get('cuisine_type', '')
+            score = pref.get('score', 0)
+            kg_insights.append(f"- {cuisine_type}: {score:.2f} popularity score")
+    
+    # Add regulatory data
+    if regulations:
+        kg_insights.append("\nRegulatory Framework Overview:")
+        for reg in regulations:
+            reg_type = reg.get('type', '')
+            authority = reg.get('authority', '')
+            kg_insights.append(f"- {reg_type} (Governing Body: {authority})")
+    
+    return kg_insights
+
+def _retrieve_domain_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for the query, biased towards the routed domain keywords."""
+    # Create a search query with domain focus
+    search_query = build_search_query(
+        "domain",
+        query=query,
+        domain_keywords=" ".join(parameters.get("domain_keywords", [])),
+        city=parameters.get("city", "")
+    )
+    
+    # Perform knowledge base search
+    return search(search_query, k=5)
+
+def _retrieve_domain_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Describe the demographics and popular cuisines of the city, if one is given."""
+    kg_insights = []
+    # Get city information if specified
+    city = parameters.get("city", "")
+    if city:
+        # City demographics and cuisine preferences in one round trip
+        bundle = kg.get_city_bundle(city, ("demographics", "cuisine"))
+        city_data = bundle["demographics"]
         
-        def run_market_research(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the external market research agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            query = state["messages"][-1].content if state["messages"] else ""
-            
-            city = parameters.get("city", "Chennai")
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Run external market research agent
-            result = self.external_market_research.run(query, location=city)
-            
-            # Format response
-            response = f"**Market Research Insights for {city}**\n\n"
-            response += f"**Industry Statistics**:\n"
-            response += f"- Market Size: ${result['industry_stats']['market_size_usd_billion']}B\n"
-            response += f"- Growth Rate: {result['industry_stats']['projected_growth_rate_percent']}%\n\n"
-            response += f"**Market Analysis**:\n{result['analysis']['analysis']}"
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            state["memory"][user_id]["market_research_data"] = result
-            
-            return state
+        if city_data:
+            kg_insights.append(f"== City Demographics for {city} ==")
+            kg_insights.append(f"Population: {city_data.get('population', 'Unknown')}")
+            
+            if city_data.get('demographics'):
+                kg_insights.append("Key Demographics:")
+                for demo in city_data.get('demographics', [])[:3]:
+                    kg_insights.append(f"- {demo}")
+            
+            if city_data.get('key_markets'):
+                kg_insights.append("Key Markets:")
+                for market in city_data.get('key_markets', [])[:3]:
+                    kg_insights.append(f"- {market}")
         
-        def run_pdf_research(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the PDF research agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            query = state["messages"][-1].content if state["messages"] else ""
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            response = self.pdf_research.run(query, parameters)
-            
-            # Format the response for better readability
-            formatted_response = f"""# Market Analysis Results
+        # Add cuisine preferences
+        cuisine_prefs = bundle["cuisine"]
+        if cuisine_prefs:
+            kg_insights.append(f"\n== Popular Cuisines in {city} ==")
+            for pref in cuisine_prefs[:3]:
+                cuisine_type = pref.get('cuisine_type', '')
+                popularity = pref.get('popularity', 0)
+                kg_insights.append(f"- {cuisine_type}: {popularity} popularity score")
+    
+    return kg_insights
 
-## Market Potential
-Score: {response.get('market_potential', {}).get('score', 'N/A')}/10
-{response.get('market_potential', {}).get('reasoning', 'No data available')}
+def _retrieve_basic_kb(search: Callable[..., List[Document]], parameters: Dict[str, Any], query: str) -> List[Document]:
+    """Search the KB for the raw query, with a reduced result count for basic access."""
+    return search(query, k=3)
 
-## Competition Analysis
-Saturation Level: {response.get('competition_analysis', {}).get('saturation_level', 'N/A')}
-Major Competitors: {', '.join(response.get('competition_analysis', {}).get('major_competitors', ['None identified']))}
+def _retrieve_basic_kg(kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str) -> List[str]:
+    """Give a short overview of the first city mentioned in the query."""
+    # Extract the first city name mentioned in the query
+    city_match = _CITY_PATTERN.search(query.lower())
+    if not city_match:
+        return []
+    city = city_match.group(0).title()
+    
+    # Get some basic city information in one round trip
+    # Only the number of regulations is shown, so none are transferred
+    bundle = kg.get_city_bundle(city, location_limit=3, regulation_limit=0)  # Limited locations
+    locations = bundle["locations"]
+    cuisine_preferences = bundle["cuisine"][:3]  # Limited cuisine preferences
+    
+    # Format basic insights
+    return [
+        f"City: {city}",
+        f"Number of regulations: {bundle['regulation_count']}",
+        f"Top locations: {', '.join([loc.get('area', '') for loc in locations])}",
+        f"Popular cuisines: {', '.join([pref.get('cuisine_type', '') for pref in cuisine_preferences])}"
+    ]
 
-Differentiation Opportunities:
-{chr(10).join('- ' + item for item in response.get('competition_analysis', {}).get('differentiation_opportunities', ['None identified']))}
+# Context retrievers per agent; agents not listed (basic_query and fallbacks) get the basic retrievers
+RETRIEVERS: Dict[str, Tuple[KBRetriever, KGRetriever]] = {
+    "location_recommender": (_retrieve_location_kb, _retrieve_location_kg),
+    "regulatory_advisor": (_retrieve_regulatory_kb, _retrieve_regulatory_kg),
+    "market_analysis": (_retrieve_market_kb, _retrieve_market_kg),
+    "pdf_research": (_retrieve_pdf_kb, _retrieve_pdf_kg),
+    "domain_specialist": (_retrieve_domain_kb, _retrieve_domain_kg),
+}
+BASIC_RETRIEVERS: Tuple[KBRetriever, KGRetriever] = (_retrieve_basic_kb, _retrieve_basic_kg)
+# KG retrievers that read the query; the others depend only on the routing parameters
+QUERY_DEPENDENT_KG_RETRIEVERS = frozenset({_retrieve_basic_kg})
 
-## Consumer Trends
-Relevant Trends:
-{chr(10).join('- ' + item for item in response.get('consumer_trends', {}).get('relevant_trends', ['No trends identified']))}
+# Agents whose retrievers read only the routing parameters, not the query, so a follow-up
+# routed to the same agent with a subset of the previous parameters can reuse its context
+FOLLOW_UP_AGENTS = frozenset({"location_recommender", "regulatory_advisor", "market_analysis", "pdf_research"})
 
-Recommendations:
-{chr(10).join('- ' + item for item in response.get('consumer_trends', {}).get('recommendations', ['No recommendations available']))}
+@dataclass(slots=True, frozen=True)
+class RetrievedContext:
+    """Context retrieved for one of a user's turns, kept for follow-up turns."""
+    parameters: Dict[str, Any]
+    kb_context: str
+    kg_insights: str
+    sources: List[Dict[str, Any]]
 
-## Pricing Strategy
-Recommended Price Point: {response.get('pricing_strategy', {}).get('recommended_price_point', 'N/A')}
-{response.get('pricing_strategy', {}).get('reasoning', 'No reasoning provided')}
+def _document_sources(docs: List[Document]) -> List[Dict[str, Any]]:
+    """Source citations of the retrieved documents, one per distinct document chunk."""
+    sources = []
+    seen_sources = set()
+    for doc in docs:
+        metadata = doc.metadata
+        source_key = (
+            metadata.get("file_name", "Unknown"),
+            metadata.get("category", "general"),
+            metadata.get("page_number", 0),
+            metadata.get("chunk_id", 0)
+        )
+        if source_key in seen_sources:
+            continue
+        seen_sources.add(source_key)
+        file_name, category, page, chunk_id = source_key
+        sources.append({"file_name": file_name, "category": category, "page": page, "chunk_id": chunk_id})
+    return sources
 
-## Risk Factors
-{chr(10).join('- ' + item.get('factor', '') + ': ' + item.get('mitigation', '') for item in response.get('risk_factors', [{'factor': 'No risk factors identified', 'mitigation': ''}]))}
-"""
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=formatted_response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = formatted_response
-            
-            return state
-            
-        def run_pdf_research(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the PDF research agent."""
-            latest_message = state["messages"][-1]
-            if not isinstance(latest_message, HumanMessage):
-                return state
-                
-            query = latest_message.content
-            kb_context = state["context"].get("kb_context", "")
-            kg_insights = state["context"].get("kg_insights", "")
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Get response from the PDF research agent
-            response = self.pdf_research.run(query, kg_insights)
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            
-            return state
-        
-        def run_domain_specialist(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the domain specialist agent."""
-            routing_result = state["context"].get("routing", {})
-            parameters = routing_result.get("parameters", {})
-            kb_context = state["context"].get("kb_context", "")
-            kg_insights = state["context"].get("kg_insights", "")
-            
-            # Get the latest message
-            latest_message = state["messages"][-1]
-            if not isinstance(latest_message, HumanMessage):
-                return state
-                
-            query = latest_message.content
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Get response from the domain specialist agent
-            response = self.domain_specialist.run(query, parameters, kb_context, kg_insights)
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            
-            return state
-        
-        def run_basic_query(state: EnhancedAgentState) -> EnhancedAgentState:
-            """Run the basic query agent."""
-            latest_message = state["messages"][-1]
-            if not isinstance(latest_message, HumanMessage):
-                return state
-                
-            query = latest_message.content
-            kb_context = state["context"].get("kb_context", "")
-            
-            # Get user memory context
-            user_id = state["user"]["username"]
-            user_memory = state["memory"].get(user_id, {})
-            
-            # Check if access was denied to another agent
-            if state["access_control"].get("access_denied"):
-                response = f"""I'm sorry, but you don't have access to that functionality with your current permissions.
-                
-Your query has been processed with limited access. Here's what I can tell you:
+def _normalize_query(query: str) -> str:
+    """Lowercase a query and drop punctuation and repeated whitespace, for cache keys."""
+    return _WHITESPACE_PATTERN.sub(" ", _PUNCTUATION_PATTERN.sub(" ", query.lower())).strip()
 
-{self.basic_query.run(query, kb_context)}
+def _dump_key(value: Any) -> Union[bytes, str]:
+    """Serialize a dict used in a cache key, with sorted keys so equal dicts give equal keys."""
+    if orjson is not None:
+        return orjson.dumps(value, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, sort_keys=True, default=str)
 
-For more detailed information, please contact your administrator to upgrade your access level."""
-            else:
-                response = self.basic_query.run(query, kb_context)
-            
-            # Add the response to messages
-            state["messages"].append(AIMessage(content=response))
-            
-            # Store response in memory
-            state["memory"][user_id]["last_response"] = response
-            
-            return state
+def _search_key(query: str, user_filter: Optional[Dict] = None, k: int = 5, partition: Optional[str] = None):
+    """Cache key for a hybrid_search call; the metadata filter is a dict, so key on its serialization."""
+    return hashkey(_normalize_query(query), _dump_key(user_filter), k, partition)
+
+def _external_key(agent_name: str, query: str, **kwargs: Any):
+    """Cache key for an external agent call: its arguments, and the normalized query if the agent reads it."""
+    agent_query = _normalize_query(query) if agent_name in QUERY_DEPENDENT_EXTERNAL_AGENTS else None
+    return hashkey(agent_name, agent_query, *sorted(kwargs.items()))
+
+def _is_failed_result(result: Any) -> bool:
+    """Whether an external agent's result, or any of its top-level sections, is an error payload.
+    
+    The external agents catch their own API and LLM failures and return them as
+    {"error": ...} sections instead of raising, so such results must not be cached.
+    """
+    if not isinstance(result, dict):
+        return False
+    return "error" in result or any(isinstance(section, dict) and "error" in section for section in result.values())
+
+def _kg_key(retrieve_kg: KGRetriever, kg: Neo4jKnowledgeGraph, parameters: Dict[str, Any], query: str):
+    """Cache key for a KG retriever run: its parameters, and the normalized query if the retriever reads it.
+    
+    Parameters may hold lists, so they are keyed on their serialization.
+    """
+    kg_query = _normalize_query(query) if retrieve_kg in QUERY_DEPENDENT_KG_RETRIEVERS else None
+    return hashkey(retrieve_kg.__name__, _dump_key(parameters), kg_query)
+
+def _retrieve_kg_in_session(retrieve_kg: KGRetriever, kg: Neo4jKnowledgeGraph,
+                            parameters: Dict[str, Any], query: str) -> List[str]:
+    """Run a KG retriever with all of its lookups sharing one Neo4j session."""
+    with kg.request_session():
+        return retrieve_kg(kg, parameters, query)
+
+@dataclass(slots=True)
+class GraphContext:
+    """Per-run dependencies of the shared agent graph."""
+    orchestrator: "EnhancedAgentOrchestrator"
+
+def _node(method: Callable) -> Callable:
+    """Adapt an orchestrator method into a graph node that calls it on the run's orchestrator."""
+    name = method.__name__
+    if asyncio.iscoroutinefunction(method):
+        async def run_node(state: EnhancedAgentState, runtime: Runtime[GraphContext]) -> EnhancedAgentState:
+            return await getattr(runtime.context.orchestrator, name)(state)
+    else:
+        def run_node(state: EnhancedAgentState, runtime: Runtime[GraphContext]) -> EnhancedAgentState:
+            return getattr(runtime.context.orchestrator, name)(state)
+    run_node.__name__ = name
+    return run_node
+
+class EnhancedAgentOrchestrator:
+    """Enhanced orchestrator for the multi-agent system with advanced routing and memory."""
+    
+    # Compiled on first use per role (None for the unrestricted graph) and shared by every orchestrator
+    _graphs: ClassVar[Dict[Optional[str], CompiledStateGraph]] = {}
+    
+    # Agents keep no per-conversation state, so one set, built on first use, serves every orchestrator
+    _agents: ClassVar[Dict[str, Any]] = {}
+    _agents_lock: ClassVar[threading.Lock] = threading.Lock()
+    
+    # External agents' results depend only on their arguments, so every orchestrator shares them
+    _external_cache: ClassVar[TTLCache] = TTLCache(maxsize=2048, ttl=3600)
+    _external_cache_lock: ClassVar[threading.Lock] = threading.Lock()
+    
+    # Blocking calls run on threads that stay warm across turns; run() would otherwise start
+    # and tear down a fresh default executor with every event loop. Apps like Streamlit build
+    # an orchestrator per session, so the pool is shared rather than started by each of them
+    _executor: ClassVar[ThreadPoolExecutor] = ThreadPoolExecutor(
+        max_workers=BLOCKING_WORKERS, thread_name_prefix="orchestrator"
+    )
+    
+    def __init__(self, kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph, speculative: bool = False,
+                 memory_store: Optional[MemoryStore] = None, result_store: Optional[PersistentResultCache] = None):
+        """Initialize the orchestrator.
         
-        # Build the graph
-        workflow = StateGraph(EnhancedAgentState)
-        
-        # Add nodes
-        workflow.add_node("initialize", initialize_state)
-        workflow.add_node("route_query", route_query)
-        workflow.add_node("retrieve_context", retrieve_context)
-        workflow.add_node("location_recommender", run_location_recommender)
-        workflow.add_node("regulatory_advisor", run_regulatory_advisor)
-        workflow.add_node("market_analysis", run_market_analysis)
-        workflow.add_node("consumer_survey", run_consumer_survey)
-        workflow.add_node("real_estate", run_real_estate)
-        workflow.add_node("demographics", run_demographics)
-        workflow.add_node("market_research", run_market_research)
-        workflow.add_node("pdf_research", run_pdf_research)
-        workflow.add_node("domain_specialist", run_domain_specialist)
-        workflow.add_node("basic_query", run_basic_query)
-        
-        # Add edges
-        workflow.add_edge("initialize", "route_query")
-        workflow.add_edge("route_query", "retrieve_context")
-        
-        # Create a router function that returns the next agent as a string
-        def router_func(state):
-            return check_permissions_and_route(state)
-            
-        # Add conditional edges based on agent selection
-        workflow.add_conditional_edges(
-            "retrieve_context",
-            router_func,
-            {
-                "location_recommender": "location_recommender",
-                "regulatory_advisor": "regulatory_advisor",
-                "market_analysis": "market_analysis",
-                "consumer_survey": "consumer_survey",
-                "real_estate": "real_estate",
-                "demographics": "demographics",
-                "market_research": "market_research",
-                "pdf_research": "pdf_research",
-                "domain_specialist": "domain_specialist",
-                "basic_query": "basic_query"
-            }
+        Args:
+            kb: Knowledge base searched for agent context
+            kg: Knowledge graph queried for agent insights
+            speculative: For multi-intent queries, answer with whichever routed agent
+                finishes first instead of merging all of their answers
+            memory_store: Optional SQLite store persisting user memory as messages arrive;
+                without one, memory is saved to and loaded from a JSON file on request
+            result_store: Optional on-disk cache of external agent results, so they
+                outlive the process
+        """
+        self.kb = kb
+        self.kg = kg
+        self.speculative = speculative
+        
+        # Searches and KG lookups repeated by recent requests (up to case, punctuation and
+        # spacing) share results; the KB changes as documents are ingested, so it expires sooner.
+        # Cache misses from concurrent requests are batched into one embedding call.
+        self._kb_search_cache = TTLCache(maxsize=1024, ttl=300)
+        self._search_kb = cached(self._kb_search_cache, key=_search_key, lock=threading.Lock())(
+            self.kb.search_batcher.hybrid_search
+        )
+        self._kg_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._retrieve_kg = cached(self._kg_cache, key=_kg_key, lock=threading.Lock())(
+            _retrieve_kg_in_session
         )
+        # Context of each user's recent turns per (user, agent, city, cuisine), for follow-ups
+        self._follow_up_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+        self._follow_up_lock = threading.Lock()
+        # Results missing from the shared in-memory cache are looked up in the result store before calling the agent
+        self.result_store = result_store
+        
+        agents = self.shared_agents()
         
-        workflow.add_edge("location_recommender", END)
-        workflow.add_edge("regulatory_advisor", END)
-        workflow.add_edge("market_analysis", END)
-        workflow.add_edge("consumer_survey", END)
-        workflow.add_edge("real_estate", END)
-        workflow.add_edge("demographics", END)
-        workflow.add_edge("market_research", END)
-        workflow.add_edge("pdf_research", END)
-        workflow.add_edge("domain_specialist", END)
-        workflow.add_edge("basic_query", END)
+        # Initialize memory manager; long conversations are summarized in the background
+        self.summarizer = agents["summarizer"]
+        self.memory_manager = MemoryManager(store=memory_store, summarize=self.summarizer.run)
+        
+        # Graph states are reset and reused across turns instead of rebuilt each time
+        self._state_pool: "queue.LifoQueue[EnhancedAgentState]" = queue.LifoQueue(maxsize=STATE_POOL_SIZE)
+        
+        # Initialize agents
+        self.router = agents["router"]
+        self.location_recommender = agents["location_recommender"]
+        self.regulatory_advisor = agents["regulatory_advisor"]
+        self.market_analysis = agents["market_analysis"]
+        self.pdf_research = agents["pdf_research"]
+        self.basic_query = agents["basic_query"]
+        self.domain_specialist = agents["domain_specialist"]
+        
+        # Initialize external data agents
+        self.external_market_research = agents["external_market_research"]
+        self.external_consumer_survey = agents["external_consumer_survey"]
+        self.external_real_estate = agents["external_real_estate"]
+        self.external_demographics = agents["external_demographics"]
+        self.document_manager = agents["document_manager"]
+    
+    @classmethod
+    def shared_agents(cls) -> Dict[str, Any]:
+        """The agents used by every orchestrator, keyed by attribute name; built once per process.
+        
+        Their clients and response caches are thread-safe, so concurrent sessions share
+        them (and each other's cached responses) instead of each building their own.
+        """
+        with cls._agents_lock:
+            if not cls._agents:
+                cls._agents.update(
+                    summarizer=ConversationSummarizerAgent(),
+                    router=RoutingAgent(),
+                    location_recommender=LocationRecommenderAgent(),
+                    regulatory_advisor=RegulatoryAdvisorAgent(),
+                    market_analysis=MarketAnalysisAgent(),
+                    pdf_research=PDFResearchAgent(),
+                    basic_query=BasicQueryAgent(),
+                    domain_specialist=DomainSpecialistAgent(),
+                    external_market_research=ExternalMarketResearchAgent(),
+                    external_consumer_survey=ExternalConsumerSurveyAgent(),
+                    external_real_estate=ExternalRealEstateAgent(),
+                    external_demographics=ExternalDemographicsAgent(),
+                    document_manager=DocumentIngestionManager()
+                )
+            return cls._agents
+    
+    @property
+    def graph(self) -> CompiledStateGraph:
+        """The unrestricted agent graph, built once per process."""
+        return self.graph_for_role(None)
+    
+    @classmethod
+    def graph_for_role(cls, role: Optional[str]) -> CompiledStateGraph:
+        """The agent graph specialized to a role's permissions, built once per role."""
+        graph = cls._graphs.get(role)
+        if graph is None:
+            graph = cls._graphs[role] = cls.create_agent_graph(role)
+        return graph
+    
+    @classmethod
+    def create_agent_graph(cls, role: Optional[str] = None) -> StateGraph:
+        """Create the enhanced agent graph with advanced routing.
+        
+        Nodes are unbound orchestrator methods; each run passes the orchestrator to use
+        in its GraphContext, so one compiled graph serves every instance.
+        
+        Args:
+            role: Role to specialize the graph for. Agent nodes the role may not use are
+                left out (routing to them ends at access_denied), and routing
+                is not followed by context retrieval when the role can read neither the KB
+                nor the KG.
+                None builds the unrestricted graph.
+            
+        Returns:
+            The compiled graph
+        """
+        mask = ~0 if role is None else permission_mask(role)
+        
+        def allowed(bit: int) -> bool:
+            return bool(mask & bit)
+        
+        # Build the graph
+        workflow = StateGraph(EnhancedAgentState, context_schema=GraphContext)
+        
+        # Agent nodes; basic_query is always present as the fallback for denied agents
+        agent_nodes = {
+            "location_recommender": cls.run_location_recommender,
+            "regulatory_advisor": cls.run_regulatory_advisor,
+            "market_analysis": cls.run_market_analysis,
+            "consumer_survey": cls.run_consumer_survey,
+            "real_estate": cls.run_real_estate,
+            "demographics": cls.run_demographics,
+            "market_research": cls.run_market_research,
+            "pdf_research": cls.run_pdf_research,
+            "domain_specialist": cls.run_domain_specialist,
+        }
+        routes = {
+            agent_name: agent_name for agent_name in agent_nodes
+            if allowed(AGENT_PERMISSION_BITS[agent_name])
+        }
+        routes["basic_query"] = "basic_query"
+        agent_nodes["basic_query"] = cls.run_basic_query
+        routes["access_denied"] = "access_denied"
+        agent_nodes["access_denied"] = cls.respond_access_denied
+        if FAN_OUT_AGENTS.intersection(routes):
+            routes["multi_intent"] = "multi_intent"
+            agent_nodes["multi_intent"] = cls.run_multi_intent
+        
+        # Add nodes; initialization, routing and context retrieval run as one step
+        if any(allowed(bit) for bit in RESOURCE_PERMISSION_BITS.values()):
+            workflow.add_node("prepare", _node(cls.prepare))
+        else:
+            workflow.add_node("prepare", _node(cls.prepare_without_context))
+        for agent_name in routes:
+            workflow.add_node(agent_name, _node(agent_nodes[agent_name]))
+        
+        # Add conditional edges based on agent selection; without a user query there is nothing to answer
+        workflow.add_conditional_edges("prepare", cls.check_query_and_route, {**routes, "end": END})
+        
+        for agent_name in routes:
+            workflow.add_edge(agent_name, END)
         
         # Set the entry point
-        workflow.set_entry_point("initialize")
+        workflow.set_entry_point("prepare")
         
         # Compile the graph
         return workflow.compile()
     
+    def initialize_state(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Initialize the state with necessary components."""
+        # Read the user's query once for every later node
+        latest_message = state["messages"][-1] if state["messages"] else None
+        state["query"] = latest_message.content if isinstance(latest_message, HumanMessage) else None
+        
+        # Initialize subagents list, memory and access control if not present
+        state.setdefault("subagents", [])
+        state.setdefault("memory", {})
+        if "access_control" not in state:
+            state["access_control"] = AccessControl()
+        
+        return state
+    
+    async def prepare(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Initialize the state, route the query and fetch the agent's context in a single node.
+        
+        The three steps always run in order on the same state, so fusing them saves
+        two graph steps per query.
+        """
+        state = self.initialize_state(state)
+        if state["query"] is None:
+            return state
+        return await self.route_and_retrieve(state)
+    
+    async def prepare_without_context(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Like prepare, for roles that can read neither the KB nor the KG, so no context is fetched."""
+        state = self.initialize_state(state)
+        if state["query"] is None:
+            return state
+        return await self.route_query(state)
+    
+    async def route_query(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Route the user's query to the appropriate agent."""
+        # Route the query; only cache lookups that may embed the query leave the event loop
+        query = state["query"]
+        result = await self.router.arun(query, self._executor)
+        
+        # Fan out to the runner-up agent when the router is split between intents
+        ranked_agents = result.get("agents", [])
+        fan_out = []
+        if ranked_agents and ranked_agents[0][1] < MULTI_INTENT_CONFIDENCE and result["agent"] in FAN_OUT_AGENTS:
+            fan_out = [
+                agent_name for agent_name, _ in ranked_agents[1:MAX_FAN_OUT_AGENTS]
+                if agent_name != result["agent"] and agent_name in FAN_OUT_AGENTS
+            ]
+        
+        # Store routing result
+        state["routing"] = RoutingResult(
+            agent=result["agent"], parameters=result.get("parameters", {}), fan_out=fan_out
+        )
+        state["next_agent"] = result["agent"]
+        
+        # Update memory with routing information
+        user_memory = _user_memory(state)
+        user_memory.last_route = result["agent"]
+        user_memory.last_parameters = result["parameters"]
+        
+        return state
+    
+    @staticmethod
+    def check_query_and_route(state: EnhancedAgentState) -> str:
+        """End the run if the user asked nothing, else route to the agent answering the query."""
+        if state["query"] is None:
+            return "end"
+        return EnhancedAgentOrchestrator.check_permissions_and_route(state)
+    
+    @staticmethod
+    def check_permissions_and_route(state: EnhancedAgentState) -> str:
+        """Check if the user has access to the required agent and route accordingly."""
+        next_agent = state["next_agent"]
+        
+        # Check if the agent access is allowed (already checked if retrieval ran in the same node)
+        if _checked_agent_access(state, next_agent):
+            # Access granted; multi-intent queries also need the other agents' answers
+            routing = state.get("routing")
+            if routing is not None and routing.fan_out and routing.agent == next_agent:
+                return "multi_intent"
+            return next_agent
+        else:
+            # Access denied - answer with the static denial, no retrieval or LLM call
+            state["access_control"].access_denied = True
+            return "access_denied"
+    
+    async def _fetch_context(self, agent_name: str, parameters: Dict[str, Any], query: str,
+                             user: Dict) -> Tuple[List[Document], List[str]]:
+        """Fetch the KB documents and KG insights an agent needs, within the user's permissions."""
+        # Check user's KB and KG access permissions
+        has_kb_access = check_permission(user, "kb", "read")
+        has_kg_access = check_permission(user, "kg", "read")
+        
+        # Bind the retrievers for this agent type, skipping sources the user cannot read
+        retrieve_kb, retrieve_kg = RETRIEVERS.get(agent_name, BASIC_RETRIEVERS)
+        fetch_kb = None
+        fetch_kg = None
+        if has_kb_access:
+            fetch_kb = partial(retrieve_kb, self._search_kb, parameters, query)
+        if has_kg_access and self.kg:
+            fetch_kg = partial(self._retrieve_kg, retrieve_kg, self.kg, parameters, query)
+        
+        # Run the KB search and the KG lookups concurrently; if one fails, answer from the other
+        kb_result, kg_result = await asyncio.gather(
+            _run_fetch(fetch_kb, self._executor), _run_fetch(fetch_kg, self._executor), return_exceptions=True
+        )
+        return _fetched_or_empty("KB", kb_result), _fetched_or_empty("KG", kg_result)
+    
+    async def retrieve_context(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Retrieve relevant context from knowledge base and knowledge graph.
+        
+        The routed agent's retrievers come from RETRIEVERS. The KB search and the KG
+        lookups are independent, so they run concurrently and the node waits for the slower one.
+        A follow-up to one of the user's recent turns for the same FOLLOW_UP_AGENTS agent,
+        city and cuisine reuses that turn's context if it adds no new parameters.
+        """
+        agent_name = state["next_agent"]
+        parameters = _routing_parameters(state)
+        query = state["query"]
+        user = state["user"]
+        
+        follow_up_key = None
+        retrieved = None
+        if agent_name in FOLLOW_UP_AGENTS:
+            follow_up_key = (user["username"], agent_name, parameters.get("city", ""), parameters.get("cuisine", ""))
+            with self._follow_up_lock:
+                retrieved = self._follow_up_cache.get(follow_up_key)
+            if retrieved is not None and not parameters.items() <= retrieved.parameters.items():
+                retrieved = None
+        
+        if retrieved is None:
+            kb_docs, kg_insights = await self._fetch_context(agent_name, parameters, query, user)
+            retrieved = RetrievedContext(
+                parameters=dict(parameters),
+                # Ensure the context does not exceed token limits
+                kb_context=join_within_budget((doc.page_content for doc in kb_docs), 5, KB_CONTEXT_CHARS),
+                kg_insights=join_within_budget(kg_insights, 8, KG_INSIGHTS_CHARS),
+                sources=_document_sources(kb_docs)
+            )
+            if follow_up_key is not None:
+                with self._follow_up_lock:
+                    self._follow_up_cache[follow_up_key] = retrieved
+        
+        # Store retrieved context and the sources of its documents
+        state["context"]["kb_context"] = retrieved.kb_context
+        state["context"]["kg_insights"] = retrieved.kg_insights
+        state["context"]["sources"] = retrieved.sources
+        
+        # Store context in memory for future reference
+        user_memory = _user_memory(state)
+        # Keep a signature rather than the text; the context can be re-fetched (and is likely cached)
+        user_memory.last_context_signature = hashlib.blake2b(
+            f"{agent_name}:{query}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        
+        return state
+    
+    async def route_and_retrieve(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Route the query and fetch the routed agent's context in a single node.
+        
+        The router's result fully determines the retrieval plan, so retrieval starts as
+        soon as routing finishes instead of after a separate graph step.
+        """
+        state = await self.route_query(state)
+        
+        # Denied requests never reach an agent, and external agents bring their own data,
+        # so neither needs context fetched
+        next_agent = state["next_agent"]
+        if next_agent in EXTERNAL_AGENTS or not _checked_agent_access(state, next_agent):
+            return state
+        return await self.retrieve_context(state)
+    
+    async def _respond(self, state: EnhancedAgentState, response: Union[str, AsyncIterator[str]],
+                       cite_sources: bool = False, result: Optional[Dict[str, Any]] = None) -> EnhancedAgentState:
+        """Deliver an agent's answer: stream it, add it to the messages and remember it.
+        
+        Args:
+            state: Current graph state
+            response: The agent's streamed response chunks, or the whole response at once
+            cite_sources: Whether to append the retrieved documents as sources
+            result: Raw result the answer was formatted from, remembered alongside it
+            
+        Returns:
+            The updated state
+        """
+        if isinstance(response, str):
+            get_stream_writer()({"token": response})
+        else:
+            response = await _stream_response(response)
+        
+        # Append sources to response if available
+        sources = state["context"].get("sources", []) if cite_sources else []
+        if sources:
+            sources_text = _format_sources(sources)
+            get_stream_writer()({"token": sources_text})
+            response += sources_text
+        
+        # Add the response to messages
+        state["messages"].append(AIMessage(content=response))
+        
+        # Store response in memory
+        user_memory = _user_memory(state)
+        user_memory.last_response = response
+        if cite_sources:
+            user_memory.last_sources = sources
+        if result is not None:
+            user_memory.last_result = result
+        
+        return state
+    
+    async def run_location_recommender(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the location recommender agent."""
+        parameters = _routing_parameters(state)
+        context = state["context"]
+        kb_context = context.get("kb_context", "")
+        kg_insights = context.get("kg_insights", "")
+        
+        # Get user memory context
+        preferences = _user_memory(state).user_context.get("preferences", {})
+        
+        # Enhance parameters with user preferences if not explicitly provided
+        if "city" not in parameters and "city" in preferences:
+            parameters["city"] = preferences["city"]
+        if "cuisine" not in parameters and "cuisine" in preferences:
+            parameters["cuisine"] = preferences["cuisine"]
+        
+        return await self._respond(
+            state, self.location_recommender.astream(parameters, kb_context, kg_insights), cite_sources=True
+        )
+    
+    async def run_regulatory_advisor(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the regulatory advisor agent."""
+        parameters = _routing_parameters(state)
+        context = state["context"]
+        kb_context = context.get("kb_context", "")
+        kg_insights = context.get("kg_insights", "")
+        
+        return await self._respond(
+            state, self.regulatory_advisor.astream(parameters, kb_context, kg_insights), cite_sources=True
+        )
+    
+    async def run_market_analysis(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the market analysis agent."""
+        parameters = _routing_parameters(state)
+        context = state["context"]
+        kb_context = context.get("kb_context", "")
+        kg_insights = context.get("kg_insights", "")
+        
+        # The agent returns a JSON analysis, so there are no tokens to stream; keep the call off the loop
+        analysis = await _run_in_executor(
+            self._executor, self.market_analysis.run, parameters, kb_context, kg_insights
+        )
+        return await self._respond(state, format_market_analysis(analysis), cite_sources=True)
+    
+    async def _run_external_node(self, state: EnhancedAgentState, agent_name: str) -> EnhancedAgentState:
+        """Answer with one of the EXTERNAL_AGENTS, keeping its blocking API calls off the event loop."""
+        result, response = await _run_in_executor(
+            self._executor, self._run_external_agent, agent_name, state["query"], _routing_parameters(state)
+        )
+        return await self._respond(state, response, result=result)
+    
+    async def run_consumer_survey(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the external consumer survey agent."""
+        return await self._run_external_node(state, "consumer_survey")
+    
+    async def run_real_estate(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the external real estate agent."""
+        return await self._run_external_node(state, "real_estate")
+    
+    async def run_demographics(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the external demographics agent."""
+        return await self._run_external_node(state, "demographics")
+    
+    async def run_market_research(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the external market research agent."""
+        return await self._run_external_node(state, "market_research")
+    
+    async def run_pdf_research(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the PDF research agent."""
+        query = state["query"]
+        kg_insights = state["context"].get("kg_insights", "")
+        
+        # The agent gathers its own PDF insights, so only the KG context is passed in
+        return await self._respond(state, self.pdf_research.astream(query, kg_insights))
+    
+    async def run_domain_specialist(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the domain specialist agent."""
+        parameters = _routing_parameters(state)
+        context = state["context"]
+        kb_context = context.get("kb_context", "")
+        kg_insights = context.get("kg_insights", "")
+        
+        query = state["query"]
+        
+        # Get response from the domain specialist agent
+        return await self._respond(state, self.domain_specialist.astream(query, parameters, kb_context, kg_insights))
+    
+    def _call_external_agent(self, agent_name: str, query: str, **kwargs: Any) -> Dict[str, Any]:
+        """Get an external agent's result, cached in memory and shared by every orchestrator.
+        
+        Repeated calls (mostly a few default cities and types) skip the API round trips.
+        Results reporting a failure are returned but not cached, so the next call retries.
+        """
+        key = _external_key(agent_name, query, **kwargs)
+        with self._external_cache_lock:
+            result = self._external_cache.get(key)
+        if result is None:
+            result = self._uncached_external_call(agent_name, query, **kwargs)
+            if not _is_failed_result(result):
+                with self._external_cache_lock:
+                    self._external_cache[key] = result
+        return result
+    
+    def _uncached_external_call(self, agent_name: str, query: str, **kwargs: Any) -> Dict[str, Any]:
+        """Get an external agent's result from the result store, or call its API-backed run().
+        
+        _call_external_agent is the version cached in memory.
+        """
+        if self.result_store is None:
+            return getattr(self, f"external_{agent_name}").run(query, **kwargs)
+        
+        store_key = repr(tuple(_external_key(agent_name, query, **kwargs)))
+        result = self.result_store.get(store_key)
+        if result is None:
+            result = getattr(self, f"external_{agent_name}").run(query, **kwargs)
+            # A transient failure must not be served for the agent's whole TTL, across restarts
+            if not _is_failed_result(result):
+                self.result_store.set(store_key, result, EXTERNAL_RESULT_TTLS[agent_name])
+        return result
+    
+    def _run_external_agent(self, agent_name: str, query: str,
+                            parameters: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """Call one of the EXTERNAL_AGENTS (blocking, unless cached) and format its result as the answer.
+        
+        Args:
+            agent_name: External agent to call
+            query: The user's query
+            parameters: Routing parameters; missing ones fall back to the agents' defaults
+            
+        Returns:
+            The agent's raw result and the formatted answer
+        """
+        city = parameters.get("city", "Chennai")
+        restaurant_type = parameters.get("restaurant_type", "casual_dining")
+        if agent_name == "consumer_survey":
+            demographic = parameters.get("demographic", "all")
+            result = self._call_external_agent(agent_name, query, location=city, demographic=demographic)
+            return result, _format_consumer_survey(result, city)
+        if agent_name == "real_estate":
+            locality = parameters.get("locality", "downtown")
+            result = self._call_external_agent(
+                agent_name, query, city=city, locality=locality, restaurant_type=restaurant_type
+            )
+            return result, _format_real_estate(result, city, locality)
+        if agent_name == "demographics":
+            result = self._call_external_agent(agent_name, query, city=city, restaurant_type=restaurant_type)
+            return result, _format_demographics(result, city)
+        result = self._call_external_agent(agent_name, query, location=city)
+        return result, _format_market_research(result, city)
+    
+    def _run_fan_out_agent(self, agent_name: str, query: str, parameters: Dict[str, Any],
+                           kb_context: str, kg_insights: str) -> str:
+        """Answer a query with one of the FAN_OUT_AGENTS."""
+        if agent_name in EXTERNAL_AGENTS:
+            return self._run_external_agent(agent_name, query, parameters)[1]
+        if agent_name == "location_recommender":
+            return self.location_recommender.run(parameters, kb_context, kg_insights)
+        if agent_name == "regulatory_advisor":
+            return self.regulatory_advisor.run(parameters, kb_context, kg_insights)
+        if agent_name == "pdf_research":
+            return self.pdf_research.run(query, kg_insights)
+        return self.domain_specialist.run(query, parameters, kb_context, kg_insights)
+    
+    async def run_multi_intent(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Answer a multi-intent query with the routed agents in parallel.
+        
+        The agents' answers are merged, or with speculative execution enabled the first
+        answer to arrive is used and the other agents are abandoned.
+        """
+        routing = state["routing"]
+        parameters = routing.parameters
+        context = state["context"]
+        query = state["query"]
+        user = state["user"]
+        
+        # Agents the user may not use are dropped from the fan-out
+        agent_names = [routing.agent]
+        for agent_name in routing.fan_out:
+            if _checked_agent_access(state, agent_name):
+                agent_names.append(agent_name)
+        
+        async def answer(agent_name: str, agent_query: str) -> str:
+            if agent_name == routing.agent:
+                # retrieve_context already fetched the primary agent's context
+                kb_context = context.get("kb_context", "")
+                kg_insights = context.get("kg_insights", "")
+            elif agent_name in EXTERNAL_AGENTS:
+                # External agents answer from their own data sources
+                kb_context = kg_insights = ""
+            else:
+                kb_docs, kg_list = await self._fetch_context(agent_name, parameters, agent_query, user)
+                kb_context = join_within_budget((doc.page_content for doc in kb_docs), 5, KB_CONTEXT_CHARS)
+                kg_insights = join_within_budget(kg_list, 8, KG_INSIGHTS_CHARS)
+            # Each agent gets its own copy, as some fill in parameters from preferences
+            return await _run_in_executor(
+                self._executor, self._run_fan_out_agent, agent_name, agent_query, dict(parameters), kb_context, kg_insights
+            )
+        
+        if self.speculative and len(agent_names) > 1:
+            # Race the agents; an abandoned agent's LLM call finishes in its worker thread but is ignored
+            tasks = {asyncio.create_task(answer(agent_name, query)): agent_name for agent_name in agent_names}
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            # On a tie, prefer the router's ranking
+            winner = min(done, key=lambda task: agent_names.index(tasks[task]))
+            response = winner.result()
+        else:
+            answers = RunnableParallel({
+                agent_name: RunnableLambda(partial(answer, agent_name)) for agent_name in agent_names
+            })
+            responses = await answers.ainvoke(query)
+            
+            # Merge the answers under one heading per agent, primary agent first
+            response = "\n\n".join(
+                f"## {agent_name.replace('_', ' ').title()}\n\n{responses[agent_name]}" for agent_name in agent_names
+            )
+        
+        # Add the response to messages
+        state["messages"].append(AIMessage(content=response))
+        
+        # Store response in memory
+        user_memory = _user_memory(state)
+        user_memory.last_response = response
+        user_memory.last_sources = context.get("sources", [])
+        
+        return state
+    
+    async def run_basic_query(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Run the basic query agent."""
+        query = state["query"]
+        kb_context = state["context"].get("kb_context", "")
+        
+        return await self._respond(state, self.basic_query.astream(query, kb_context))
+    
+    def respond_access_denied(self, state: EnhancedAgentState) -> EnhancedAgentState:
+        """Tell the user the routed agent is outside their permissions."""
+        agent_name = state["next_agent"] or "requested"
+        response = ACCESS_DENIED_RESPONSE.format(agent=agent_name.replace("_", " "))
+        
+        # Add the response to messages
+        state["messages"].append(AIMessage(content=response))
+        
+        # Store response in memory
+        user_memory = _user_memory(state)
+        user_memory.last_response = response
+        
+        return state
+    
     def process_message(self, user_id: str, message: BaseMessage) -> None:
         """Process a message for a user, updating memory."""
         self.memory_manager.process_message(user_id, message)
@@ -933,54 +1421,191 @@ For more detailed information, please contact your administrator to upgrade your
         return user_memory.get_conversation_context(max_messages)
     
     def run(self, query: str, user: Dict) -> str:
-        """Run the agent graph with user query and user information."""
+        """Run the agent graph with user query and user information (blocking wrapper around arun)."""
+        return asyncio.run(self.arun(query, user))
+    
+    def run_stream(self, query: str, user: Dict) -> Iterator[str]:
+        """Blocking wrapper around astream, for callers without an event loop.
+        
+        Args:
+            query: User query string
+            user: User information dict
+            
+        Returns:
+            Iterator over response chunks, yielded as soon as each one is generated
+        """
+        loop = asyncio.new_event_loop()
+        chunks = self.astream(query, user)
         try:
-            user_id = user["username"]
-            
-            # Process the new query
-            self.memory_manager.process_message(user_id, HumanMessage(content=query))
-            
-            # Get conversation history
-            messages = self.get_conversation_history(user_id)
-            
-            # Get user context from memory
-            user_memory = self.memory_manager.get_user_memory(user_id)
-            user_context = user_memory.get_user_context()
-            
-            # Prepare the initial state
-            initial_state = {
-                "messages": messages,
-                "user": user,
-                "context": {"user_context": user_context},
-                "next_agent": None,
+            while True:
+                try:
+                    yield loop.run_until_complete(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(chunks.aclose())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+    
+    def _prepare_initial_state(self, query: str, user: Dict) -> EnhancedAgentState:
+        """Record the user's query in memory and build the initial graph state for it."""
+        user_id = user["username"]
+        
+        # Process the new query
+        user_memory = self.memory_manager.process_message(user_id, HumanMessage(content=query))
+        
+        # Get conversation history; the query was just added, so it is never worth caching
+        messages = user_memory.get_conversation_context()
+        
+        # Get user context from memory
+        user_context = user_memory.get_user_context()
+        
+        # Prepare the initial state
+        state = self._acquire_state()
+        state["messages"] = messages
+        state["user"] = user
+        state["context"]["user_context"] = user_context
+        state["memory"][user_id] = self._take_memory_slot(state, user_context)
+        return state
+    
+    @staticmethod
+    def _take_memory_slot(state: EnhancedAgentState, user_context: Dict[str, Any]) -> UserMemorySlot:
+        """Reuse the memory slot a pooled state kept from its last turn, or create one."""
+        memory = state["memory"]
+        if not memory:
+            return UserMemorySlot(user_context=user_context)
+        # The slot was kept under its last user's name; the caller re-keys it
+        _, slot = memory.popitem()
+        slot.reset(user_context)
+        return slot
+    
+    def _acquire_state(self) -> EnhancedAgentState:
+        """Take a blank graph state from the pool, or create one if the pool is empty."""
+        try:
+            return self._state_pool.get_nowait()
+        except queue.Empty:
+            return {
+                **BLANK_STATE_FIELDS,
+                "messages": [],
+                "user": {},
+                "context": {},
                 "subagents": [],
-                "memory": {user_id: user_context},
-                "access_control": {"checked_permissions": {}, "access_denied": False}
+                "memory": {},
+                "access_control": AccessControl()
             }
+    
+    def _release_state(self, state: EnhancedAgentState) -> None:
+        """Reset a graph state in place and return it to the pool.
+        
+        Nodes mutate the nested containers of the state they were given, so they are
+        cleared rather than replaced. The state must not be read after release.
+        """
+        state.update(BLANK_STATE_FIELDS)
+        # Drop the turn's messages and user rather than keep them alive in the pool
+        state["messages"] = []
+        state["user"] = {}
+        state["context"].clear()
+        state["subagents"].clear()
+        # Keep one memory slot for the next turn, emptied so it holds nothing of this one
+        memory = state["memory"]
+        if memory:
+            user_id, slot = memory.popitem()
+            memory.clear()
+            slot.reset({})
+            memory[user_id] = slot
+        state["access_control"].checked_permissions.clear()
+        state["access_control"].access_denied = False
+        try:
+            self._state_pool.put_nowait(state)
+        except queue.Full:
+            pass
+    
+    async def arun(self, query: str, user: Dict) -> str:
+        """Run the agent graph with user query and user information."""
+        try:
+            user_id = user["username"]
+            initial_state = self._prepare_initial_state(query, user)
+            try:
+                # Run the graph specialized to the user's role
+                graph = self.graph_for_role(user["role"])
+                result = await graph.ainvoke(initial_state, context=GraphContext(orchestrator=self))
+                
+                # Update memory with the result
+                if result["messages"] and isinstance(result["messages"][-1], AIMessage):
+                    self.memory_manager.process_message(user_id, result["messages"][-1])
+                
+                # Return the latest response
+                return result["messages"][-1].content
+            finally:
+                self._release_state(initial_state)
             
-            # Run the graph
-            result = self.graph.invoke(initial_state)
-            
-            # Update memory with the result
-            if result["messages"] and isinstance(result["messages"][-1], AIMessage):
-                self.memory_manager.process_message(user_id, result["messages"][-1])
+        except Exception as e:
+            logger.exception("Error in enhanced orchestrator.run for user %s", user.get("username"))
+            return f"Error processing your request: {str(e)}"
+    
+    async def astream(self, query: str, user: Dict) -> AsyncIterator[str]:
+        """Run the agent graph, yielding the response as the agent generates it.
+        
+        Args:
+            query: User query string
+            user: User information dict
             
-            # Return the latest response
-            return result["messages"][-1].content
+        Returns:
+            Async iterator over response chunks
+        """
+        try:
+            user_id = user["username"]
+            initial_state = self._prepare_initial_state(query, user)
+            try:
+                # Tokens arrive on the custom stream; the final state arrives on the values stream.
+                # If the consumer stops early, closing the stream cancels the running nodes before
+                # the state goes back to the pool, so they cannot write into the next turn's state
+                result = initial_state
+                streamed = False
+                async with contextlib.aclosing(self.graph_for_role(user["role"]).astream(
+                    initial_state, stream_mode=["custom", "values"], context=GraphContext(orchestrator=self)
+                )) as stream:
+                    async for mode, chunk in stream:
+                        if mode == "custom":
+                            streamed = True
+                            yield chunk["token"]
+                        else:
+                            result = chunk
+                
+                # Update memory with the result
+                if result["messages"] and isinstance(result["messages"][-1], AIMessage):
+                    self.memory_manager.process_message(user_id, result["messages"][-1])
+                
+                # Agents without token streaming produce their response in one piece
+                if not streamed:
+                    yield result["messages"][-1].content
+            finally:
+                self._release_state(initial_state)
             
         except Exception as e:
-            print(f"Error in enhanced orchestrator.run: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return f"Error processing your request: {str(e)}"
+            logger.exception("Error in enhanced orchestrator.astream for user %s", user.get("username"))
+            yield f"Error processing your request: {str(e)}"
     
     def save_memory_to_disk(self, file_path: str = "memory_data.json") -> None:
-        """Save memory to disk."""
-        self.memory_manager.save_to_disk(file_path)
+        """Save memory to disk (to the memory store if there is one, else to a JSON file).
+        
+        External agent results are written to the result store as they arrive; saving
+        only drops the expired ones.
+        """
+        if self.memory_manager.store is not None:
+            self.memory_manager.save_to_store()
+        else:
+            self.memory_manager.save_to_disk(file_path)
+        if self.result_store is not None:
+            self.result_store.purge_expired()
     
     def load_memory_from_disk(self, file_path: str = "memory_data.json") -> None:
-        """Load memory from disk."""
-        self.memory_manager.load_from_disk(file_path)
+        """Load memory from disk; with a memory store, users are instead loaded on first use.
+        
+        External agent results are likewise read from the result store on first use.
+        """
+        if self.memory_manager.store is None:
+            self.memory_manager.load_from_disk(file_path)
     
     def cleanup_inactive_sessions(self) -> None:
         """Clean up inactive sessions."""
@@ -2,11 +2,50 @@
 Advanced memory management for agents with short-term, long-term, and session-specific memory.
 """
 
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, ClassVar, Deque, Dict, List, Any, Optional, Set, Tuple
 import json
+import sqlite3
+import threading
 import time
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dump_json(data: Any, indent: bool = True) -> bytes:
+    """Serialize memory data to JSON bytes, using orjson when it is installed.
+    
+    Args:
+        data: Memory data to serialize
+        indent: Pretty-print for files people may read; database blobs are written compact
+    """
+    if orjson is not None:
+        # Agent results may carry numpy values from the location analysis
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def _load_json(raw: bytes) -> Any:
+    """Parse JSON bytes written by _dump_json."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Persisted message type name -> message class
+MESSAGE_CLASSES = {cls.__name__: cls for cls in (HumanMessage, AIMessage, SystemMessage)}
+
+# Once a user's history grows past this many messages, all but the most recent are summarized
+SUMMARIZE_AFTER_MESSAGES = 20
+RECENT_MESSAGES = 10
+
 class Memory:
     """Base class for memory systems."""
     
@@ -34,13 +73,23 @@ class ShortTermMemory(Memory):
         self.max_size = max_size
         self.messages = []
         self.timestamp = time.time()
+        # Summary of the messages already dropped in favour of it
+        self.summary = ""
+        # Positions in the user's whole history: messages before messages[0], and
+        # messages the summary covers (stored ones past it are loaded back)
+        self.earlier_messages = 0
+        self.summarized_messages = 0
+        # (summary, last message it covers) from a background summarizer, applied on next access
+        self._pending_summary: Optional[Tuple[str, BaseMessage]] = None
     
     def add_message(self, message: BaseMessage) -> None:
         """Add a message to short-term memory."""
+        self.apply_pending_summary()
         self.messages.append(message)
         
         # Trim if exceeding max size
         if len(self.messages) > self.max_size:
+            self.earlier_messages += len(self.messages) - self.max_size
             self.messages = self.messages[-self.max_size:]
             
         # Update timestamp
@@ -50,9 +99,34 @@ class ShortTermMemory(Memory):
         """Get all messages in short-term memory."""
         return self.messages.copy()
     
+    def set_pending_summary(self, summary: str, last_message: BaseMessage) -> None:
+        """Hand over a summary covering the messages up to and including last_message.
+        
+        Safe to call from another thread; the messages are only replaced on the next
+        access from the thread that owns this memory.
+        """
+        self._pending_summary = (summary, last_message)
+    
+    def apply_pending_summary(self) -> None:
+        """Replace the messages covered by a finished summary with the summary."""
+        pending = self._pending_summary
+        if pending is None:
+            return
+        self._pending_summary = None
+        self.summary, last_summarized = pending
+        for index, message in enumerate(self.messages):
+            if message is last_summarized:
+                del self.messages[:index + 1]
+                self.earlier_messages += index + 1
+                self.summarized_messages = self.earlier_messages
+                break
+    
     def clear(self) -> None:
         """Clear short-term memory."""
+        self.earlier_messages += len(self.messages)
         self.messages = []
+        self.summary = ""
+        self._pending_summary = None
 
 
 class LongTermMemory(Memory):
@@ -141,7 +215,8 @@ class UserMemory:
     
     def __init__(self, user_id: str):
         self.user_id = user_id
-        self.short_term = ShortTermMemory()
+        # Room for the unsummarized messages, with slack in case summaries fall behind
+        self.short_term = ShortTermMemory(max_size=2 * SUMMARIZE_AFTER_MESSAGES)
         self.long_term = LongTermMemory()
         self.session_data = {}
         self.last_activity = time.time()
@@ -159,9 +234,21 @@ class UserMemory:
         if isinstance(message, HumanMessage):
             self.long_term.add_query(message.content)
     
-    def get_conversation_context(self, max_messages: int = 10) -> List[BaseMessage]:
-        """Get conversation context from short-term memory."""
-        return self.short_term.get_messages()[-max_messages:]
+    def get_conversation_context(self, max_messages: int = RECENT_MESSAGES) -> List[BaseMessage]:
+        """Get conversation context from short-term memory, led by the summary of older turns."""
+        self.short_term.apply_pending_summary()
+        # Slicing already copies, so skip the full copy get_messages() would make
+        recent = self.short_term.messages[-max_messages:]
+        if self.short_term.summary:
+            return [SystemMessage(content=f"Summary of the earlier conversation:\n{self.short_term.summary}"), *recent]
+        return recent
+    
+    def messages_to_summarize(self) -> List[BaseMessage]:
+        """Older messages due to be folded into the summary, or [] if the history is still short."""
+        messages = self.short_term.messages
+        if len(messages) <= SUMMARIZE_AFTER_MESSAGES:
+            return []
+        return messages[:-RECENT_MESSAGES]
     
     def extract_preferences(self, message: HumanMessage) -> None:
         """Extract user preferences from a message and store in long-term memory."""
@@ -262,29 +349,302 @@ class UserMemory:
         return context
 
 
+# Most queued memory writes committed together in one transaction
+MAX_WRITE_BATCH = 64
+
+_INSERT_MESSAGE = "INSERT INTO messages (user_id, ts, type, content) VALUES (?, ?, ?, ?)"
+_UPSERT_USER = """
+    INSERT INTO users (user_id, long_term, session_data, last_activity) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        long_term = excluded.long_term,
+        session_data = excluded.session_data,
+        last_activity = excluded.last_activity
+"""
+
+# A write: the (sql, parameters) statements to execute together
+Write = List[Tuple[str, tuple]]
+
+class MemoryWriteQueue:
+    """Background writer that commits queued SQLite writes in batches.
+    
+    Producers enqueue a write and return immediately. A daemon thread drains up to
+    max_batch queued writes at a time and commits them in a single transaction, so
+    concurrent chat turns share one commit instead of paying for one each.
+    
+    Writes are appended to a deque, whose append and popleft are atomic, so producers
+    never wait on the writer thread; the event is only set when the writer may be
+    asleep.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock, max_batch: int = MAX_WRITE_BATCH):
+        """Start the writer thread.
+        
+        Args:
+            conn: Connection the writes are executed on
+            lock: Lock guarding the connection
+            max_batch: Most writes committed in one transaction
+        """
+        self._conn = conn
+        self._lock = lock
+        self.max_batch = max_batch
+        self._pending: Deque[Optional[Tuple[Write, Future]]] = deque()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, write: Write) -> Future:
+        """Queue a write; the returned future resolves once it is committed."""
+        future = Future()
+        self._enqueue((write, future))
+        return future
+    
+    def flush(self) -> None:
+        """Block until every write queued so far is committed."""
+        self.submit([]).result()
+    
+    def close(self) -> None:
+        """Commit the queued writes and stop the writer thread."""
+        self._enqueue(None)
+        self._thread.join()
+    
+    def _enqueue(self, item: Optional[Tuple[Write, Future]]) -> None:
+        """Append an item and wake the writer if it may be waiting."""
+        self._pending.append(item)
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+    
+    def _run(self) -> None:
+        """Drain the queue in batches until close() is called."""
+        while True:
+            self._wakeup.wait()
+            # Clear before draining so an append racing with the drain re-arms the event
+            self._wakeup.clear()
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.max_batch:
+                    item = self._pending.popleft()
+                    if item is None:
+                        self._commit(batch)
+                        return
+                    batch.append(item)
+                self._commit(batch)
+    
+    def _commit(self, batch: List[Tuple[Write, Future]]) -> None:
+        """Execute a batch of writes in one transaction and resolve their futures."""
+        if not batch:
+            return
+        try:
+            with self._lock, self._conn:
+                for write, _ in batch:
+                    for sql, parameters in write:
+                        self._conn.execute(sql, parameters)
+        except Exception as e:
+            print(f"Error writing memory batch: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, future in batch:
+                future.set_result(None)
+
+
+class MemoryStore:
+    """SQLite-backed persistence for user memory.
+    
+    Messages are appended one row at a time as they arrive, and each user's long-term
+    memory and session data live in a single row, so persisting a turn costs a couple
+    of small writes instead of rewriting every user's memory. Users are read back
+    lazily, the first time they are needed.
+    """
+    
+    def __init__(self, db_path: str = "memory_data.db", batch_writes: bool = True):
+        """Open (and if needed create) the memory database.
+        
+        Args:
+            db_path: Path of the SQLite database file
+            batch_writes: Queue writes to a background MemoryWriteQueue instead of
+                committing each one before returning
+        """
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # WAL lets readers proceed during writes; NORMAL sync is safe with WAL
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    type TEXT NOT NULL,
+                    content TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    long_term BLOB NOT NULL,
+                    session_data BLOB NOT NULL,
+                    last_activity REAL NOT NULL
+                )
+            """)
+        self._writer = MemoryWriteQueue(self._conn, self._lock) if batch_writes else None
+    
+    def close(self) -> None:
+        """Commit any queued writes and close the database connection."""
+        if self._writer is not None:
+            self._writer.close()
+        with self._lock:
+            self._conn.close()
+    
+    def flush(self) -> None:
+        """Block until all queued writes are committed."""
+        if self._writer is not None:
+            self._writer.flush()
+    
+    def record_message(self, user_memory: UserMemory, message: BaseMessage) -> None:
+        """Append a message and save the user's current long-term state in one transaction."""
+        self._write([
+            (_INSERT_MESSAGE, (user_memory.user_id, time.time(), type(message).__name__, message.content)),
+            (_UPSERT_USER, self._user_row(user_memory))
+        ])
+    
+    def save_user(self, user_memory: UserMemory) -> None:
+        """Save a user's long-term memory, session data and activity time."""
+        self._write([(_UPSERT_USER, self._user_row(user_memory))])
+    
+    def _write(self, write: Write) -> None:
+        """Queue a write, or commit it right away when writes are not batched."""
+        if self._writer is not None:
+            self._writer.submit(write)
+            return
+        with self._lock, self._conn:
+            for sql, parameters in write:
+                self._conn.execute(sql, parameters)
+    
+    @staticmethod
+    def _user_row(user_memory: UserMemory) -> tuple:
+        """Snapshot a user's row now, so later changes to their memory cannot race the writer."""
+        long_term = user_memory.long_term
+        return (
+            user_memory.user_id,
+            _dump_json({
+                "facts": long_term.facts,
+                "preferences": long_term.preferences,
+                "last_queries": long_term.last_queries,
+                "insights": long_term.insights,
+                "conversation_summary": user_memory.short_term.summary,
+                "summarized_messages": user_memory.short_term.summarized_messages
+            }, indent=False),
+            _dump_json(user_memory.session_data, indent=False),
+            user_memory.last_activity
+        )
+    
+    def load_user(self, user_id: str) -> Optional[UserMemory]:
+        """Rebuild a user's memory from the database, or None if nothing was stored.
+        
+        Only the messages after those the stored summary covers are loaded, so the
+        summarizer never folds the same turns into the summary twice.
+        """
+        # Queued writes may include this user's latest messages
+        self.flush()
+        user_memory = UserMemory(user_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT long_term, session_data, last_activity FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            long_term, session_data, last_activity = row
+            long_term_data = _load_json(long_term)
+            summarized_messages = long_term_data.get("summarized_messages", 0)
+            total_messages = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            max_messages = min(user_memory.short_term.max_size, max(total_messages - summarized_messages, 0))
+            messages = self._conn.execute(
+                "SELECT ts, type, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, max_messages)
+            ).fetchall()
+        
+        # Restore short-term memory, oldest message first
+        user_memory.short_term.earlier_messages = total_messages - len(messages)
+        user_memory.short_term.summarized_messages = summarized_messages
+        for ts, msg_type, content in reversed(messages):
+            message_class = MESSAGE_CLASSES.get(msg_type)
+            if message_class is not None:
+                user_memory.short_term.messages.append(message_class(content=content))
+                user_memory.short_term.timestamp = ts
+        
+        # Restore long-term memory, session data and activity timestamp
+        user_memory.long_term.facts = long_term_data.get("facts", [])
+        user_memory.long_term.preferences = long_term_data.get("preferences", {})
+        user_memory.long_term.last_queries = long_term_data.get("last_queries", [])
+        user_memory.long_term.insights = long_term_data.get("insights", {})
+        user_memory.short_term.summary = long_term_data.get("conversation_summary", "")
+        user_memory.session_data = _load_json(session_data)
+        user_memory.last_activity = last_activity
+        return user_memory
+
+
 class MemoryManager:
     """Manages memory for all users in the system."""
     
-    def __init__(self, session_timeout: int = 3600):
+    # One background summarizer thread serves every manager, started by the first summary
+    _summarizer_pool: ClassVar[ThreadPoolExecutor] = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="memory-summarizer"
+    )
+    
+    def __init__(self, session_timeout: int = 3600, max_users: int = 1024,
+                 store: Optional[MemoryStore] = None,
+                 summarize: Optional[Callable[[str, List[BaseMessage]], str]] = None):
         """Initialize memory manager.
         
         Args:
             session_timeout: Session timeout in seconds (default: 1 hour)
+            max_users: Maximum number of users kept in memory; the least recently active are evicted
+            store: Optional SQLite store that messages are written through to as they are
+                processed; users not in memory are loaded from it on first use
+            summarize: Optional function folding older messages into a running summary
+                (called with the summary so far and the messages); when given, long
+                histories are summarized on a background thread
         """
-        self.users = {}  # User ID -> UserMemory
+        self.users: "OrderedDict[str, UserMemory]" = OrderedDict()  # User ID -> UserMemory, least recent first
         self.session_timeout = session_timeout
+        self.max_users = max_users
+        self.store = store
+        self.summarize = summarize
+        self._summarizer: Optional[ThreadPoolExecutor] = None
+        if summarize is not None:
+            self._summarizer = self._summarizer_pool
+        self._summarizing: Set[str] = set()  # User IDs with a summary in progress
     
     def get_user_memory(self, user_id: str) -> UserMemory:
         """Get memory for a specific user."""
-        if user_id not in self.users:
-            self.users[user_id] = UserMemory(user_id)
+        user_memory = self.users.get(user_id)
+        if user_memory is None:
+            if self.store is not None:
+                user_memory = self.store.load_user(user_id)
+            if user_memory is None:
+                user_memory = UserMemory(user_id)
+            self.users[user_id] = user_memory
+            
+            # Evict the least recently active users beyond the cap
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
         
         # Update activity timestamp
-        self.users[user_id].update_activity()
-        return self.users[user_id]
+        user_memory.update_activity()
+        return user_memory
     
-    def process_message(self, user_id: str, message: BaseMessage) -> None:
-        """Process a message for a user, extracting preferences and updating memory."""
+    def process_message(self, user_id: str, message: BaseMessage) -> UserMemory:
+        """Process a message for a user, extracting preferences and updating memory.
+        
+        Returns:
+            The user's memory, so callers can read it back without another lookup
+        """
         user_memory = self.get_user_memory(user_id)
         
         # Add message to short-term memory
@@ -293,6 +653,29 @@ class MemoryManager:
         # Extract preferences if it's a human message
         if isinstance(message, HumanMessage):
             user_memory.extract_preferences(message)
+        
+        # Write the message through to the store
+        if self.store is not None:
+            self.store.record_message(user_memory, message)
+        
+        # Compress older turns off the request path; the summary is applied on a later access
+        if self._summarizer is not None and user_id not in self._summarizing:
+            older_messages = user_memory.messages_to_summarize()
+            if older_messages:
+                self._summarizing.add(user_id)
+                self._summarizer.submit(self._summarize, user_memory, older_messages)
+        
+        return user_memory
+    
+    def _summarize(self, user_memory: UserMemory, messages: List[BaseMessage]) -> None:
+        """Fold older messages into a user's summary (runs on the summarizer thread)."""
+        try:
+            summary = self.summarize(user_memory.short_term.summary, messages)
+            user_memory.short_term.set_pending_summary(summary, messages[-1])
+        except Exception as e:
+            print(f"Error summarizing conversation for {user_memory.user_id}: {str(e)}")
+        finally:
+            self._summarizing.discard(user_memory.user_id)
     
     def cleanup_inactive_sessions(self) -> None:
         """Clean up inactive user sessions based on timeout."""
@@ -307,6 +690,17 @@ class MemoryManager:
         for user_id in inactive_users:
             del self.users[user_id]
     
+    def save_to_store(self) -> None:
+        """Save every in-memory user's long-term memory and session data to the store.
+        
+        Messages are already written as they are processed; this catches session data
+        and insights set directly on a user's memory since their last message. Returns
+        once everything queued so far is committed.
+        """
+        for user_memory in list(self.users.values()):
+            self.store.save_user(user_memory)
+        self.store.flush()
+    
     def save_to_disk(self, file_path: str) -> None:
         """Save memory to disk."""
         data = {}
@@ -325,7 +719,8 @@ class MemoryManager:
             user_data = {
                 "short_term": {
                     "messages": messages,
-                    "timestamp": user_memory.short_term.timestamp
+                    "timestamp": user_memory.short_term.timestamp,
+                    "summary": user_memory.short_term.summary
                 },
                 "long_term": {
                     "facts": user_memory.long_term.facts,
@@ -340,14 +735,14 @@ class MemoryManager:
             data[user_id] = user_data
         
         # Save to file
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
+        with open(file_path, "wb") as f:
+            f.write(_dump_json(data))
     
     def load_from_disk(self, file_path: str) -> None:
         """Load memory from disk."""
         try:
-            with open(file_path, "r") as f:
-                data = json.load(f)
+            with open(file_path, "rb") as f:
+                data = _load_json(f.read())
             
             for user_id, user_data in data.items():
                 # Create user memory
@@ -362,18 +757,14 @@ class MemoryManager:
                     content = msg_data.get("content", "")
                     
                     # Create message object based on type
-                    if msg_type == "HumanMessage":
-                        msg = HumanMessage(content=content)
-                    elif msg_type == "AIMessage":
-                        msg = AIMessage(content=content)
-                    elif msg_type == "SystemMessage":
-                        msg = SystemMessage(content=content)
-                    else:
+                    message_class = MESSAGE_CLASSES.get(msg_type)
+                    if message_class is None:
                         continue
                     
-                    user_memory.short_term.add_message(msg)
+                    user_memory.short_term.add_message(message_class(content=content))
                 
                 user_memory.short_term.timestamp = short_term_data.get("timestamp", time.time())
+                user_memory.short_term.summary = short_term_data.get("summary", "")
                 
                 # Restore long-term memory
                 long_term_data = user_data.get("long_term", {})
@@ -388,6 +779,12 @@ class MemoryManager:
                 
                 # Add to users
                 self.users[user_id] = user_memory
+            
+            # Keep the most recently active users within the cap
+            for user_id in sorted(self.users, key=lambda uid: self.users[uid].last_activity):
+                self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
                 
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"Error loading memory from disk: {str(e)}")
@@ -1,4 +1,8 @@
-from typing import Dict, List, Any, Optional, Literal, TypedDict
+import asyncio
+import re
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Any, Optional, Literal, TypedDict
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 import operator
@@ -15,6 +19,27 @@ from agents.agent_definitions import (
 from kb.mongodb_kb import MongoKnowledgeBase
 from kg.neo4j_kg import Neo4jKnowledgeGraph
 from utils.auth import has_agent_access
+from utils.context_budget import KB_CONTEXT_CHARS, KG_INSIGHTS_CHARS, join_within_budget
+from utils.report_templates import format_market_analysis
+
+# Cities recognised in basic queries, matched in a single pass over the query
+CITY_NAMES = ("mumbai", "delhi", "bangalore", "chennai", "hyderabad", "kolkata", "pune", "ahmedabad")
+_CITY_PATTERN = re.compile("|".join(map(re.escape, CITY_NAMES)))
+
+# KG insight templates, formatted once per location
+LOCATION_TEMPLATE = (
+    "Location: {area} - Overall Score: {score:.2f}\n"
+    "  - Foot Traffic: {foot_traffic:.2f}\n"
+    "  - Competition Level: {competition:.2f}\n"
+    "  - Growth Potential: {growth:.2f}\n"
+    "  - Rent Value (lower is better): {rent:.2f}\n"
+)
+AREA_TEMPLATE = (
+    "Area: {area}\n"
+    "  - Foot Traffic: {foot_traffic:.2f}\n"
+    "  - Competition Level: {competition:.2f}\n"
+    "  - Growth Potential: {growth:.2f}\n"
+)
 
 class AgentState(TypedDict):
     """Type definition for the state in the agent graph."""
@@ -23,8 +48,17 @@ class AgentState(TypedDict):
     context: Dict
     next_agent: Optional[str]
 
+async def _collect(chunks: AsyncIterator[str]) -> str:
+    """Gather a streamed agent response into one string."""
+    return "".join([chunk async for chunk in chunks])
+
+@lru_cache(maxsize=None)
 def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
-    """Create the agent graph for orchestrating the multi-agent system."""
+    """Create the agent graph for orchestrating the multi-agent system.
+    
+    The compiled graph and its agents hold no per-conversation state, so one graph is
+    built per knowledge base and graph pair and shared by every orchestrator using them.
+    """
     
     # Initialize agents
     router = RoutingAgent()
@@ -35,7 +69,7 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
     basic_query = BasicQueryAgent()
     
     # Define the workflow nodes
-    def route_query(state: AgentState) -> AgentState:
+    async def route_query(state: AgentState) -> AgentState:
         """Route the user's query to the appropriate agent."""
         # Get the latest message
         latest_message = state["messages"][-1]
@@ -44,7 +78,7 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
         
         # Route the query
         query = latest_message.content
-        result = router.run(query)
+        result = await router.arun(query)
         
         # Store routing result
         state["context"]["routing"] = result
@@ -65,17 +99,11 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
             state["next_agent"] = "basic_query"
             return "basic_query"
     
-    def retrieve_context(state: AgentState) -> AgentState:
-        """Retrieve relevant context from knowledge base and knowledge graph."""
-        routing_result = state["context"].get("routing", {})
-        agent_name = state["next_agent"]
-        parameters = routing_result.get("parameters", {})
-        
-        # Initialize context containers
-        kb_context = []
-        kg_insights = []
+    def search_kb(agent_name: str, parameters: Dict, query: str) -> List[Document]:
+        """Search the knowledge base for the documents an agent needs."""
+        kb_docs = []
         
-        # Get context based on the agent type
+        # Build the search based on the agent type
         if agent_name == "location_recommender":
             city = parameters.get("city", "")
             cuisine = parameters.get("cuisine", "")
@@ -98,9 +126,96 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                 # Perform a hybrid search for more relevant results
                 kb_docs = kb.hybrid_search(
                     query, 
-                    user_filter={"metadata.type": {"$in": ["real_estate", "demographics", "food_consumption"]}}
+                    user_filter={"metadata.type": {"$in": ["real_estate", "demographics", "food_consumption"]}},
+                    partition="location"
                 )
-                kb_context = [doc.page_content for doc in kb_docs]
+            
+        elif agent_name == "regulatory_advisor":
+            city = parameters.get("city", "")
+            restaurant_type = parameters.get("restaurant_type", "")
+            serves_alcohol = parameters.get("serves_alcohol", "No")
+            
+            # Get relevant documents from knowledge base
+            if city:
+                # Create a more specific query
+                query_parts = [f"restaurant regulations in {city}"]
+                if restaurant_type:
+                    query_parts.append(f"{restaurant_type}")
+                if serves_alcohol.lower() == "yes":
+                    query_parts.append("liquor license alcohol serving requirements")
+                
+                query = " ".join(query_parts) + " licensing permits requirements"
+                
+                kb_docs = kb.hybrid_search(
+                    query, 
+                    user_filter={"metadata.type": {"$in": ["regulation", "food_consumption"]}},
+                    partition="regulatory"
+                )
+            
+        elif agent_name == "market_analysis":
+            city = parameters.get("city", "")
+            cuisine = parameters.get("cuisine", "")
+            concept = parameters.get("concept", "")
+            area = parameters.get("area", "")
+            
+            # Get relevant documents from knowledge base
+            if city:
+                # Create a more specific query
+                query_parts = [f"restaurant market analysis in {city}"]
+                if cuisine:
+                    query_parts.append(f"{cuisine} cuisine")
+                if concept:
+                    query_parts.append(f"{concept} concept")
+                if area:
+                    query_parts.append(f"{area} area")
+                
+                query = " ".join(query_parts) + " consumer trends competition demographics food preferences"
+                
+                kb_docs = kb.hybrid_search(
+                    query, 
+                    user_filter={"metadata.type": {"$in": ["food_consumption", "demographics", "real_estate"]}},
+                    partition="market"
+                )
+                
+        elif agent_name == "pdf_research":
+            # For PDF research queries, focus on extracting insights from research documents
+            research_topic = parameters.get("research_topic", "")
+            specific_focus = parameters.get("specific_focus", "")
+            city = parameters.get("city", "")
+            
+            # Build a query that will retrieve relevant document content
+            query_parts = ["restaurant business research"]
+            if research_topic:
+                query_parts.append(research_topic)
+            if specific_focus:
+                query_parts.append(specific_focus)
+            if city:
+                query_parts.append(f"in {city}")
+            
+            query = " ".join(query_parts) + " studies reports findings data statistics"
+            
+            # Perform knowledge base search with emphasis on research documents
+            kb_docs = kb.hybrid_search(
+                query,
+                user_filter={"metadata.type": {"$in": ["research", "food_consumption", "demographics", "real_estate"]}},
+                k=8,  # Get more documents for research queries
+                partition="pdf"
+            )
+            
+        else:  # basic_query
+            # Perform knowledge base search
+            kb_docs = kb.hybrid_search(query, k=5)
+        
+        return kb_docs
+    
+    def lookup_kg(agent_name: str, parameters: Dict, query: str) -> List[str]:
+        """Collect knowledge graph insights for an agent."""
+        kg_insights = []
+        
+        # Get insights based on the agent type
+        if agent_name == "location_recommender":
+            city = parameters.get("city", "")
+            cuisine = parameters.get("cuisine", "")
             
             # Get insights from knowledge graph
             if city and kg:
@@ -114,53 +229,34 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     score = loc.get('score', 0)
                     properties = loc.get('properties', {})
                     
-                    insight = f"Location: {area} - Overall Score: {score:.2f}\n"
-                    
                     # Add more details from properties if available
                     if properties:
-                        foot_traffic = properties.get('foot_traffic', 0)
-                        competition = properties.get('competition_score', 0)
-                        growth = properties.get('growth_potential', 0)
-                        rent = properties.get('rent_score', 0)
-                        
-                        insight += f"  - Foot Traffic: {foot_traffic:.2f}\n"
-                        insight += f"  - Competition Level: {competition:.2f}\n"
-                        insight += f"  - Growth Potential: {growth:.2f}\n"
-                        insight += f"  - Rent Value (lower is better): {rent:.2f}\n"
+                        get = properties.get
+                        parts = [LOCATION_TEMPLATE.format(
+                            area=area,
+                            score=score,
+                            foot_traffic=get('foot_traffic', 0),
+                            competition=get('competition_score', 0),
+                            growth=get('growth_potential', 0),
+                            rent=get('rent_score', 0)
+                        )]
                         
                         # Add popular cuisines if available
-                        popular_cuisines = properties.get('popular_cuisines', [])
+                        popular_cuisines = get('popular_cuisines', [])
                         if popular_cuisines:
-                            insight += f"  - Popular Cuisines: {', '.join(popular_cuisines)}\n"
+                            parts.append(f"  - Popular Cuisines: {', '.join(popular_cuisines)}\n")
                             
                         # Add demographics if available
-                        demographics = properties.get('demographics', [])
+                        demographics = get('demographics', [])
                         if demographics:
-                            insight += f"  - Key Demographics: {', '.join(demographics)}\n"
+                            parts.append(f"  - Key Demographics: {', '.join(demographics)}\n")
+                    else:
+                        parts = [f"Location: {area} - Overall Score: {score:.2f}\n"]
                     
-                    kg_insights.append(insight)
+                    kg_insights.append("".join(parts))
         
         elif agent_name == "regulatory_advisor":
             city = parameters.get("city", "")
-            restaurant_type = parameters.get("restaurant_type", "")
-            serves_alcohol = parameters.get("serves_alcohol", "No")
-            
-            # Get relevant documents from knowledge base
-            if city:
-                # Create a more specific query
-                query_parts = [f"restaurant regulations in {city}"]
-                if restaurant_type:
-                    query_parts.append(f"{restaurant_type}")
-                if serves_alcohol.lower() == "yes":
-                    query_parts.append("liquor license alcohol serving requirements")
-                
-                query = " ".join(query_parts) + " licensing permits requirements"
-                
-                kb_docs = kb.hybrid_search(
-                    query, 
-                    user_filter={"metadata.type": {"$in": ["regulation", "food_consumption"]}}
-                )
-                kb_context = [doc.page_content for doc in kb_docs]
             
             # Get insights from knowledge graph with detailed formatting
             if city and kg:
@@ -176,49 +272,29 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     cost = reg.get('cost', '')
                     renewal = reg.get('renewal', '')
                     
-                    insight = f"Regulation: {reg_type}\n"
-                    insight += f"Description: {description}\n"
-                    insight += f"Authority: {authority}\n"
+                    parts = [
+                        f"Regulation: {reg_type}\n",
+                        f"Description: {description}\n",
+                        f"Authority: {authority}\n"
+                    ]
                     
                     if requirements:
-                        insight += "Requirements:\n"
-                        for req in requirements:
-                            insight += f"  - {req}\n"
+                        parts.append("Requirements:\n")
+                        parts.extend(f"  - {req}\n" for req in requirements)
                     
                     if timeline:
-                        insight += f"Timeline: {timeline}\n"
+                        parts.append(f"Timeline: {timeline}\n")
                     if cost:
-                        insight += f"Cost: {cost}\n"
+                        parts.append(f"Cost: {cost}\n")
                     if renewal:
-                        insight += f"Renewal: {renewal}\n"
+                        parts.append(f"Renewal: {renewal}\n")
                     
-                    kg_insights.append(insight)
+                    kg_insights.append("".join(parts))
         
         elif agent_name == "market_analysis":
             city = parameters.get("city", "")
-            cuisine = parameters.get("cuisine", "")
-            concept = parameters.get("concept", "")
             area = parameters.get("area", "")
             
-            # Get relevant documents from knowledge base
-            if city:
-                # Create a more specific query
-                query_parts = [f"restaurant market analysis in {city}"]
-                if cuisine:
-                    query_parts.append(f"{cuisine} cuisine")
-                if concept:
-                    query_parts.append(f"{concept} concept")
-                if area:
-                    query_parts.append(f"{area} area")
-                
-                query = " ".join(query_parts) + " consumer trends competition demographics food preferences"
-                
-                kb_docs = kb.hybrid_search(
-                    query, 
-                    user_filter={"metadata.type": {"$in": ["food_consumption", "demographics", "real_estate"]}}
-                )
-                kb_context = [doc.page_content for doc in kb_docs]
-                
             # Get insights from knowledge graph
             if city and kg:
                 # Get cuisine preferences for the city
@@ -230,7 +306,7 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     # Use get_detailed_location_info which accepts city and area parameters
                     locations = kg.get_detailed_location_info(city, area)
                 else:
-                    locations = kg.recommend_locations(city)[:3]
+                    locations = kg.recommend_locations(city, limit=3)
                 
                 # Format cuisine preferences
                 cuisine_insights = []
@@ -246,20 +322,20 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     properties = loc.get('properties', {})
                     
                     if properties:
-                        foot_traffic = properties.get('foot_traffic', 0)
-                        competition = properties.get('competition_score', 0)
-                        growth = properties.get('growth_potential', 0)
-                        demographics = properties.get('demographics', [])
+                        get = properties.get
+                        demographics = get('demographics', [])
                         
-                        insight = f"Area: {area_name}\n"
-                        insight += f"  - Foot Traffic: {foot_traffic:.2f}\n"
-                        insight += f"  - Competition Level: {competition:.2f}\n"
-                        insight += f"  - Growth Potential: {growth:.2f}\n"
+                        parts = [AREA_TEMPLATE.format(
+                            area=area_name,
+                            foot_traffic=get('foot_traffic', 0),
+                            competition=get('competition_score', 0),
+                            growth=get('growth_potential', 0)
+                        )]
                         
                         if demographics:
-                            insight += f"  - Key Demographics: {', '.join(demographics)}\n"
+                            parts.append(f"  - Key Demographics: {', '.join(demographics)}\n")
                         
-                        location_insights.append(insight)
+                        location_insights.append("".join(parts))
                 
                 # Combine all insights
                 kg_insights = []
@@ -272,30 +348,8 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     kg_insights.extend(location_insights)
         
         elif agent_name == "pdf_research":
-            # For PDF research queries, focus on extracting insights from research documents
-            research_topic = parameters.get("research_topic", "")
-            specific_focus = parameters.get("specific_focus", "")
             city = parameters.get("city", "")
             
-            # Build a query that will retrieve relevant document content
-            query_parts = ["restaurant business research"]
-            if research_topic:
-                query_parts.append(research_topic)
-            if specific_focus:
-                query_parts.append(specific_focus)
-            if city:
-                query_parts.append(f"in {city}")
-            
-            query = " ".join(query_parts) + " studies reports findings data statistics"
-            
-            # Perform knowledge base search with emphasis on research documents
-            kb_docs = kb.hybrid_search(
-                query,
-                user_filter={"metadata.type": {"$in": ["research", "food_consumption", "demographics", "real_estate"]}},
-                k=8  # Get more documents for research queries
-            )
-            kb_context = [doc.page_content for doc in kb_docs]
-            
             # If a city was mentioned, get relevant knowledge graph insights
             if city and kg:
                 # Get city-specific insights from the knowledge graph
@@ -334,21 +388,9 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                 ]
                 
         else:  # basic_query
-            # For basic queries, get more comprehensive information
-            query = state["messages"][-1].content
-            
             # Extract city names from query
-            city = None
-            city_names = ["mumbai", "delhi", "bangalore", "chennai", "hyderabad", "kolkata", "pune", "ahmedabad"]
-            query_lower = query.lower()
-            for city_name in city_names:
-                if city_name in query_lower:
-                    city = city_name.title()
-                    break
-            
-            # Perform knowledge base search
-            kb_docs = kb.hybrid_search(query, k=5)
-            kb_context = [doc.page_content for doc in kb_docs]
+            city_match = _CITY_PATTERN.search(query.lower())
+            city = city_match.group(0).title() if city_match else None
             
             # If a city was mentioned, get some basic knowledge graph insights
             if city and kg:
@@ -365,81 +407,75 @@ def create_agent_graph(kb: MongoKnowledgeBase, kg: Neo4jKnowledgeGraph):
                     f"Popular cuisines: {', '.join([pref.get('cuisine_type', '') for pref in cuisine_preferences[:3]])}"
                 ]
         
+        return kg_insights
+    
+    async def retrieve_context(state: AgentState) -> AgentState:
+        """Retrieve relevant context from knowledge base and knowledge graph.
+        
+        The KB search and the KG lookups are independent, so they run concurrently
+        in worker threads and the node waits only for the slower one.
+        """
+        routing_result = state["context"].get("routing", {})
+        agent_name = state["next_agent"]
+        parameters = routing_result.get("parameters", {})
+        query = state["messages"][-1].content
+        
+        kb_docs, kg_insights = await asyncio.gather(
+            asyncio.to_thread(search_kb, agent_name, parameters, query),
+            asyncio.to_thread(lookup_kg, agent_name, parameters, query)
+        )
+        kb_context = [doc.page_content for doc in kb_docs]
+        
         # Store retrieved context, ensuring not to exceed token limits
-        state["context"]["kb_context"] = "\n\n".join(kb_context[:5])  # Include more context
-        state["context"]["kg_insights"] = "\n\n".join(kg_insights[:8])  # Include more insights
+        state["context"]["kb_context"] = join_within_budget(kb_context, 5, KB_CONTEXT_CHARS)
+        state["context"]["kg_insights"] = join_within_budget(kg_insights, 8, KG_INSIGHTS_CHARS)
         
         return state
     
-    def run_location_recommender(state: AgentState) -> AgentState:
+    async def run_location_recommender(state: AgentState) -> AgentState:
         """Run the location recommender agent."""
         routing_result = state["context"].get("routing", {})
         parameters = routing_result.get("parameters", {})
         kb_context = state["context"].get("kb_context", "")
         kg_insights = state["context"].get("kg_insights", "")
         
-        response = location_recommender.run(parameters, kb_context, kg_insights)
+        response = await _collect(location_recommender.astream(parameters, kb_context, kg_insights))
         
         # Add the response to messages
         state["messages"].append(AIMessage(content=response))
         return state
     
-    def run_regulatory_advisor(state: AgentState) -> AgentState:
+    async def run_regulatory_advisor(state: AgentState) -> AgentState:
         """Run the regulatory advisor agent."""
         routing_result = state["context"].get("routing", {})
         parameters = routing_result.get("parameters", {})
         kb_context = state["context"].get("kb_context", "")
         kg_insights = state["context"].get("kg_insights", "")
         
-        response = regulatory_advisor.run(parameters, kb_context, kg_insights)
+        response = await _collect(regulatory_advisor.astream(parameters, kb_context, kg_insights))
         
         # Add the response to messages
         state["messages"].append(AIMessage(content=response))
         return state
     
-    def run_market_analysis(state: AgentState) -> AgentState:
+    async def run_market_analysis(state: AgentState) -> AgentState:
         """Run the market analysis agent."""
         routing_result = state["context"].get("routing", {})
         parameters = routing_result.get("parameters", {})
         kb_context = state["context"].get("kb_context", "")
         kg_insights = state["context"].get("kg_insights", "")
         
-        response = market_analysis.run(parameters, kb_context, kg_insights)
+        # The agent parses a JSON answer and has no async path, so keep it off the event loop
+        response = await asyncio.to_thread(market_analysis.run, parameters, kb_context, kg_insights)
         
         # Format the JSON response for better readability
-        formatted_response = f"""# Market Analysis Results
-
-## Market Potential
-Score: {response.get('market_potential', {}).get('score', 'N/A')}/10
-{response.get('market_potential', {}).get('reasoning', 'No data available')}
-
-## Competition Analysis
-Saturation Level: {response.get('competition_analysis', {}).get('saturation_level', 'N/A')}
-Major Competitors: {', '.join(response.get('competition_analysis', {}).get('major_competitors', ['None identified']))}
-
-Differentiation Opportunities:
-{chr(10).join('- ' + item for item in response.get('competition_analysis', {}).get('differentiation_opportunities', ['None identified']))}
-
-## Consumer Trends
-Relevant Trends:
-{chr(10).join('- ' + item for item in response.get('consumer_trends', {}).get('relevant_trends', ['No trends identified']))}
-
-Recommendations:
-{chr(10).join('- ' + item for item in response.get('consumer_trends', {}).get('recommendations', ['No recommendations available']))}
-
-## Pricing Strategy
-Recommended Price Point: {response.get('pricing_strategy', {}).get('recommended_price_point', 'N/A')}
-{response.get('pricing_strategy', {}).get('reasoning', 'No reasoning provided')}
-
-## Risk Factors
-{chr(10).join('- ' + item.get('factor', '') + ': ' + item.get('mitigation', '') for item in response.get('risk_factors', [{'factor': 'No risk factors identified', 'mitigation': ''}]))}
-"""
+        formatted_response = format_market_analysis(response)
         
         # Add the response to messages
         state["messages"].append(AIMessage(content=formatted_response))
         return state
         
-    def run_pdf_research(state: AgentState) -> AgentState:
+    async def run_pdf_research(state: AgentState) -> AgentState:
         """Run the PDF research agent."""
         latest_message = state["messages"][-1]
         if not isinstance(latest_message, HumanMessage):
@@ -450,13 +486,13 @@ Recommended Price Point: {response.get('pricing_strategy', {}).get('recommended_
         kg_insights = state["context"].get("kg_insights", "")
         
         # Get response from the PDF research agent
-        response = pdf_research.run(query, kg_insights)
+        response = await _collect(pdf_research.astream(query, kg_insights))
         
         # Add the response to messages
         state["messages"].append(AIMessage(content=response))
         return state
     
-    def run_basic_query(state: AgentState) -> AgentState:
+    async def run_basic_query(state: AgentState) -> AgentState:
         """Run the basic query agent."""
         latest_message = state["messages"][-1]
         if not isinstance(latest_message, HumanMessage):
@@ -465,44 +501,46 @@ Recommended Price Point: {response.get('pricing_strategy', {}).get('recommended_
         query = latest_message.content
         kb_context = state["context"].get("kb_context", "")
         
+        answer = await _collect(basic_query.astream(query, kb_context))
+        
         # Check if access was denied to another agent
         if state["context"].get("access_denied"):
             response = f"""I'm sorry, but you don't have access to that functionality with your current permissions.
             
 Your query has been processed with limited access. Here's what I can tell you:
 
-{basic_query.run(query, kb_context)}
+{answer}
 
 For more detailed information, please contact your administrator to upgrade your access level."""
         else:
-            response = basic_query.run(query, kb_context)
+            response = answer
         
         # Add the response to messages
         state["messages"].append(AIMessage(content=response))
         return state
     
+    async def route_and_retrieve(state: AgentState) -> AgentState:
+        """Route the query and fetch the routed agent's context in a single graph step."""
+        return await retrieve_context(await route_query(state))
+    
     # Build the graph
     workflow = StateGraph(AgentState)
     
     # Add nodes
-    workflow.add_node("route_query", route_query)
-    workflow.add_node("retrieve_context", retrieve_context)
+    workflow.add_node("route_and_retrieve", route_and_retrieve)
     workflow.add_node("location_recommender", run_location_recommender)
     workflow.add_node("regulatory_advisor", run_regulatory_advisor)
     workflow.add_node("market_analysis", run_market_analysis)
     workflow.add_node("pdf_research", run_pdf_research)
     workflow.add_node("basic_query", run_basic_query)
     
-    # Add edges
-    workflow.add_edge("route_query", "retrieve_context")
-    
     # Create a router function that returns the next agent as a string
     def router_func(state):
         return check_permissions_and_route(state)
         
     # Add conditional edges
     workflow.add_conditional_edges(
-        "retrieve_context",
+        "route_and_retrieve",
         router_func,
         {
             "location_recommender": "location_recommender",
@@ -519,7 +557,7 @@ For more detailed information, please contact your administrator to upgrade your
     workflow.add_edge("basic_query", END)
     
     # Set the entry point
-    workflow.set_entry_point("route_query")
+    workflow.set_entry_point("route_and_retrieve")
     
     # Compile the graph
     return workflow.compile()
@@ -537,13 +575,18 @@ class AgentOrchestrator:
     
     def get_user_memory(self, user_id: str) -> List[BaseMessage]:
         """Get user-specific memory."""
-        if user_id not in self.memory:
-            self.memory[user_id] = [
+        messages = self.memory.get(user_id)
+        if messages is None:
+            messages = self.memory[user_id] = [
                 SystemMessage(content="You are a restaurant advisor system that helps users set up restaurant chains across India.")
             ]
-        return self.memory[user_id]
+        return messages
     
     def run(self, query: str, user: Dict) -> str:
+        """Run the agent graph with user query and user information."""
+        return asyncio.run(self.arun(query, user))
+    
+    async def arun(self, query: str, user: Dict) -> str:
         """Run the agent graph with user query and user information."""
         try:
             # Get user memory
@@ -564,7 +607,7 @@ class AgentOrchestrator:
             
             # Run the graph
             print("Running graph...")
-            result = self.graph.invoke(initial_state)
+            result = await self.graph.ainvoke(initial_state)
             print("Graph execution completed")
             
             # Update user memory with the new conversation
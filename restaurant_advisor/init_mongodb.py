@@ -2,7 +2,10 @@ import os
 import ssl
 import pymongo
 from pymongo import MongoClient
-from utils.config import MONGODB_URI, MONGODB_DATABASE, MONGODB_COLLECTION, MONGODB_VECTOR_COLLECTION
+from utils.config import (
+    MONGODB_URI, MONGODB_DATABASE, MONGODB_COLLECTION, MONGODB_VECTOR_COLLECTION,
+    KB_PARTITIONS, KB_PARTITION_VIEWS
+)
 
 def init_mongodb():
     """Initialize MongoDB collections and indexes."""
@@ -22,6 +25,16 @@ def init_mongodb():
         print(f"Creating collection: {MONGODB_VECTOR_COLLECTION}")
         db.create_collection(MONGODB_VECTOR_COLLECTION)
     
+    # One view of the vectors collection per KB partition. Atlas Vector Search can index
+    # views whose $match uses $expr, so each agent's searches can scan a smaller index
+    for partition, document_types in KB_PARTITIONS.items():
+        view = KB_PARTITION_VIEWS[partition]
+        if view not in db.list_collection_names():
+            print(f"Creating view: {view}")
+            db.create_collection(view, viewOn=MONGODB_VECTOR_COLLECTION, pipeline=[
+                {"$match": {"$expr": {"$in": ["$metadata.type", list(document_types)]}}}
+            ])
+    
     # Create text index on the documents collection
     print("Creating text index on documents collection")
     db[MONGODB_COLLECTION].create_index([("content", pymongo.TEXT)])
@@ -44,6 +57,13 @@ def init_mongodb():
     print("   - Vector field: embedding")
     print("   - Dimension: 384 (for sentence-transformers/all-MiniLM-L6-v2)")
     print("   - Metric: cosine")
+    print("   - Filter field: metadata.type (agents' searches are pre-filtered on document type)")
+    print("   - Quantization: scalar (int8 keeps the index in memory; searches oversample to recover recall)")
+    print("4. Optionally create the same index on each partition view, then set")
+    print("   MONGODB_PARTITIONED_VECTOR_SEARCH=true so agents search their partition's smaller index:")
+    for view in KB_PARTITION_VIEWS.values():
+        print(f"   - Collection: {view}")
+    print("   Dedicated Search Nodes keep these indexes in memory apart from the database workload.")
     
     print("\nYour MongoDB database is ready for use with Restaurant Advisor!")
 
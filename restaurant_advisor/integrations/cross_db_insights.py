@@ -204,13 +204,16 @@ class CrossDBInsights:
             reverse=True
         )
         
-        # Get supporting insights for the top gaps
-        supporting_insights = {}
-        for gap in potential_gaps[:3]:
-            cuisine = gap["cuisine"]
-            query = f"{cuisine} cuisine market opportunity in {city}"
-            insights = self.kb.hybrid_search(query, k=2)
-            supporting_insights[cuisine] = [doc.page_content for doc in insights]
+        # Get supporting insights for the top gaps in one batch
+        top_cuisines = [gap["cuisine"] for gap in potential_gaps[:3]]
+        gap_insights = self.kb.hybrid_search_many([
+            {"query": f"{cuisine} cuisine market opportunity in {city}", "k": 2}
+            for cuisine in top_cuisines
+        ])
+        supporting_insights = {
+            cuisine: [doc.page_content for doc in insights]
+            for cuisine, insights in zip(top_cuisines, gap_insights)
+        }
         
         return {
             "identified_gaps": potential_gaps[:5],
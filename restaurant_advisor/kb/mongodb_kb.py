@@ -1,7 +1,11 @@
-from typing import Dict, List, Optional, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any, Tuple, TypedDict
 import os
 import sys
+import threading
+import time
 import pymongo
+from bson.binary import Binary, BinaryVectorDtype
 from pymongo import MongoClient
 # Use only the updated MongoDB Atlas Vector Search implementation
 from langchain_mongodb import MongoDBAtlasVectorSearch
@@ -17,9 +21,90 @@ from utils.config import (
     MONGODB_DATABASE, 
     MONGODB_COLLECTION, 
     MONGODB_VECTOR_COLLECTION,
+    MONGODB_CLIENT_OPTIONS,
+    MONGODB_PARTITIONED_VECTOR_SEARCH,
+    KB_PARTITION_VIEWS,
     EMBEDDING_MODEL
 )
 
+# Fields read from the documents collection when building search results
+DOCUMENT_PROJECTION = {
+    "_id": 0,
+    "content": 1,
+    "file_name": 1,
+    "file_path": 1,
+    "category": 1,
+    "chunk_id": 1,
+    "page_number": 1
+}
+
+# The vector index quantizes embeddings to int8, so vector searches consider this many
+# candidates per requested result and rank them at full precision
+VECTOR_SEARCH_OVERSAMPLING = 20
+
+# Reciprocal rank fusion penalty: a document ranked r-th (from 0) in a result list scores
+# weight / (RRF_RANK_PENALTY + r + 1), so agreement between the lists outweighs any single rank
+RRF_RANK_PENALTY = 60
+
+class HybridQuery(TypedDict, total=False):
+    """One search in a hybrid_search_many() batch; fields mirror hybrid_search() arguments."""
+    query: str
+    user_filter: Optional[Dict]
+    k: int
+    partition: Optional[str]
+
+class HybridSearchBatcher:
+    """Coalesces hybrid searches from concurrent requests into hybrid_search_many() batches.
+    
+    The first caller to arrive waits briefly for others, then runs every search queued
+    meanwhile with one embedding call; the other callers block until their result is in.
+    """
+    
+    def __init__(self, search_many: Callable[[List[HybridQuery]], List[List[Document]]],
+                 window: float = 0.005, max_batch: int = 32):
+        """Initialize the batcher.
+        
+        Args:
+            search_many: Function running a batch of searches, e.g. hybrid_search_many
+            window: Seconds the first search of a batch waits for others to join it
+            max_batch: Maximum number of searches run by one search_many call
+        """
+        self._search_many = search_many
+        self._window = window
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[HybridQuery, Future]] = []
+    
+    def hybrid_search(self, query: str, user_filter: Optional[Dict] = None, k: int = 5,
+                      partition: Optional[str] = None) -> List[Document]:
+        """Perform a hybrid search as part of the next batch; arguments mirror MongoKnowledgeBase.hybrid_search."""
+        future: Future = Future()
+        with self._lock:
+            self._pending.append(
+                ({"query": query, "user_filter": user_filter, "k": k, "partition": partition}, future)
+            )
+            leader = len(self._pending) == 1
+        
+        if leader:
+            time.sleep(self._window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            for start in range(0, len(batch), self._max_batch):
+                self._run(batch[start:start + self._max_batch])
+        
+        return future.result()
+    
+    def _run(self, batch: List[Tuple[HybridQuery, Future]]) -> None:
+        """Run one batch of searches and hand each caller its result."""
+        try:
+            results = self._search_many([search for search, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
 class SentenceTransformerEmbeddings(Embeddings):
     """Sentence Transformer embeddings wrapper for LangChain."""
     
@@ -40,13 +125,17 @@ class MongoKnowledgeBase:
     def __init__(self):
         # Connect to MongoDB with SSL certificate verification disabled
         # This is needed when there are certificate verification issues
-        self.client = MongoClient(MONGODB_URI, tlsAllowInvalidCertificates=True)
+        self.client = MongoClient(MONGODB_URI, tlsAllowInvalidCertificates=True, **MONGODB_CLIENT_OPTIONS)
         self.db = self.client[MONGODB_DATABASE]
         self.collection = self.db[MONGODB_COLLECTION]
         self.vector_collection = self.db[MONGODB_VECTOR_COLLECTION]
         
         # Initialize embeddings model
         self.embeddings = SentenceTransformerEmbeddings()
+        self._vector_stores: Dict[Optional[str], MongoDBAtlasVectorSearch] = {}
+        
+        # Shared by every request using this knowledge base, so concurrent searches batch together
+        self.search_batcher = HybridSearchBatcher(self.hybrid_search_many)
         
         # Create indexes if they don't exist
         self._create_indexes()
@@ -84,13 +173,14 @@ class MongoKnowledgeBase:
             "metadata": document.metadata
         }).inserted_id
         
-        # Calculate and store vector embedding in the vector collection
+        # Calculate and store vector embedding in the vector collection, packed as float32
+        # BinData (a third of the size of a BSON array of doubles)
         try:
             embedding = self.embeddings.embed_query(document.page_content)
             self.vector_collection.insert_one({
                 "content": document.page_content,
                 "metadata": document.metadata,
-                "embedding": embedding,
+                "embedding": Binary.from_vector(embedding, BinaryVectorDtype.FLOAT32),
                 "document_id": doc_id
             })
             print(f"Vector embedding stored for document {doc_id}")
@@ -103,43 +193,67 @@ class MongoKnowledgeBase:
         """Store multiple documents in the knowledge base."""
         return [self.store_document(doc) for doc in documents]
     
-    def get_vector_store(self, user_filter: Optional[Dict] = None):
-        """Get a vector store instance for semantic search."""
-        # Apply user filter if provided
-        index_name = "default_vector_index"  # This would be created in MongoDB Atlas UI
-        
-        # Create vector store with the new MongoDB Atlas Vector Search implementation
-        # Note: pre_filter_pipeline is the correct parameter for filtering in the new implementation
-        pre_filter = None
-        if user_filter:
-            pre_filter = [{"$match": user_filter}]
-        
-        vector_store = MongoDBAtlasVectorSearch(
-            embedding=self.embeddings,
-            collection=self.vector_collection,
-            index_name=index_name,
-            embedding_key="embedding",
-            text_key="content",
-            pre_filter_pipeline=pre_filter
-        )
+    def get_vector_store(self, partition: Optional[str] = None) -> MongoDBAtlasVectorSearch:
+        """Get the vector store used for semantic search, created on first use.
+        
+        Args:
+            partition: Optional KB_PARTITIONS key; when partitioned vector search is enabled,
+                search that partition's view of the vectors collection instead of all of it
+        
+        Returns:
+            The vector store for the partition, or for the whole vectors collection
+        """
+        if not MONGODB_PARTITIONED_VECTOR_SEARCH or partition not in KB_PARTITION_VIEWS:
+            partition = None
+        
+        vector_store = self._vector_stores.get(partition)
+        if vector_store is None:
+            index_name = "default_vector_index"  # This would be created in MongoDB Atlas UI
+            collection = self.vector_collection if partition is None else self.db[KB_PARTITION_VIEWS[partition]]
+            
+            # Filters are passed per search as pre_filter, which $vectorSearch applies during the index scan
+            vector_store = self._vector_stores[partition] = MongoDBAtlasVectorSearch(
+                embedding=self.embeddings,
+                collection=collection,
+                index_name=index_name,
+                embedding_key="embedding",
+                text_key="content"
+            )
         
         return vector_store
     
     def semantic_search(self, query: str, user_filter: Optional[Dict] = None, k: int = 5) -> List[Document]:
         """Perform semantic search on the knowledge base."""
-        # Get vector store with the correct pre_filter_pipeline
-        vector_store = self.get_vector_store(user_filter)
+        vector_store = self.get_vector_store()
         
         try:
             # Try to perform semantic search
-            return vector_store.similarity_search(query, k=k)
+            return vector_store.similarity_search(
+                query, k=k, pre_filter=user_filter, oversampling_factor=VECTOR_SEARCH_OVERSAMPLING
+            )
+        except Exception as e:
+            print(f"Error during semantic search: {str(e)}")
+            # Return empty list in case of errors
+            return []
+    
+    def semantic_search_by_vector(self, embedding: Optional[List[float]], user_filter: Optional[Dict] = None,
+                                  k: int = 5, partition: Optional[str] = None) -> List[Document]:
+        """Perform semantic search with an already embedded query, optionally within one KB partition."""
+        if embedding is None:
+            return []
+        vector_store = self.get_vector_store(partition)
+        
+        try:
+            return vector_store.similarity_search_by_vector(
+                embedding, k=k, pre_filter=user_filter, oversampling_factor=VECTOR_SEARCH_OVERSAMPLING
+            )
         except Exception as e:
             print(f"Error during semantic search: {str(e)}")
             # Return empty list in case of errors
             return []
     
     def hybrid_search(self, query: str, user_filter: Optional[Dict] = None, k: int = 5, 
-                    reranking_factor: float = 0.5) -> List[Document]:
+                    reranking_factor: float = 0.5, partition: Optional[str] = None) -> List[Document]:
         """Perform hybrid search (keyword + semantic) on the knowledge base.
         
         Args:
@@ -147,58 +261,74 @@ class MongoKnowledgeBase:
             user_filter: Optional metadata filter
             k: Number of results to return
             reranking_factor: Weight for semantic vs keyword (0.0-1.0), higher values favor semantic results
+            partition: Optional KB_PARTITIONS key whose vector index the semantic search uses;
+                user_filter should not match documents outside the partition
         
         Returns:
             List of document results with combined ranking
         """
+        return self.hybrid_search_many(
+            [{"query": query, "user_filter": user_filter, "k": k, "partition": partition}],
+            reranking_factor=reranking_factor
+        )[0]
+    
+    def hybrid_search_many(self, queries: List[HybridQuery], reranking_factor: float = 0.5) -> List[List[Document]]:
+        """Perform several hybrid searches, embedding all queries in one model call.
+        
+        Args:
+            queries: Searches to run, each with a query and optional user_filter, k and partition
+            reranking_factor: Weight for semantic vs keyword (0.0-1.0), higher values favor semantic results
+        
+        Returns:
+            One list of ranked documents per search, in the same order as the queries
+        """
+        if not queries:
+            return []
+        
+        try:
+            embeddings = self.embeddings.embed_documents([search["query"] for search in queries])
+        except Exception as e:
+            print(f"Error embedding search queries: {str(e)}")
+            embeddings = [None] * len(queries)
+        
+        if len(queries) == 1:
+            return [self._hybrid_search_one(queries[0], embeddings[0], reranking_factor)]
+        
+        # The searches are independent round trips, so run them concurrently over the pooled client
+        with ThreadPoolExecutor(max_workers=min(len(queries), 8)) as executor:
+            return list(executor.map(
+                lambda search, embedding: self._hybrid_search_one(search, embedding, reranking_factor),
+                queries, embeddings
+            ))
+    
+    def _hybrid_search_one(self, search: HybridQuery, embedding: Optional[List[float]],
+                           reranking_factor: float) -> List[Document]:
+        """Run one hybrid search with a precomputed query embedding."""
+        query = search["query"]
+        user_filter = search.get("user_filter")
+        k = search.get("k", 5)
         try:
             # First do a keyword search
             keyword_results = self.keyword_search(query, user_filter, k=k*2)
             
             # Then do a semantic search
-            semantic_results = self.semantic_search(query, user_filter, k=k*2)
-            
-            # Score and combine results
-            scored_results = {}
-            
-            # Process keyword results
-            for i, doc in enumerate(keyword_results):
-                doc_id = doc.metadata.get("source", "") + doc.page_content[:100]
-                keyword_score = 1.0 - (i / len(keyword_results)) if keyword_results else 0
-                scored_results[doc_id] = {
-                    "doc": doc,
-                    "keyword_score": keyword_score,
-                    "semantic_score": 0.0
-                }
-            
-            # Process semantic results
-            for i, doc in enumerate(semantic_results):
-                doc_id = doc.metadata.get("source", "") + doc.page_content[:100]
-                semantic_score = 1.0 - (i / len(semantic_results)) if semantic_results else 0
-                
-                if doc_id in scored_results:
-                    scored_results[doc_id]["semantic_score"] = semantic_score
-                else:
-                    scored_results[doc_id] = {
-                        "doc": doc,
-                        "keyword_score": 0.0,
-                        "semantic_score": semantic_score
-                    }
-            
-            # Calculate combined scores and rank
-            for doc_id, data in scored_results.items():
-                data["combined_score"] = (data["keyword_score"] * (1-reranking_factor) + 
-                                          data["semantic_score"] * reranking_factor)
-            
-            # Sort by combined score
-            ranked_results = sorted(
-                scored_results.values(), 
-                key=lambda x: x["combined_score"], 
-                reverse=True
+            semantic_results = self.semantic_search_by_vector(
+                embedding, user_filter, k=k*2, partition=search.get("partition")
             )
             
-            # Return the documents
-            return [item["doc"] for item in ranked_results[:k]]
+            # Fuse the two rankings with weighted reciprocal rank fusion
+            fused = {}
+            for results, weight in ((keyword_results, 1 - reranking_factor), (semantic_results, reranking_factor)):
+                for rank, doc in enumerate(results):
+                    doc_id = doc.metadata.get("source", "") + doc.page_content[:100]
+                    entry = fused.get(doc_id)
+                    if entry is None:
+                        entry = fused[doc_id] = [doc, 0.0]
+                    entry[1] += weight / (RRF_RANK_PENALTY + rank + 1)
+            
+            # Return the best fused documents
+            ranked_results = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+            return [doc for doc, _ in ranked_results[:k]]
             
         except Exception as e:
             print(f"Error during hybrid search: {str(e)}")
@@ -218,7 +348,7 @@ class MongoKnowledgeBase:
             
         # Execute search
         results = self.collection.find(
-            search_filter
+            search_filter, DOCUMENT_PROJECTION
         ).sort([("score", {"$meta": "textScore"})]).limit(k)
         
         # Convert to Documents
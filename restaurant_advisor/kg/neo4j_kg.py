@@ -1,4 +1,6 @@
-from typing import Dict, List, Optional, Any, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 import os
 import sys
 import neo4j
@@ -9,6 +11,29 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
 
+# Weighted location score shared by the recommendation queries
+LOCATION_SCORE_EXPR = """
+                    CASE WHEN l.foot_traffic IS NOT NULL 
+                         THEN l.foot_traffic * 0.3 ELSE 0.0 END +
+                    CASE WHEN l.competition_score IS NOT NULL 
+                         THEN (1.0 - l.competition_score) * 0.2 ELSE 0.0 END +
+                    CASE WHEN l.growth_potential IS NOT NULL 
+                         THEN l.growth_potential * 0.2 ELSE 0.0 END +
+                    CASE WHEN l.rent_score IS NOT NULL 
+                         THEN (1.0 - l.rent_score) * 0.3 ELSE 0.0 END
+"""
+
+# Location properties returned alongside recommendations
+LOCATION_PROPERTIES_MAP = """{
+                        foot_traffic: l.foot_traffic,
+                        competition_score: l.competition_score,
+                        growth_potential: l.growth_potential,
+                        rent_score: l.rent_score,
+                        commercial: l.commercial,
+                        popular_cuisines: l.popular_cuisines,
+                        demographics: l.demographics
+                    }"""
+
 class Neo4jKnowledgeGraph:
     """Neo4j-based knowledge graph for restaurant location recommendations."""
     
@@ -21,6 +46,11 @@ class Neo4jKnowledgeGraph:
             auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
         )
         
+        # Read session shared by the lookups inside request_session(), if any
+        self._request_session: ContextVar[Optional[neo4j.Session]] = ContextVar(
+            "neo4j_request_session", default=None
+        )
+        
         # Initialize the database schema
         self._init_schema()
         
@@ -58,6 +88,35 @@ class Neo4jKnowledgeGraph:
         """Close the Neo4j connection."""
         self.driver.close()
     
+    @contextmanager
+    def request_session(self) -> Iterator[neo4j.Session]:
+        """Share one read session across all lookups made inside this block.
+        
+        Read methods called within the block reuse the session instead of each
+        opening their own. Nested blocks reuse the outer session. The session is
+        bound to the current context, so concurrent requests each get their own.
+        """
+        session = self._request_session.get()
+        if session is not None:
+            yield session
+            return
+        with self.driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
+            token = self._request_session.set(session)
+            try:
+                yield session
+            finally:
+                self._request_session.reset(token)
+    
+    @contextmanager
+    def _read_session(self) -> Iterator[neo4j.Session]:
+        """Yield the active request session, or a short-lived session outside of one."""
+        session = self._request_session.get()
+        if session is not None:
+            yield session
+        else:
+            with self.driver.session() as session:
+                yield session
+    
     def add_city(self, name: str, state: str, population: int, 
                  demographics: Dict = None, key_markets: List[str] = None) -> bool:
         """Add a city to the knowledge graph."""
@@ -170,7 +229,7 @@ class Neo4jKnowledgeGraph:
     
     def find_locations_by_city(self, city: str) -> List[Dict]:
         """Find all locations in a city."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             result = session.run("""
                 MATCH (c:City {name: $city})-[:HAS_LOCATION]->(l:Location)
                 RETURN l.id AS id, l.area AS area, l.type AS type, l.properties AS properties
@@ -181,7 +240,7 @@ class Neo4jKnowledgeGraph:
     def find_nearby_locations(self, location_id: str, relation_type: str = "NEAR", 
                              max_distance: int = 2) -> List[Dict]:
         """Find nearby locations using graph traversal."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             result = session.run("""
                 MATCH (l:Location {id: $id})-[:`{}`*1..{}]->(nearby:Location)
                 RETURN nearby.id AS id, nearby.area AS area, nearby.type AS type, 
@@ -199,7 +258,7 @@ class Neo4jKnowledgeGraph:
         Returns:
             Dict with demographic details
         """
-        with self.driver.session() as session:
+        with self._read_session() as session:
             result = session.run("""
                 MATCH (c:City {name: $city})
                 RETURN 
@@ -225,7 +284,7 @@ class Neo4jKnowledgeGraph:
         Returns:
             List of location dictionaries with detailed information
         """
-        with self.driver.session() as session:
+        with self._read_session() as session:
             query = """
                 MATCH (c:City {name: $city})-[:HAS_LOCATION]->(l:Location)
                 WHERE l.commercial = true
@@ -262,9 +321,10 @@ class Neo4jKnowledgeGraph:
             return [dict(record) for record in result]
     
     def recommend_locations(self, city: str, cuisine_type: str = None, 
-                          target_demographic: str = None, min_score: float = 0.5) -> List[Dict]:
-        """Recommend locations for a restaurant based on various factors."""
-        with self.driver.session() as session:
+                          target_demographic: str = None, min_score: float = 0.5,
+                          limit: int = 10) -> List[Dict]:
+        """Recommend up to `limit` locations for a restaurant based on various factors."""
+        with self._read_session() as session:
             # Build a complex query that considers multiple factors
             query = """
                 MATCH (c:City {name: $city})-[:HAS_LOCATION]->(l:Location)
@@ -290,32 +350,16 @@ class Neo4jKnowledgeGraph:
                 params["target_demographic"] = target_demographic
             
             # Calculate score
-            query += """
-                WITH l, (
-                    CASE WHEN l.foot_traffic IS NOT NULL 
-                         THEN l.foot_traffic * 0.3 ELSE 0.0 END +
-                    CASE WHEN l.competition_score IS NOT NULL 
-                         THEN (1.0 - l.competition_score) * 0.2 ELSE 0.0 END +
-                    CASE WHEN l.growth_potential IS NOT NULL 
-                         THEN l.growth_potential * 0.2 ELSE 0.0 END +
-                    CASE WHEN l.rent_score IS NOT NULL 
-                         THEN (1.0 - l.rent_score) * 0.3 ELSE 0.0 END
-                ) AS score
+            query += f"""
+                WITH l, ({LOCATION_SCORE_EXPR}) AS score
                 WHERE score >= $min_score
                 RETURN l.id AS id, l.area AS area, l.type AS type, score,
-                    {
-                        foot_traffic: l.foot_traffic,
-                        competition_score: l.competition_score,
-                        growth_potential: l.growth_potential,
-                        rent_score: l.rent_score,
-                        commercial: l.commercial,
-                        popular_cuisines: l.popular_cuisines,
-                        demographics: l.demographics
-                    } AS properties
+                    {LOCATION_PROPERTIES_MAP} AS properties
                 ORDER BY score DESC
-                LIMIT 10
+                LIMIT $limit
             """
             params["min_score"] = min_score
+            params["limit"] = limit
             
             try:
                 result = session.run(query, **params)
@@ -326,7 +370,7 @@ class Neo4jKnowledgeGraph:
     
     def get_location_details(self, location_id: str) -> Optional[Dict]:
         """Get detailed information about a specific location."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             result = session.run("""
                 MATCH (l:Location {id: $id})
                 OPTIONAL MATCH (l)-[r]->(related)
@@ -348,14 +392,17 @@ class Neo4jKnowledgeGraph:
             record = result.single()
             return dict(record) if record else None
 
-    def get_regulatory_info(self, city: str) -> List[Dict]:
-        """Get regulatory information for restaurant setup in a city."""
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (c:City {name: $city})-[:HAS_REGULATION]->(r:Regulation)
-                RETURN r.type AS type, r.description AS description, 
-                       r.authority AS authority, r.requirements AS requirements
-            """, city=city)
+    def get_regulatory_info(self, city: str, limit: Optional[int] = None) -> List[Dict]:
+        """Get regulatory information for restaurant setup in a city, at most `limit` regulations if given."""
+        query = """
+            MATCH (c:City {name: $city})-[:HAS_REGULATION]->(r:Regulation)
+            RETURN r.type AS type, r.description AS description, 
+                   r.authority AS authority, r.requirements AS requirements
+        """
+        if limit is not None:
+            query += "LIMIT $limit"
+        with self._read_session() as session:
+            result = session.run(query, city=city, limit=limit)
             
             return [dict(record) for record in result]
             
@@ -378,7 +425,7 @@ class Neo4jKnowledgeGraph:
             
     def get_cuisine_preferences(self, city: str) -> List[Dict]:
         """Get cuisine preferences for a city."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             result = session.run("""
                 MATCH (c:City {name: $city})-[:HAS_LOCATION]->(l:Location)
                 WHERE l.popular_cuisines IS NOT NULL
@@ -386,22 +433,98 @@ class Neo4jKnowledgeGraph:
                 LIMIT 10
             """, city=city)
             
-            # Process results - flatten the list of cuisines from locations
-            cuisine_counts = {}
-            for record in result:
-                cuisines = record.get("cuisines", [])
-                if cuisines:
-                    for cuisine in cuisines:
-                        if cuisine in cuisine_counts:
-                            cuisine_counts[cuisine] += 1
-                        else:
-                            cuisine_counts[cuisine] = 1
-            
-            # Return formatted cuisine preferences
-            return [{"cuisine_type": cuisine, "popularity": count} 
-                   for cuisine, count in sorted(cuisine_counts.items(), 
-                                               key=lambda x: x[1], 
-                                               reverse=True)]
+            return self._rank_cuisines(record.get("cuisines", []) for record in result)
+    
+    @staticmethod
+    def _rank_cuisines(cuisine_lists) -> List[Dict]:
+        """Flatten per-location cuisine lists into cuisine preferences ranked by popularity."""
+        cuisine_counts = {}
+        for cuisines in cuisine_lists:
+            if cuisines:
+                for cuisine in cuisines:
+                    if cuisine in cuisine_counts:
+                        cuisine_counts[cuisine] += 1
+                    else:
+                        cuisine_counts[cuisine] = 1
+        
+        # Return formatted cuisine preferences
+        return [{"cuisine_type": cuisine, "popularity": count} 
+               for cuisine, count in sorted(cuisine_counts.items(), 
+                                           key=lambda x: x[1], 
+                                           reverse=True)]
+    
+    def get_city_bundle(self, city: str, needs: Tuple[str, ...] = ("regulations", "cuisine", "locations"),
+                        location_limit: int = 10, min_score: float = 0.5,
+                        regulation_limit: Optional[int] = None) -> Dict[str, Any]:
+        """Fetch several kinds of city data in a single round trip.
+        
+        Args:
+            city: The city name
+            needs: Which of "regulations", "cuisine", "locations" and "demographics" to fetch
+            location_limit: Maximum number of recommended locations
+            min_score: Minimum location score, as in recommend_locations
+            regulation_limit: Maximum number of regulations returned (all if None);
+                "regulation_count" still counts every regulation
+            
+        Returns:
+            Dict keyed by each requested need, shaped like get_regulatory_info,
+            get_cuisine_preferences, recommend_locations and get_detailed_city_demographics
+            respectively. Requesting regulations also adds the city's total "regulation_count".
+        """
+        # Each subquery only matches when its need was requested, so unrequested
+        # sections cost nothing beyond the city lookup
+        with self._read_session() as session:
+            result = session.run(f"""
+                MATCH (c:City {{name: $city}})
+                CALL {{
+                    WITH c
+                    OPTIONAL MATCH (c)-[:HAS_REGULATION]->(r:Regulation)
+                    WHERE 'regulations' IN $needs
+                    WITH collect(r {{.type, .description, .authority, .requirements}}) AS regulations
+                    RETURN size(regulations) AS regulation_count,
+                           CASE WHEN $regulation_limit IS NULL THEN regulations
+                                ELSE regulations[..$regulation_limit] END AS regulations
+                }}
+                CALL {{
+                    WITH c
+                    OPTIONAL MATCH (c)-[:HAS_LOCATION]->(l:Location)
+                    WHERE 'cuisine' IN $needs AND l.popular_cuisines IS NOT NULL
+                    WITH DISTINCT l.popular_cuisines AS cuisines
+                    LIMIT 10
+                    RETURN collect(cuisines) AS cuisine_lists
+                }}
+                CALL {{
+                    WITH c
+                    OPTIONAL MATCH (c)-[:HAS_LOCATION]->(l:Location)
+                    WHERE 'locations' IN $needs AND l.commercial = true
+                    WITH l, ({LOCATION_SCORE_EXPR}) AS score
+                    WHERE l IS NOT NULL AND score >= $min_score
+                    ORDER BY score DESC
+                    LIMIT $location_limit
+                    RETURN collect({{
+                        id: l.id, area: l.area, type: l.type, score: score,
+                        properties: {LOCATION_PROPERTIES_MAP}
+                    }}) AS locations
+                }}
+                RETURN regulation_count, regulations, cuisine_lists, locations,
+                       CASE WHEN 'demographics' IN $needs
+                            THEN c {{.name, .state, .population, .demographics, .key_markets}} END AS demographics
+            """, city=city, needs=list(needs), location_limit=location_limit, min_score=min_score,
+                regulation_limit=regulation_limit)
+            
+            record = result.single()
+        
+        bundle = {}
+        if "regulations" in needs:
+            bundle["regulations"] = record["regulations"] if record else []
+            bundle["regulation_count"] = record["regulation_count"] if record else 0
+        if "cuisine" in needs:
+            bundle["cuisine"] = self._rank_cuisines(record["cuisine_lists"]) if record else []
+        if "locations" in needs:
+            bundle["locations"] = record["locations"] if record else []
+        if "demographics" in needs:
+            bundle["demographics"] = record["demographics"] if record else {}
+        return bundle
     
     def add_cuisine_data(self, cuisine_type: str, popularity: List[str],
                        demographics: List[str] = None) -> bool:
@@ -451,7 +574,7 @@ class Neo4jKnowledgeGraph:
             
     def get_location_details_with_neighborhood_insights(self, city: str, location_id: str = None) -> Dict:
         """Get detailed location information with neighborhood insights."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             if location_id:
                 # Get details for a specific location
                 query = """
@@ -504,7 +627,7 @@ class Neo4jKnowledgeGraph:
                 
     def find_similar_locations_across_cities(self, reference_location_id: str, limit: int = 3) -> List[Dict]:
         """Find locations in other cities that are similar to a reference location."""
-        with self.driver.session() as session:
+        with self._read_session() as session:
             # First get the reference location details
             ref_query = """
                 MATCH (city:City)-[:HAS_LOCATION]->(ref:Location {id: $ref_id})
@@ -12,8 +12,11 @@ from kb.mongodb_kb import MongoKnowledgeBase
 from kg.neo4j_kg import Neo4jKnowledgeGraph
 from agents.orchestrator import AgentOrchestrator
 from agents.enhanced_orchestrator import EnhancedAgentOrchestrator
+from agents.memory_management import MemoryStore
 from utils.auth import authenticate_user, create_user, get_users
 from utils.config import ROLES
+from utils.llm_cache import PersistentResultCache
+from utils.logging_utils import configure_logging
 
 # Initialize rich console
 console = Console()
@@ -296,7 +299,9 @@ def chat(current_user):
         return
     
     # Initialize the enhanced agent orchestrator
-    orchestrator = EnhancedAgentOrchestrator(kb, kg)
+    orchestrator = EnhancedAgentOrchestrator(
+        kb, kg, memory_store=MemoryStore(), result_store=PersistentResultCache()
+    )
     
     # Load memory from disk if available
     try:
@@ -332,8 +337,11 @@ def chat(current_user):
         console.print("[bold yellow]Processing...[/bold yellow]")
         
         try:
-            response = orchestrator.run(query, current_user)
-            console.print(f"\n[bold green]Advisor[/bold green]:\n{response}")
+            # Print the response as it is generated rather than after it completes
+            console.print("\n[bold green]Advisor[/bold green]:")
+            for chunk in orchestrator.run_stream(query, current_user):
+                console.out(chunk, end="", highlight=False)
+            console.print()
             
             # Save memory periodically
             try:
@@ -355,6 +363,7 @@ def chat(current_user):
 @app.command()
 def main():
     """Main entry point for the application."""
+    configure_logging()
     display_welcome()
     
     # Check for existing users
@@ -14,6 +14,11 @@ from agents.enhanced_orchestrator import EnhancedAgentOrchestrator
 from kb.mongodb_kb import MongoKnowledgeBase
 from kg.neo4j_kg import Neo4jKnowledgeGraph
 from utils.auth import authenticate_user, create_user
+from utils.llm_cache import PersistentResultCache
+from utils.logging_utils import configure_logging
+
+# Log records are written by a background thread; repeated reruns keep the first setup
+configure_logging()
 
 # Page configuration
 st.set_page_config(
@@ -70,6 +75,11 @@ if "orchestrator" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+@st.cache_resource
+def shared_result_store() -> PersistentResultCache:
+    """The external result cache, opened once and shared by every session."""
+    return PersistentResultCache()
+
 def initialize_system():
     """Initialize the orchestrator and knowledge bases"""
     if st.session_state.orchestrator is None:
@@ -77,7 +87,7 @@ def initialize_system():
             try:
                 kb = MongoKnowledgeBase()
                 kg = Neo4jKnowledgeGraph()
-                st.session_state.orchestrator = EnhancedAgentOrchestrator(kb, kg)
+                st.session_state.orchestrator = EnhancedAgentOrchestrator(kb, kg, result_store=shared_result_store())
                 return True
             except Exception as e:
                 st.error(f"Failed to initialize system: {str(e)}")
@@ -184,13 +194,11 @@ def main_app():
         with st.chat_message("assistant"):
             with st.spinner("Analyzing..."):
                 try:
-                    response = st.session_state.orchestrator.run(
+                    # Display the response as it is generated; write_stream returns the full text
+                    response = st.write_stream(st.session_state.orchestrator.run_stream(
                         query, 
                         st.session_state.user
-                    )
-                    
-                    # Display response
-                    st.markdown(f'<div class="response-box">{response}</div>', unsafe_allow_html=True)
+                    ))
                     
                     # Store assistant message
                     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -1,5 +1,6 @@
 import json
 import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional
 import bcrypt
 from jose import jwt, JWTError
@@ -9,6 +10,20 @@ from utils.config import JWT_SECRET, ROLES
 # User database file location
 USER_DB_FILE = "users.json"
 
+# Bit assigned to each permission checked on the request path; a user's perm_mask ORs the granted bits
+AGENT_PERMISSION_BITS = {
+    agent_name: 1 << index
+    for index, agent_name in enumerate((
+        "location_recommender", "regulatory_advisor", "market_analysis", "consumer_survey",
+        "real_estate", "demographics", "market_research", "pdf_research", "domain_specialist",
+        "basic_query"
+    ))
+}
+RESOURCE_PERMISSION_BITS = {
+    ("kb", "read"): 1 << len(AGENT_PERMISSION_BITS),
+    ("kg", "read"): 1 << (len(AGENT_PERMISSION_BITS) + 1)
+}
+
 def get_users() -> Dict:
     """Load users from JSON file."""
     try:
@@ -49,6 +64,7 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
         return None
     if not verify_password(password, user["hashed_password"]):
         return None
+    user["perm_mask"] = permission_mask(user["role"])
     return user
 
 def create_access_token(data: Dict, expires_delta: Optional[datetime.timedelta] = None):
@@ -88,50 +104,54 @@ def create_user(username: str, password: str, role: str, full_name: str) -> bool
     save_users(users)
     return True
 
-def check_permission(user: Dict, resource_type: str, action: str) -> bool:
-    """Check if user has permission for a specific action on a resource type."""
-    role = user["role"]
+@lru_cache(maxsize=1024)
+def _role_allows(role: str, permission: str, item: str) -> bool:
+    """Check if a role's permission list allows an item.
+    
+    ROLES is static configuration, so the answer depends only on the arguments
+    and is memoized for the life of the process.
+    """
     role_permissions = ROLES.get(role, {})
     
-    if resource_type == "user_management" and role_permissions.get("user_management"):
-        return True
-        
-    # Check if the action is allowed for the resource type
-    allowed_actions = role_permissions.get(f"{resource_type}_access", [])
-    if "all" in allowed_actions or action in allowed_actions:
+    if permission == "user_management_access" and role_permissions.get("user_management"):
         return True
-        
-    return False
+    
+    allowed = role_permissions.get(permission, [])
+    return "all" in allowed or item in allowed
+
+@lru_cache(maxsize=None)
+def permission_mask(role: str) -> int:
+    """Compute the permission bitmask of everything a role is allowed."""
+    mask = 0
+    for agent_name, bit in AGENT_PERMISSION_BITS.items():
+        if _role_allows(role, "agent_access", agent_name):
+            mask |= bit
+    for (resource_type, action), bit in RESOURCE_PERMISSION_BITS.items():
+        if _role_allows(role, f"{resource_type}_access", action):
+            mask |= bit
+    return mask
+
+def check_permission(user: Dict, resource_type: str, action: str) -> bool:
+    """Check if user has permission for a specific action on a resource type."""
+    mask = user.get("perm_mask")
+    bit = RESOURCE_PERMISSION_BITS.get((resource_type, action))
+    if mask is not None and bit is not None:
+        return bool(mask & bit)
+    # Sessions created before perm_mask existed, or permissions without a bit
+    return _role_allows(user["role"], f"{resource_type}_access", action)
 
 def has_agent_access(user: Dict, agent_name: str) -> bool:
     """Check if user has access to a specific agent."""
-    role = user["role"]
-    role_permissions = ROLES.get(role, {})
-    
-    allowed_agents = role_permissions.get("agent_access", [])
-    if "all" in allowed_agents or agent_name in allowed_agents:
-        return True
-        
-    return False
+    mask = user.get("perm_mask")
+    bit = AGENT_PERMISSION_BITS.get(agent_name)
+    if mask is not None and bit is not None:
+        return bool(mask & bit)
+    return _role_allows(user["role"], "agent_access", agent_name)
 
 def has_domain_access(user: Dict, domain_name: str) -> bool:
     """Check if user has access to a specific domain specialist."""
-    role = user["role"]
-    role_permissions = ROLES.get(role, {})
-    
-    allowed_domains = role_permissions.get("domain_access", [])
-    if "all" in allowed_domains or domain_name in allowed_domains:
-        return True
-        
-    return False
+    return _role_allows(user["role"], "domain_access", domain_name)
 
 def has_memory_access(user: Dict, operation: str) -> bool:
     """Check if user has access to perform an operation on memory."""
-    role = user["role"]
-    role_permissions = ROLES.get(role, {})
-    
-    allowed_operations = role_permissions.get("memory_access", [])
-    if "all" in allowed_operations or operation in allowed_operations:
-        return True
-        
-    return False
+    return _role_allows(user["role"], "memory_access", operation)
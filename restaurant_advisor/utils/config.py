@@ -11,6 +11,28 @@ MONGODB_DATABASE = MONGODB_DB_NAME  # Keep original for backwards compatibility
 MONGODB_COLLECTION = "documents"
 MONGODB_VECTOR_COLLECTION = "vectors"
 
+# Document types each agent's KB searches draw on. init_mongodb.py creates a view of the
+# vectors collection per partition; once each view has its own vector index, enable
+# MONGODB_PARTITIONED_VECTOR_SEARCH so semantic searches scan the partition's smaller index
+KB_PARTITIONS = {
+    "location": ("real_estate", "demographics", "food_consumption"),
+    "regulatory": ("regulation", "food_consumption"),
+    "market": ("food_consumption", "demographics", "real_estate"),
+    "pdf": ("research", "food_consumption", "demographics", "real_estate"),
+}
+KB_PARTITION_VIEWS = {partition: f"{MONGODB_VECTOR_COLLECTION}_{partition}" for partition in KB_PARTITIONS}
+MONGODB_PARTITIONED_VECTOR_SEARCH = os.getenv("MONGODB_PARTITIONED_VECTOR_SEARCH", "false").lower() == "true"
+
+# Wire compression and connection settings shared by the embedding-heavy clients.
+# zstd/snappy are only used when the zstandard/python-snappy packages are installed;
+# otherwise the driver falls back to the next compressor in the list.
+MONGODB_CLIENT_OPTIONS = {
+    "compressors": "zstd,snappy,zlib",
+    "zlibCompressionLevel": -1,
+    "retryWrites": True,
+    "maxPoolSize": 50
+}
+
 # Neo4j configuration
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
@@ -87,5 +109,6 @@ ROLES = {
 
 # System settings
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
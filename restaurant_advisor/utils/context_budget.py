@@ -0,0 +1,43 @@
+"""
+Size limits for the retrieved context placed in agent prompts.
+"""
+
+from itertools import islice
+from typing import Iterable
+
+# Rough characters per token for English text; the Gemini tokenizer is not available
+# locally, so budgets are set in tokens and enforced on characters
+CHARS_PER_TOKEN = 4
+
+# Token budgets for the retrieved context handed to an agent prompt (together they fit an 8k-token window)
+KB_CONTEXT_TOKENS = 6_000
+KG_INSIGHTS_TOKENS = 2_000
+KB_CONTEXT_CHARS = KB_CONTEXT_TOKENS * CHARS_PER_TOKEN
+KG_INSIGHTS_CHARS = KG_INSIGHTS_TOKENS * CHARS_PER_TOKEN
+
+def join_within_budget(parts: Iterable[str], max_parts: int, max_chars: int, sep: str = "\n\n") -> str:
+    """Join up to max_parts strings, stopping before the joined text would exceed max_chars.
+
+    Parts are consumed lazily, so nothing past the budget is built or copied. A first
+    part that alone exceeds the budget is truncated rather than dropped.
+
+    Args:
+        parts: Strings to join, most relevant first
+        max_parts: Maximum number of parts joined
+        max_chars: Maximum length of the joined text
+        sep: Separator placed between parts
+
+    Returns:
+        The joined text
+    """
+    kept = []
+    left = max_chars
+    for part in islice(parts, max_parts):
+        cost = len(part) + (len(sep) if kept else 0)
+        if cost > left:
+            if not kept:
+                kept.append(part[:max_chars])
+            break
+        kept.append(part)
+        left -= cost
+    return sep.join(kept)
@@ -0,0 +1,258 @@
+"""
+Response caching utilities for LLM calls in the restaurant advisor system.
+"""
+
+import asyncio
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from cachetools import TTLCache
+from langchain_core.messages import BaseMessage
+
+from utils.config import EMBEDDING_MODEL
+
+class LLMResponseCache:
+    """Thread-safe exact-match cache of LLM responses keyed by the rendered prompt."""
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        """Initialize the response cache.
+
+        Args:
+            maxsize: Maximum number of cached responses
+            ttl: Time-to-live of a cached response in seconds
+        """
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt_value: Union[str, List[BaseMessage]]) -> str:
+        """Hash a rendered prompt (string or list of messages) into a cache key."""
+        if isinstance(prompt_value, str):
+            text = prompt_value
+        else:
+            text = "\n".join(f"{message.type}: {message.content}" for message in prompt_value)
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached response, or None if missing or expired."""
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a response in the cache."""
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self) -> None:
+        """Drop all cached responses."""
+        with self._lock:
+            self._cache.clear()
+
+
+@lru_cache(maxsize=None)
+def _default_embedder() -> Callable[[str], List[float]]:
+    """Load the EMBEDDING_MODEL encoder once, shared by every semantic cache."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL).encode
+
+
+class SemanticResponseCache:
+    """Embedding-similarity cache that reuses responses for near-duplicate queries."""
+
+    def __init__(self, embed_query: Optional[Callable[[str], List[float]]] = None,
+                 threshold: float = 0.93, maxsize: int = 512):
+        """Initialize the semantic cache.
+
+        Args:
+            embed_query: Function embedding a text; defaults to a lazily loaded
+                SentenceTransformer using EMBEDDING_MODEL, shared between caches
+            threshold: Minimum cosine similarity for a cache hit
+            maxsize: Maximum number of cached responses (oldest are evicted first)
+        """
+        self._embed_query = embed_query
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Tuple[str, Any]] = []  # (namespace, response)
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed and L2-normalize a text."""
+        if self._embed_query is None:
+            self._embed_query = _default_embedder()
+        vector = np.asarray(self._embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, text: str, namespace: str = "") -> Tuple[Optional[Any], np.ndarray]:
+        """Find a cached response for a similar text.
+
+        Returns:
+            Tuple of (cached response or None, query embedding). Pass the embedding
+            to add() on a miss to avoid embedding the text twice.
+        """
+        vector = self.embed(text)
+        with self._lock:
+            if self._vectors is None:
+                return None, vector
+            similarities = self._vectors @ vector
+            for index in np.argsort(similarities)[::-1]:
+                if similarities[index] < self.threshold:
+                    break
+                entry_namespace, response = self._entries[index]
+                if entry_namespace == namespace:
+                    return response, vector
+        return None, vector
+
+    def add(self, vector: np.ndarray, response: Any, namespace: str = "") -> None:
+        """Add a response under the embedding returned by lookup()."""
+        with self._lock:
+            row = vector.reshape(1, -1)
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._entries.append((namespace, response))
+            if len(self._entries) > self.maxsize:
+                self._vectors = self._vectors[1:]
+                self._entries.pop(0)
+
+    def clear(self) -> None:
+        """Drop all cached responses."""
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key into a single call.
+
+    The first caller for a key (the leader) computes the result; callers arriving
+    while it is in flight wait for and share that result instead of recomputing it.
+    Futures are thread-safe, so waiters may be threads or coroutines on any loop.
+    """
+
+    def __init__(self):
+        """Initialize an empty in-flight table."""
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """Join or start the computation for a key.
+
+        Returns:
+            Tuple of (future for the key's result, whether the caller is the leader).
+            The leader must finish the key with resolve() or reject().
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def resolve(self, key: str, result: Any) -> None:
+        """Publish the leader's result to all waiters."""
+        with self._lock:
+            future = self._inflight.pop(key)
+        future.set_result(result)
+
+    def reject(self, key: str, error: BaseException) -> None:
+        """Fail all waiters with the leader's error."""
+        with self._lock:
+            future = self._inflight.pop(key)
+        if not isinstance(error, Exception):
+            # Cancellation of the leader should not cancel or exit the waiters
+            error = RuntimeError("In-flight request was abandoned before completing")
+        future.set_exception(error)
+
+    def do(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Run compute() once per key across concurrent callers."""
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = compute()
+        except BaseException as error:
+            self.reject(key, error)
+            raise
+        self.resolve(key, result)
+        return result
+
+    async def ado(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of do() for coroutine computations."""
+        future, leader = self.claim(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await compute()
+        except BaseException as error:
+            self.reject(key, error)
+            raise
+        self.resolve(key, result)
+        return result
+
+
+class PersistentResultCache:
+    """SQLite-backed cache of slow-changing results, such as external API calls, kept across restarts.
+
+    Each entry has its own time-to-live; expired entries are never returned and are
+    deleted by purge_expired(). Values are pickled, so the file must only be written
+    by this application.
+    """
+
+    def __init__(self, db_path: str = "result_cache.db"):
+        """Open (and if needed create) the cache database.
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # WAL lets processes sharing the file read while another writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL
+                )
+            """)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached result, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a result for ttl seconds."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                (key, blob, time.time() + ttl)
+            )
+
+    def purge_expired(self) -> int:
+        """Delete expired results.
+
+        Returns:
+            Number of results deleted
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,39 @@
+"""
+Logging setup for the restaurant advisor entry points.
+"""
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Send log records through a queue to a background thread that writes them to stderr.
+
+    Request handlers only enqueue a record, so logging an error never waits on
+    console I/O. Safe to call more than once (e.g. on every Streamlit rerun); only
+    the first call installs the handler.
+
+    Args:
+        level: Minimum level of the records logged
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = QueueListener(records, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
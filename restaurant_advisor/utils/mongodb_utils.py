@@ -3,6 +3,7 @@ MongoDB utilities for the restaurant advisor system.
 """
 
 import pymongo
+from pymongo.operations import SearchIndexModel
 from typing import Dict, Any, List, Optional, Union
 
 class MongoDB:
@@ -135,34 +136,37 @@ class MongoDB:
         collection_name: str,
         index_name: str,
         text_field: str,
-        dimensions: int = 1536
+        dimensions: int = 1536,
+        quantization: Optional[str] = None
     ) -> None:
         """Create a vector search index on a collection.
         
         Args:
             collection_name: Name of the collection
             index_name: Name of the index
-            text_field: Field containing text to be embedded
+            text_field: Field holding the embedding vectors
             dimensions: Dimensionality of embeddings
+            quantization: Optional automatic quantization of the indexed vectors,
+                "scalar" (int8) or "binary" (int1), to keep the index memory-resident
         """
         collection = self.db[collection_name]
         
         # Define index with Atlas Vector Search
-        index_definition = {
-            "mappings": {
-                "dynamic": True,
-                "fields": {
-                    text_field: {
-                        "type": "knnVector",
-                        "dimensions": dimensions,
-                        "similarity": "cosine"
-                    }
-                }
-            }
+        vector_field = {
+            "type": "vector",
+            "path": text_field,
+            "numDimensions": dimensions,
+            "similarity": "cosine"
         }
+        if quantization:
+            vector_field["quantization"] = quantization
         
         # Create the index
-        collection.create_search_index(index_name, index_definition)
+        collection.create_search_index(SearchIndexModel(
+            definition={"fields": [vector_field]},
+            name=index_name,
+            type="vectorSearch"
+        ))
         
     def drop_collection(self, collection_name: str) -> None:
         """Drop a collection from the database.
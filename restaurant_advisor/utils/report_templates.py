@@ -0,0 +1,63 @@
+"""
+Templates laying out agents' structured answers as readable Markdown.
+"""
+
+from typing import Any, Dict, List, Optional
+
+# Readable layout of the JSON analysis returned by the market analysis agent
+MARKET_ANALYSIS_TEMPLATE = """# Market Analysis Results
+
+## Market Potential
+Score: {score}/10
+{potential_reasoning}
+
+## Competition Analysis
+Saturation Level: {saturation}
+Major Competitors: {competitors}
+
+Differentiation Opportunities:
+{differentiation}
+
+## Consumer Trends
+Relevant Trends:
+{trends}
+
+Recommendations:
+{recommendations}
+
+## Pricing Strategy
+Recommended Price Point: {price_point}
+{pricing_reasoning}
+
+## Risk Factors
+{risks}
+"""
+
+def bullet_list(items: Optional[List[str]], fallback: str) -> str:
+    """Format items as a Markdown bullet list, or a single fallback bullet when there are none."""
+    if not items:
+        return f"- {fallback}"
+    return "\n".join(f"- {item}" for item in items)
+
+def format_market_analysis(analysis: Dict[str, Any]) -> str:
+    """Lay out a JSON market analysis with MARKET_ANALYSIS_TEMPLATE."""
+    market_potential = analysis.get('market_potential', {})
+    competition = analysis.get('competition_analysis', {})
+    consumer_trends = analysis.get('consumer_trends', {})
+    pricing = analysis.get('pricing_strategy', {})
+    risk_factors = analysis.get('risk_factors')
+    return MARKET_ANALYSIS_TEMPLATE.format(
+        score=market_potential.get('score', 'N/A'),
+        potential_reasoning=market_potential.get('reasoning', 'No data available'),
+        saturation=competition.get('saturation_level', 'N/A'),
+        competitors=', '.join(competition.get('major_competitors', ['None identified'])),
+        differentiation=bullet_list(competition.get('differentiation_opportunities'), 'None identified'),
+        trends=bullet_list(consumer_trends.get('relevant_trends'), 'No trends identified'),
+        recommendations=bullet_list(consumer_trends.get('recommendations'), 'No recommendations available'),
+        price_point=pricing.get('recommended_price_point', 'N/A'),
+        pricing_reasoning=pricing.get('reasoning', 'No reasoning provided'),
+        risks=bullet_list(
+            [f"{item.get('factor', '')}: {item.get('mitigation', '')}" for item in risk_factors or ()],
+            'No risk factors identified: '
+        )
+    )